@@ -0,0 +1,115 @@
+"""order_rollup_deltas
+
+Revision ID: 2c7d5e9b4a13
+Revises: f3b8e1a6c2d7
+Create Date: 2026-10-19 10:05:42.318870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c7d5e9b4a13'
+down_revision: Union[str, None] = 'f3b8e1a6c2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AMOUNTS = ('total', 'new_book_total', 'old_book_total', 'cost_of_good_new', 'cost_of_good_old', 'shipping_charge',
+           'weight_charge')
+
+# apply_order_rollup appending a delta row per change
+APPEND_ROLLUP = '''
+CREATE OR REPLACE FUNCTION apply_order_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.created_at, OLD.total, OLD.new_book_total, OLD.old_book_total, OLD.cost_of_good_new,
+                             OLD.cost_of_good_old, OLD.shipping_charge, OLD.weight_charge)
+                        IS NOT DISTINCT FROM (NEW.created_at, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                                              NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge,
+                                              NEW.weight_charge) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO order_rollup_deltas (bucket, total_order, total, new_book_total, old_book_total, cost_of_good_new,
+                                         cost_of_good_old, shipping_charge, weight_charge)
+        VALUES (date_trunc('hour', OLD.created_at, 'UTC'), -1, -OLD.total::numeric, -OLD.new_book_total::numeric,
+                -OLD.old_book_total::numeric, -OLD.cost_of_good_new::numeric, -OLD.cost_of_good_old::numeric,
+                -OLD.shipping_charge::numeric, -OLD.weight_charge::numeric);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO order_rollup_deltas (bucket, total_order, total, new_book_total, old_book_total, cost_of_good_new,
+                                         cost_of_good_old, shipping_charge, weight_charge)
+        VALUES (date_trunc('hour', NEW.created_at, 'UTC'), 1, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge, NEW.weight_charge);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+
+# apply_order_rollup of 6a2e9f1c4d58, which upserts the row of the hour
+UPSERT_ROLLUP = '''
+CREATE OR REPLACE FUNCTION apply_order_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.created_at, OLD.total, OLD.new_book_total, OLD.old_book_total, OLD.cost_of_good_new,
+                             OLD.cost_of_good_old, OLD.shipping_charge, OLD.weight_charge)
+                        IS NOT DISTINCT FROM (NEW.created_at, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                                              NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge,
+                                              NEW.weight_charge) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE order_rollups SET
+            total_order = total_order - 1,
+            total = total - OLD.total::numeric,
+            new_book_total = new_book_total - OLD.new_book_total::numeric,
+            old_book_total = old_book_total - OLD.old_book_total::numeric,
+            cost_of_good_new = cost_of_good_new - OLD.cost_of_good_new::numeric,
+            cost_of_good_old = cost_of_good_old - OLD.cost_of_good_old::numeric,
+            shipping_charge = shipping_charge - OLD.shipping_charge::numeric,
+            weight_charge = weight_charge - OLD.weight_charge::numeric
+        WHERE bucket = date_trunc('hour', OLD.created_at, 'UTC');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO order_rollups AS r (bucket, total_order, total, new_book_total, old_book_total, cost_of_good_new,
+                                        cost_of_good_old, shipping_charge, weight_charge)
+        VALUES (date_trunc('hour', NEW.created_at, 'UTC'), 1, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge, NEW.weight_charge)
+        ON CONFLICT (bucket) DO UPDATE SET
+            total_order = r.total_order + 1,
+            total = r.total + excluded.total,
+            new_book_total = r.new_book_total + excluded.new_book_total,
+            old_book_total = r.old_book_total + excluded.old_book_total,
+            cost_of_good_new = r.cost_of_good_new + excluded.cost_of_good_new,
+            cost_of_good_old = r.cost_of_good_old + excluded.cost_of_good_old,
+            shipping_charge = r.shipping_charge + excluded.shipping_charge,
+            weight_charge = r.weight_charge + excluded.weight_charge;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+
+
+def upgrade() -> None:
+    op.create_table('order_rollup_deltas',
+                    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+                    sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('total_order', sa.Integer(), nullable=False),
+                    *[sa.Column(name, sa.Numeric(), nullable=False) for name in AMOUNTS],
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.execute(APPEND_ROLLUP)
+
+
+def downgrade() -> None:
+    # Orders are locked until the upserting trigger is back, the deltas are folded in first
+    op.execute('LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(UPSERT_ROLLUP)
+    op.execute('''
+INSERT INTO order_rollups AS r
+SELECT bucket, sum(total_order), {sums} FROM order_rollup_deltas GROUP BY bucket
+ON CONFLICT (bucket) DO UPDATE SET total_order = r.total_order + excluded.total_order, {sets}'''.format(
+        sums=', '.join('sum({})'.format(name) for name in AMOUNTS),
+        sets=', '.join('{0} = r.{0} + excluded.{0}'.format(name) for name in AMOUNTS)))
+    op.drop_table('order_rollup_deltas')
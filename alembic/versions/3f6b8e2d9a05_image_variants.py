@@ -0,0 +1,47 @@
+"""image_variants
+
+Revision ID: 3f6b8e2d9a05
+Revises: e4a9d2c7b1f6
+Create Date: 2026-10-17 19:03:27.518406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6b8e2d9a05'
+down_revision: Union[str, None] = 'e4a9d2c7b1f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# enqueue_image_deletion queueing the variants of deleted images too
+ENQUEUE_IMAGE_DELETION = '''
+CREATE OR REPLACE FUNCTION enqueue_image_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO image_deletions (key)
+    SELECT deleted_images.folder || '/' || file
+    FROM deleted_images, unnest(array_prepend(deleted_images.name, deleted_images.variants)) AS file;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('variants', postgresql.ARRAY(sa.String()),
+                                      server_default='{}', nullable=False))
+    op.execute(ENQUEUE_IMAGE_DELETION)
+
+
+def downgrade() -> None:
+    op.execute('''
+CREATE OR REPLACE FUNCTION enqueue_image_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO image_deletions (key) SELECT folder || '/' || name FROM deleted_images;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql''')
+    op.drop_column('images', 'variants')
@@ -0,0 +1,33 @@
+"""book_keyset_indexes
+
+Revision ID: 5c1e8f3a2b47
+Revises: 997de0cfedb2
+Create Date: 2026-10-17 10:12:44.180334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8f3a2b47'
+down_revision: Union[str, None] = '997de0cfedb2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+sort_fields = ['created_at', 'updated_at', 'name', 'regular_price',
+               'sale_price', 'quantity', 'weight_in_gm', 'cost', 'in_stock']
+
+
+def upgrade() -> None:
+    for field in sort_fields:
+        op.create_index(f'ix_books_{field}_id', 'books', [field, 'id'], unique=False)
+    op.create_index('ix_books_shelf_id', 'books', [sa.text("coalesce(shelf, '')"), 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_shelf_id', table_name='books')
+    for field in reversed(sort_fields):
+        op.drop_index(f'ix_books_{field}_id', table_name='books')
@@ -0,0 +1,58 @@
+"""search_index
+
+Revision ID: 8d4b2f6a9c13
+Revises: 5c1e8f3a2b47
+Create Date: 2026-10-17 14:03:21.518902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4b2f6a9c13'
+down_revision: Union[str, None] = '5c1e8f3a2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+name_tables = ['authors', 'publishers', 'categories']
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.add_column('books', sa.Column('search_text', sa.String(), nullable=True))
+    op.add_column('books', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "to_tsvector('simple', coalesce(search_text, ''))", persisted=True), nullable=True))
+    op.execute('''
+        UPDATE books SET search_text = concat_ws(' ', books.name, replace(books.slug, '-', ' '),
+            (SELECT string_agg(authors.name, ' ') FROM book_author_link
+                JOIN authors ON authors.id = book_author_link.author_id
+                WHERE book_author_link.book_id = books.id),
+            (SELECT publishers.name FROM publishers WHERE publishers.id = books.publisher_id))
+    ''')
+    op.create_index('ix_books_search_vector', 'books', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_books_search_text_trgm', 'books', ['search_text'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+    for table in name_tables:
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+            "to_tsvector('simple', name || ' ' || replace(slug, '-', ' '))", persisted=True), nullable=True))
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], unique=False, postgresql_using='gin')
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    for table in reversed(name_tables):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.drop_column(table, 'search_vector')
+
+    op.drop_index('ix_books_search_text_trgm', table_name='books')
+    op.drop_index('ix_books_search_vector', table_name='books')
+    op.drop_column('books', 'search_vector')
+    op.drop_column('books', 'search_text')
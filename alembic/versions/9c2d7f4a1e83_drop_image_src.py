@@ -0,0 +1,27 @@
+"""drop_image_src
+
+Revision ID: 9c2d7f4a1e83
+Revises: 3f6b8e2d9a05
+Create Date: 2026-10-17 21:14:52.130894
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2d7f4a1e83'
+down_revision: Union[str, None] = '3f6b8e2d9a05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The url is built from folder and name when an image is serialized
+    op.drop_column('images', 'src')
+
+
+def downgrade() -> None:
+    op.add_column('images', sa.Column('src', sa.String(), server_default='', nullable=False))
@@ -0,0 +1,94 @@
+"""inventory_valuation_deltas
+
+Revision ID: 9e4b1d6a7c02
+Revises: 2c7d5e9b4a13
+Create Date: 2026-10-19 14:22:08.591304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b1d6a7c02'
+down_revision: Union[str, None] = '2c7d5e9b4a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('quantity', 'unique_product', 'in_stock', 'out_of_stock', 'cost', 'regular_price', 'sale_price')
+
+# add_inventory_valuation appending a delta row per group
+APPEND_VALUATION = '''
+CREATE OR REPLACE FUNCTION add_inventory_valuation(
+    sign integer, b_id uuid, b_quantity integer, b_in_stock boolean, b_cost float8, b_regular_price float8,
+    b_sale_price float8, b_condition text, b_stock_location text, only_tag uuid DEFAULT NULL) RETURNS void AS $$
+BEGIN
+    INSERT INTO inventory_valuation_deltas (dimension, key, quantity, unique_product, in_stock, out_of_stock, cost,
+                                            regular_price, sale_price)
+    SELECT groups.dimension, groups.key, sign * b_quantity, sign, sign * b_in_stock::integer,
+           sign * (NOT b_in_stock)::integer, sign * b_cost::numeric * b_quantity,
+           sign * b_regular_price::numeric * b_quantity, sign * b_sale_price::numeric * b_quantity
+    FROM (SELECT 'condition', b_condition WHERE only_tag IS NULL
+          UNION ALL SELECT 'stock_location', b_stock_location WHERE only_tag IS NULL
+          UNION ALL SELECT 'tag', link.tag_id::text FROM book_tag_link link WHERE only_tag IS NULL AND link.book_id = b_id
+          UNION ALL SELECT 'tag', only_tag::text WHERE only_tag IS NOT NULL) AS groups (dimension, key);
+END
+$$ LANGUAGE plpgsql'''
+
+# add_inventory_valuation of d81c5b7e3f20, which upserts the groups
+UPSERT_VALUATION = '''
+CREATE OR REPLACE FUNCTION add_inventory_valuation(
+    sign integer, b_id uuid, b_quantity integer, b_in_stock boolean, b_cost float8, b_regular_price float8,
+    b_sale_price float8, b_condition text, b_stock_location text, only_tag uuid DEFAULT NULL) RETURNS void AS $$
+BEGIN
+    INSERT INTO inventory_valuations AS v (dimension, key, quantity, unique_product, in_stock, out_of_stock, cost,
+                                           regular_price, sale_price)
+    SELECT groups.dimension, groups.key, sign * b_quantity, sign, sign * b_in_stock::integer,
+           sign * (NOT b_in_stock)::integer, sign * b_cost::numeric * b_quantity,
+           sign * b_regular_price::numeric * b_quantity, sign * b_sale_price::numeric * b_quantity
+    FROM (SELECT 'condition', b_condition WHERE only_tag IS NULL
+          UNION ALL SELECT 'stock_location', b_stock_location WHERE only_tag IS NULL
+          UNION ALL SELECT 'tag', link.tag_id::text FROM book_tag_link link WHERE only_tag IS NULL AND link.book_id = b_id
+          UNION ALL SELECT 'tag', only_tag::text WHERE only_tag IS NOT NULL) AS groups (dimension, key)
+    ON CONFLICT (dimension, key) DO UPDATE SET
+        quantity = v.quantity + excluded.quantity,
+        unique_product = v.unique_product + excluded.unique_product,
+        in_stock = v.in_stock + excluded.in_stock,
+        out_of_stock = v.out_of_stock + excluded.out_of_stock,
+        cost = v.cost + excluded.cost,
+        regular_price = v.regular_price + excluded.regular_price,
+        sale_price = v.sale_price + excluded.sale_price;
+END
+$$ LANGUAGE plpgsql'''
+
+
+def upgrade() -> None:
+    op.create_table('inventory_valuation_deltas',
+                    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+                    sa.Column('dimension', sa.String(), nullable=False),
+                    sa.Column('key', sa.String(), nullable=False),
+                    sa.Column('quantity', sa.Integer(), nullable=False),
+                    sa.Column('unique_product', sa.Integer(), nullable=False),
+                    sa.Column('in_stock', sa.Integer(), nullable=False),
+                    sa.Column('out_of_stock', sa.Integer(), nullable=False),
+                    sa.Column('cost', sa.Numeric(), nullable=False),
+                    sa.Column('regular_price', sa.Numeric(), nullable=False),
+                    sa.Column('sale_price', sa.Numeric(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.execute(APPEND_VALUATION)
+
+
+def downgrade() -> None:
+    # Books and tag links are locked until the upserting function is back, the deltas are folded in first
+    op.execute('LOCK TABLE books, book_tag_link IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(UPSERT_VALUATION)
+    op.execute('''
+INSERT INTO inventory_valuations AS v
+SELECT dimension, key, {sums} FROM inventory_valuation_deltas GROUP BY dimension, key
+ON CONFLICT (dimension, key) DO UPDATE SET {sets}'''.format(
+        sums=', '.join('sum({})'.format(name) for name in COLUMNS),
+        sets=', '.join('{0} = v.{0} + excluded.{0}'.format(name) for name in COLUMNS)))
+    op.drop_table('inventory_valuation_deltas')
@@ -0,0 +1,57 @@
+"""book_search_keys
+
+Revision ID: b7e3c91d4f25
+Revises: 8d4b2f6a9c13
+Create Date: 2026-10-17 16:41:09.774120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.library import bangla
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c91d4f25'
+down_revision: Union[str, None] = '8d4b2f6a9c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+batch_size = 10000
+
+
+def replace_search_vector(expression: str) -> None:
+    op.drop_index('ix_books_search_vector', table_name='books')
+    op.drop_column('books', 'search_vector')
+    op.add_column('books', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        expression, persisted=True), nullable=True))
+    op.create_index('ix_books_search_vector', 'books', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('search_keys', sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('''
+        SELECT books.id, books.name,
+            (SELECT string_agg(authors.name, ' ') FROM book_author_link
+                JOIN authors ON authors.id = book_author_link.author_id
+                WHERE book_author_link.book_id = books.id),
+            (SELECT publishers.name FROM publishers WHERE publishers.id = books.publisher_id)
+        FROM books
+    ''')).all()
+    update = sa.text('UPDATE books SET search_keys = :search_keys WHERE id = :id')
+    for i in range(0, len(rows), batch_size):
+        conn.execute(update, [{'id': id, 'search_keys': bangla.search_keys(name, authors, publisher)}
+                              for id, name, authors, publisher in rows[i:i + batch_size]])
+
+    # Computed columns can not be altered, the vector is rebuilt with the keys
+    replace_search_vector("to_tsvector('simple', coalesce(search_text, '') || ' ' || coalesce(search_keys, ''))")
+
+
+def downgrade() -> None:
+    replace_search_vector("to_tsvector('simple', coalesce(search_text, ''))")
+    op.drop_column('books', 'search_keys')
@@ -0,0 +1,124 @@
+"""inventory_valuations
+
+Revision ID: d81c5b7e3f20
+Revises: 6a2e9f1c4d58
+Create Date: 2026-10-18 09:27:51.044617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81c5b7e3f20'
+down_revision: Union[str, None] = '6a2e9f1c4d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Pinned here, app.models.inventory holds the current version of the functions
+ADD_INVENTORY_VALUATION = '''
+CREATE OR REPLACE FUNCTION add_inventory_valuation(
+    sign integer, b_id uuid, b_quantity integer, b_in_stock boolean, b_cost float8, b_regular_price float8,
+    b_sale_price float8, b_condition text, b_stock_location text, only_tag uuid DEFAULT NULL) RETURNS void AS $$
+BEGIN
+    INSERT INTO inventory_valuations AS v (dimension, key, quantity, unique_product, in_stock, out_of_stock, cost,
+                                           regular_price, sale_price)
+    SELECT groups.dimension, groups.key, sign * b_quantity, sign, sign * b_in_stock::integer,
+           sign * (NOT b_in_stock)::integer, sign * b_cost::numeric * b_quantity,
+           sign * b_regular_price::numeric * b_quantity, sign * b_sale_price::numeric * b_quantity
+    FROM (SELECT 'condition', b_condition WHERE only_tag IS NULL
+          UNION ALL SELECT 'stock_location', b_stock_location WHERE only_tag IS NULL
+          UNION ALL SELECT 'tag', link.tag_id::text FROM book_tag_link link WHERE only_tag IS NULL AND link.book_id = b_id
+          UNION ALL SELECT 'tag', only_tag::text WHERE only_tag IS NOT NULL) AS groups (dimension, key)
+    ON CONFLICT (dimension, key) DO UPDATE SET
+        quantity = v.quantity + excluded.quantity,
+        unique_product = v.unique_product + excluded.unique_product,
+        in_stock = v.in_stock + excluded.in_stock,
+        out_of_stock = v.out_of_stock + excluded.out_of_stock,
+        cost = v.cost + excluded.cost,
+        regular_price = v.regular_price + excluded.regular_price,
+        sale_price = v.sale_price + excluded.sale_price;
+END
+$$ LANGUAGE plpgsql'''
+APPLY_BOOK_VALUATION = '''
+CREATE OR REPLACE FUNCTION apply_book_valuation() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.quantity, OLD.in_stock, OLD.cost, OLD.regular_price, OLD.sale_price, OLD.condition,
+                             OLD.stock_location)
+                        IS NOT DISTINCT FROM (NEW.quantity, NEW.in_stock, NEW.cost, NEW.regular_price,
+                                              NEW.sale_price, NEW.condition, NEW.stock_location) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM add_inventory_valuation(-1, OLD.id, OLD.quantity, OLD.in_stock, OLD.cost, OLD.regular_price,
+                                        OLD.sale_price, OLD.condition::text, OLD.stock_location::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM add_inventory_valuation(1, NEW.id, NEW.quantity, NEW.in_stock, NEW.cost, NEW.regular_price,
+                                        NEW.sale_price, NEW.condition::text, NEW.stock_location::text);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+BOOK_VALUATION_TRIGGER = '''
+CREATE TRIGGER books_apply_valuation AFTER INSERT OR UPDATE OR DELETE ON books
+FOR EACH ROW EXECUTE FUNCTION apply_book_valuation()'''
+APPLY_TAG_LINK_VALUATION = '''
+CREATE OR REPLACE FUNCTION apply_tag_link_valuation() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM add_inventory_valuation(1, id, quantity, in_stock, cost, regular_price, sale_price, NULL, NULL,
+                                        NEW.tag_id) FROM books WHERE id = NEW.book_id;
+    ELSE
+        PERFORM add_inventory_valuation(-1, id, quantity, in_stock, cost, regular_price, sale_price, NULL, NULL,
+                                        OLD.tag_id) FROM books WHERE id = OLD.book_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+TAG_LINK_VALUATION_TRIGGER = '''
+CREATE TRIGGER book_tag_link_apply_valuation AFTER INSERT OR DELETE ON book_tag_link
+FOR EACH ROW EXECUTE FUNCTION apply_tag_link_valuation()'''
+INVENTORY_VALUATION_DDL = [ADD_INVENTORY_VALUATION, APPLY_BOOK_VALUATION, BOOK_VALUATION_TRIGGER,
+                           APPLY_TAG_LINK_VALUATION, TAG_LINK_VALUATION_TRIGGER]
+
+BOOK_GROUP = '''
+SELECT '{dimension}', {key}::text, sum(quantity), count(*), sum(in_stock::integer), sum((NOT in_stock)::integer),
+       sum(cost::numeric * quantity), sum(regular_price::numeric * quantity), sum(sale_price::numeric * quantity)
+FROM {source} GROUP BY 2'''
+
+
+def upgrade() -> None:
+    op.create_table('inventory_valuations',
+                    sa.Column('dimension', sa.String(), nullable=False),
+                    sa.Column('key', sa.String(), nullable=False),
+                    sa.Column('quantity', sa.Integer(), nullable=False),
+                    sa.Column('unique_product', sa.Integer(), nullable=False),
+                    sa.Column('in_stock', sa.Integer(), nullable=False),
+                    sa.Column('out_of_stock', sa.Integer(), nullable=False),
+                    sa.Column('cost', sa.Numeric(), nullable=False),
+                    sa.Column('regular_price', sa.Numeric(), nullable=False),
+                    sa.Column('sale_price', sa.Numeric(), nullable=False),
+                    sa.PrimaryKeyConstraint('dimension', 'key')
+                    )
+    # Books are locked until the triggers exist, so no change is missed or counted twice
+    op.execute('LOCK TABLE books, book_tag_link IN SHARE ROW EXCLUSIVE MODE')
+    for ddl in INVENTORY_VALUATION_DDL:
+        op.execute(ddl)
+    op.execute('INSERT INTO inventory_valuations' + ' UNION ALL '.join([
+        BOOK_GROUP.format(dimension='condition', key='condition', source='books'),
+        BOOK_GROUP.format(dimension='stock_location', key='stock_location', source='books'),
+        BOOK_GROUP.format(dimension='tag', key='tag_id', source='books JOIN book_tag_link ON book_id = id'),
+    ]))
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS book_tag_link_apply_valuation ON book_tag_link')
+    op.execute('DROP TRIGGER IF EXISTS books_apply_valuation ON books')
+    op.execute('DROP FUNCTION IF EXISTS apply_tag_link_valuation()')
+    op.execute('DROP FUNCTION IF EXISTS apply_book_valuation()')
+    op.execute('DROP FUNCTION IF EXISTS add_inventory_valuation(integer, uuid, integer, boolean, float8, float8, '
+               'float8, text, text, uuid)')
+    op.drop_table('inventory_valuations')
@@ -0,0 +1,56 @@
+"""image_deletions
+
+Revision ID: e4a9d2c7b1f6
+Revises: b7e3c91d4f25
+Create Date: 2026-10-17 18:12:45.302118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9d2c7b1f6'
+down_revision: Union[str, None] = 'b7e3c91d4f25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Pinned here, app.models.image holds the current version of the function
+ENQUEUE_IMAGE_DELETION = '''
+CREATE OR REPLACE FUNCTION enqueue_image_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO image_deletions (key) SELECT folder || '/' || name FROM deleted_images;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+IMAGE_DELETION_TRIGGER = '''
+CREATE TRIGGER images_enqueue_deletion AFTER DELETE ON images
+REFERENCING OLD TABLE AS deleted_images
+FOR EACH STATEMENT EXECUTE FUNCTION enqueue_image_deletion()'''
+
+
+def upgrade() -> None:
+    op.create_table('image_deletions',
+                    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+                    sa.Column('key', sa.String(), nullable=False),
+                    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+                    sa.Column('last_error', sa.String(), nullable=True),
+                    sa.Column('next_attempt_at', sa.DateTime(timezone=True),
+                              server_default=sa.text('now()'), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True),
+                              server_default=sa.text('now()'), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_image_deletions_next_attempt_at'),
+                    'image_deletions', ['next_attempt_at'], unique=False)
+    op.execute(ENQUEUE_IMAGE_DELETION)
+    op.execute(IMAGE_DELETION_TRIGGER)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS images_enqueue_deletion ON images')
+    op.execute('DROP FUNCTION IF EXISTS enqueue_image_deletion()')
+    op.drop_index(op.f('ix_image_deletions_next_attempt_at'), table_name='image_deletions')
+    op.drop_table('image_deletions')
@@ -0,0 +1,43 @@
+"""stock_holds
+
+Revision ID: f3b8e1a6c2d7
+Revises: d81c5b7e3f20
+Create Date: 2026-10-18 14:12:36.508214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8e1a6c2d7'
+down_revision: Union[str, None] = 'd81c5b7e3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('held', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('stock_holds',
+                    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+                    sa.Column('order_id', postgresql.UUID(as_uuid=True), nullable=False),
+                    sa.Column('book_id', postgresql.UUID(as_uuid=True), nullable=False),
+                    sa.Column('quantity', sa.Integer(), nullable=False),
+                    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True),
+                              server_default=sa.text('now()'), nullable=False),
+                    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_stock_holds_order_id'), 'stock_holds', ['order_id'], unique=False)
+    op.create_index(op.f('ix_stock_holds_expires_at'), 'stock_holds', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stock_holds_expires_at'), table_name='stock_holds')
+    op.drop_index(op.f('ix_stock_holds_order_id'), table_name='stock_holds')
+    op.drop_table('stock_holds')
+    op.drop_column('books', 'held')
@@ -7,8 +7,9 @@ import app.pydantic_schema.address as address_schema
 from app.controller.auth import AccessToken, Role
 from app.controller.exception import ForbiddenException
 from app.constant import Country, City
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/address')
+router = APIRouter(prefix='/address', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=address_schema.AddressOut)
@@ -13,10 +13,11 @@ from app.controller.auth import AccessToken, CurrentUser, Role, AdminAccessToken
 from app.controller.redis import get_redis, set_redis
 from app.controller.exception import BadRequestException
 from app.controller.otp import generate_otp
+from app.library.serializer import SerializedRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix='/auth')
+router = APIRouter(prefix='/auth', route_class=SerializedRoute)
 
 
 @router.post("/token", response_model=auth_schema.TokenResponse)
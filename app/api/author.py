@@ -1,25 +1,33 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Query, Response, status
+from fastapi import APIRouter, Query, Request, Response, status
 from fastapi_filter import FilterDepends
 
 import app.controller.author as author_service
+import app.controller.response_cache as response_cache
 import app.pydantic_schema.author as author_schema
-from app.config.database import Session
+from app.config.database import ReadSession, Session
+from app.constant import CountMode
 from app.controller.auth import AccessToken, AdminAccessToken
 from app.filter_schema.author import AuthorFilter
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/author')
+router = APIRouter(prefix='/author', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=author_schema.AuthorOut)
-async def get_author_by_id(id: UUID, db: Session):
+async def get_author_by_id(id: UUID, db: ReadSession):
     return await author_service.get_author_by_id(id, db)
 
 
 @router.get('/slug/{slug}', response_model=author_schema.AuthorOut)
-async def get_author_by_slug(slug: str, db: Session):
-    return await author_service.get_author_by_slug(slug, db)
+async def get_author_by_slug(slug: str, db: ReadSession, request: Request):
+    key = response_cache.cache_key(request)
+    cached, generations = await response_cache.get(key)
+    if cached:
+        return cached
+    author = await author_service.get_author_by_slug(slug, db)
+    return await response_cache.store(key, author, author_schema.AuthorOut, response_cache.entity_tags(author), generations)
 
 
 @router.get('/all', response_model=list[author_schema.AuthorOut])
@@ -27,11 +35,11 @@ async def get_all_authors(*,
                           filter: AuthorFilter = FilterDepends(
                               AuthorFilter),
                           page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100),
-                          db: Session,
+                          db: ReadSession,
                           response: Response):
     authors = await author_service.get_all_authors(filter, page, per_page, db)
 
-    total_result = await author_service.count_author(filter, db)
+    total_result = await author_service.count_author(filter, db, CountMode.cached)
     response.headers['X-Total-Count'] = str(total_result)
     response.headers['X-Total-Pages'] = str(-(-total_result // per_page))
     response.headers['X-Current-Page'] = str(page)
@@ -5,6 +5,7 @@ from fastapi import (
     BackgroundTasks,
     File,
     Query,
+    Request,
     Response,
     UploadFile,
     status,
@@ -12,24 +13,40 @@ from fastapi import (
 from fastapi_filter import FilterDepends
 
 import app.controller.book as book_service
+import app.controller.book_copy as book_copy_service
 import app.controller.csv as csv_service
+import app.controller.response_cache as response_cache
 import app.pydantic_schema.book as schema
-from app.config.database import Session
+from app.config.database import ReadSession, Session
+from app.config.settings import settings
+from app.constant import CountMode, LoadMode
 from app.controller.auth import AdminAccessToken, CurrentAdmin
 from app.controller.exception import BadRequestException
 from app.filter_schema.book import BookFilter
+from app.library.query_stats import query_budget
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/book')
+router = APIRouter(prefix='/book', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=schema.BookOut)
-async def get_book_by_id(id: UUID, db: Session):
-    return await book_service.get_book_by_id(id, db)
+async def get_book_by_id(id: UUID, db: ReadSession, request: Request):
+    key = response_cache.cache_key(request)
+    cached, generations = await response_cache.get(key)
+    if cached:
+        return cached
+    book = await book_service.get_book_by_id(id, db)
+    return await response_cache.store(key, book, schema.BookOut, response_cache.entity_tags(book), generations)
 
 
 @router.get('/public_id/{public_id}', response_model=schema.BookOut)
-async def get_book_by_public_id(public_id: int, db: Session):
-    return await book_service.get_book_by_public_id(public_id, db)
+async def get_book_by_public_id(public_id: int, db: ReadSession, request: Request):
+    key = response_cache.cache_key(request)
+    cached, generations = await response_cache.get(key)
+    if cached:
+        return cached
+    book = await book_service.get_book_by_public_id(public_id, db)
+    return await response_cache.store(key, book, schema.BookOut, response_cache.entity_tags(book), generations)
 
 
 @router.get('/admin/public_id/{public_id}', response_model=schema.BookOutAdmin)
@@ -38,19 +55,42 @@ async def get_book_by_admin_with_public_id(public_id: int, _: AdminAccessToken,
 
 
 @router.get('/all', response_model=list[schema.BookOut])
+@query_budget(3)  # Books in one projection query, the estimated count falls back to an exact one
 async def get_all_books(*,
                         page: int = Query(1, ge=1),
                         per_page: int = Query(10, ge=1, le=100),
+                        cursor: str | None = Query(
+                            None, description='Opt-in cursor pagination. Pass empty for the first page, then X-Next-Cursor'),
                         filter: BookFilter = FilterDepends(BookFilter),
-                        db: Session,
+                        db: ReadSession,
+                        request: Request,
                         response: Response):
-    books, count = await book_service.get_all_books(filter, page, per_page, db)
+    key = generations = None
+    if cursor is None and page <= settings.RESPONSE_CACHE_PAGES:
+        key = response_cache.cache_key(request)
+        cached, generations = await response_cache.get(key)
+        if cached:
+            return cached
+
+    if cursor is not None:
+        books, count, next_cursor = await book_service.get_all_books_by_cursor(
+            filter, cursor, per_page, db, CountMode.estimate, LoadMode.projection)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+    else:
+        books, count = await book_service.get_all_books(filter, page, per_page, db, CountMode.estimate, LoadMode.projection)
 
     response.headers['X-Total-Count'] = str(count)
     response.headers['X-Total-Pages'] = str(-(-count // per_page))
     response.headers['X-Current-Page'] = str(page)
     response.headers['X-Per-Page'] = str(per_page)
 
+    if key:
+        # 'books' purges the page when any book is written, a new book may belong to it
+        tags = {'books'}.union(*(response_cache.model_tags(book, 'books', book_service.projection_relations)
+                                 for book in books))
+        headers = {name: response.headers[name] for name in ('X-Total-Count', 'X-Total-Pages', 'X-Current-Page', 'X-Per-Page')}
+        return await response_cache.store(key, books, list[schema.BookOut], tags, generations, headers)
     return books
 
 
@@ -58,12 +98,19 @@ async def get_all_books(*,
 async def get_all_books_by_admin(*,
                                  page: int = Query(1, ge=1),
                                  per_page: int = Query(10, ge=1, le=100),
+                                 cursor: str | None = Query(
+                                     None, description='Opt-in cursor pagination. Pass empty for the first page, then X-Next-Cursor'),
                                  filter: BookFilter = FilterDepends(
                                      BookFilter),
                                  _: AdminAccessToken,
                                  db: Session,
                                  response: Response):
-    books, count = await book_service.get_all_books(filter, page, per_page, db)
+    if cursor is not None:
+        books, count, next_cursor = await book_service.get_all_books_by_cursor(filter, cursor, per_page, db, CountMode.cached)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+    else:
+        books, count = await book_service.get_all_books(filter, page, per_page, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(count)
     response.headers['X-Total-Pages'] = str(-(-count // per_page))
@@ -83,6 +130,13 @@ async def create_book_bulk(payload: list[schema.CreateBook], _: AdminAccessToken
     return await book_service.create_book_bulk([p.model_dump() for p in payload], db)
 
 
+@router.post('/bulk/copy', response_model=schema.BulkBookResult, status_code=status.HTTP_201_CREATED,
+             description='Newline delimited CreateBook json, streamed into postgres with COPY',
+             openapi_extra={'requestBody': {'required': True, 'content': {'application/x-ndjson': {'schema': {'type': 'string'}}}}})
+async def copy_book_bulk(request: Request, _: AdminAccessToken, db: Session):
+    return await book_copy_service.copy_books(request.stream(), db)
+
+
 @router.patch('/{id}', response_model=schema.BookOutAdmin)
 async def update_book(id: UUID, payload: schema.UpdateBook, _: AdminAccessToken, db: Session):
     return await book_service.update_book(id, payload.model_dump(exclude_unset=True), db)
@@ -110,7 +164,7 @@ async def export_books_to_csv(*,
                                   None, description='Comma separated list of columns to include in the CSV'),
                               filter: BookFilter = FilterDepends(BookFilter),
                               _: AdminAccessToken,
-                              db: Session):
+                              db: ReadSession):
     response, count = await csv_service.export_books_to_csv(filter, page, per_page, db, columns)
 
     response.headers['X-Total-Count'] = str(count)
@@ -6,9 +6,10 @@ from app.config.database import Session
 import app.controller.cart as cart_service
 import app.controller.coupon as coupon_service
 from app.controller.auth import AccessTokenOptional
+from app.library.serializer import SerializedRoute
 
 
-router = APIRouter(prefix='/cart')
+router = APIRouter(prefix='/cart', route_class=SerializedRoute)
 
 
 @router.post('/apply-coupon', response_model=schema.ApplyCouponResponse)
@@ -1,33 +1,41 @@
-from fastapi import APIRouter, status, Query, Response
+from fastapi import APIRouter, status, Query, Request, Response
 from uuid import UUID
 from fastapi_filter import FilterDepends
 
 from app.filter_schema.category import CategoryFilter
-from app.config.database import Session
+from app.config.database import ReadSession, Session
+from app.constant import CountMode
 import app.controller.category as category_service
+import app.controller.response_cache as response_cache
 import app.pydantic_schema.category as category_schema
 from app.controller.auth import AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/category')
+router = APIRouter(prefix='/category', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=category_schema.CategoryOut)
-async def get_category_by_id(id: UUID, db: Session):
+async def get_category_by_id(id: UUID, db: ReadSession):
     return await category_service.get_category_by_id(id, db)
 
 
 @router.get('/slug/{slug}', response_model=category_schema.CategoryOut)
-async def get_category_by_slug(slug: str, db: Session):
-    return await category_service.get_category_by_slug(slug, db)
+async def get_category_by_slug(slug: str, db: ReadSession, request: Request):
+    key = response_cache.cache_key(request)
+    cached, generations = await response_cache.get(key)
+    if cached:
+        return cached
+    category = await category_service.get_category_by_slug(slug, db)
+    return await response_cache.store(key, category, category_schema.CategoryOut, response_cache.entity_tags(category), generations)
 
 
 @router.get('/all', response_model=list[category_schema.CategoryOut])
 async def get_all_categories(*,
                              filter: CategoryFilter = FilterDepends(
                                  CategoryFilter),
-                             page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100), db: Session,  response: Response):
+                             page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100), db: ReadSession,  response: Response):
     categories = await category_service.get_all_categories(filter, page, per_page, db)
-    total_categories = await category_service.count_category(filter, db)
+    total_categories = await category_service.count_category(filter, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(total_categories)
     response.headers['X-Total-Pages'] = str(-(-total_categories // per_page))
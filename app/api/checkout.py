@@ -4,8 +4,9 @@ import app.pydantic_schema.checkout as schema
 from app.config.database import Session
 import app.controller.checkout as service
 from app.controller.auth import AccessTokenOptional
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/checkout')
+router = APIRouter(prefix='/checkout', route_class=SerializedRoute)
 
 
 @router.post('/summary', response_model=schema.CheckoutSummary)
@@ -4,11 +4,13 @@ from fastapi_filter import FilterDepends
 
 from app.filter_schema.coupon import CouponFilter
 from app.config.database import Session
+from app.constant import CountMode
 import app.controller.coupon as coupon_service
 import app.pydantic_schema.coupon as coupon_schema
 from app.controller.auth import AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/coupon')
+router = APIRouter(prefix='/coupon', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=coupon_schema.CouponOut)
@@ -23,7 +25,7 @@ async def get_all_coupons(*, page: int = Query(1, ge=1),
                           _: AdminAccessToken,
                           db: Session,  response: Response):
     coupons = await coupon_service.get_all_coupons(filter, page, per_page, db)
-    total_coupons = await coupon_service.count_coupon(filter, db)
+    total_coupons = await coupon_service.count_coupon(filter, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(total_coupons)
     response.headers['X-Total-Pages'] = str(-(-total_coupons // per_page))
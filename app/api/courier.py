@@ -7,8 +7,9 @@ from app.controller.auth import AdminAccessToken
 import app.controller.courier as courier_service
 import app.pydantic_schema.courier as courier_schema
 from app.filter_schema.courier import CourierFilter
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/courier')
+router = APIRouter(prefix='/courier', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=courier_schema.CourierOut)
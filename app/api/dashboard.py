@@ -4,20 +4,48 @@ from fastapi import APIRouter
 
 import app.controller.dashboard as service
 import app.pydantic_schema.dashboard as schema
-from app.config.database import Session
+from app.config.database import ReadSession, Session, pool_stats
+from app.constant import Granularity, InventoryDimension
+from app.controller import inventory_valuation
 from app.controller.auth import AdminAccessToken
+from app.library import query_stats
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/dashboard')
+router = APIRouter(prefix='/dashboard', route_class=SerializedRoute)
 
 
-@router.get('/order', response_model=schema.OrderAnalysis)
+@router.get('/order', response_model=schema.OrderAnalysis, response_model_exclude_none=True)
 async def get_order_analysis(*, from_date: datetime | None = None,
                              to_date: datetime | None = None,
+                             granularity: Granularity | None = None,
                              _: AdminAccessToken,
-                             db: Session) -> dict:
-    return await service.order_analysis(from_date, to_date, db)
+                             db: ReadSession) -> dict:
+    return await service.order_analysis(from_date, to_date, db, granularity)
 
 
 @router.get('/inventory', response_model=list[schema.ProductGroup])
-async def get_inventory_analysis(*, _: AdminAccessToken, db: Session) -> list[dict]:
+async def get_inventory_analysis(*, _: AdminAccessToken, db: ReadSession) -> list[dict]:
     return await service.inventory_analysis(db)
+
+
+@router.get('/inventory/{dimension}', response_model=list[schema.InventoryGroup])
+async def get_inventory_groups(*, dimension: InventoryDimension, _: AdminAccessToken, db: ReadSession) -> list[dict]:
+    return await service.inventory_groups(dimension, db)
+
+
+@router.post('/inventory/reconcile', response_model=list[schema.InventoryDifference])
+async def reconcile_inventory(*, _: AdminAccessToken, db: Session) -> list[dict]:
+    # Differences found and repaired, the worker runs it every INVENTORY_RECONCILE_INTERVAL
+    return await inventory_valuation.reconcile(db)
+
+
+@router.get('/db-pool')
+async def get_db_pool_stats(_: AdminAccessToken) -> dict:
+    # Stats of the worker process serving the request
+    return pool_stats()
+
+
+@router.get('/query-stats')
+async def get_query_stats(_: AdminAccessToken) -> dict:
+    # Statements, SQL time and duration per route of the worker process serving the request
+    return query_stats.snapshot()
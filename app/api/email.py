@@ -3,8 +3,9 @@ from fastapi import APIRouter
 import app.controller.email as service
 from app.config.database import Session
 from app.controller.auth import AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/email')
+router = APIRouter(prefix='/email', route_class=SerializedRoute)
 
 
 @router.get('/test/invoice')
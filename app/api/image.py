@@ -3,11 +3,13 @@ from uuid import UUID
 
 from app.config.database import Session
 import app.controller.image as image_service
+import app.controller.image_deletion as image_deletion
 import app.library.s3 as s3
 import app.pydantic_schema.image as image_schema
 from app.controller.auth import AdminAccessToken, AccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/image')
+router = APIRouter(prefix='/image', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=image_schema.ImageOut)
@@ -72,6 +74,11 @@ async def customer_img_uploader(*, files: list[UploadFile] = File(...),
     )
 
 
+@router.get('/deletions')
+async def get_image_deletion_stats(_: AdminAccessToken, db: Session):
+    return await image_deletion.queue_stats(db)
+
+
 @router.delete('/{id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_image(id: UUID, _: AdminAccessToken, db: Session):
     await image_service.delete_image(id, db)
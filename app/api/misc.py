@@ -2,9 +2,10 @@ from fastapi import APIRouter, BackgroundTasks
 
 import app.controller.misc as service
 import app.pydantic_schema.misc as schema
+from app.library.serializer import SerializedRoute
 
 # This is miscellanous API router
-router = APIRouter(prefix='/misc')
+router = APIRouter(prefix='/misc', route_class=SerializedRoute)
 
 
 @router.post('/contact-us')
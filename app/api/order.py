@@ -9,18 +9,24 @@ from app.controller.exception import BadRequestException
 from app.controller.auth import AccessToken, AdminAccessToken, AccessTokenOptional, CurrentAdmin
 import app.pydantic_schema.order as schema
 from app.config.database import Session
+from app.config.settings import settings
+from app.constant import CountMode
 import app.controller.order as order_service
 import app.controller.email as email_service
 import app.controller.redis as redis_service
 import app.controller.payment as payment_service
 import app.controller.utility as utility_service
+import app.controller.stock as stock_service
+from app.library.query_stats import query_budget
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/order')
+router = APIRouter(prefix='/order', route_class=SerializedRoute)
 
 logger = logging.getLogger(__name__)
 
 
 @router.get('/id/{id}', response_model=schema.OrderOut)
+@query_budget(10)
 async def get_order_by_id(id: UUID, token: AccessToken, db: Session):
     order = await order_service.get_order_by_id(id, db)
     if order.customer_id != token['id']:
@@ -70,7 +76,7 @@ async def get_all_orders_by_admin(*,
                                   _: AdminAccessToken,
                                   db: Session,
                                   response: Response):
-    orders, total_orders = await order_service.get_all_orders(filter, page, per_page, db)
+    orders, total_orders = await order_service.get_all_orders(filter, page, per_page, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(total_orders)
     response.headers['X-Total-Pages'] = str(-(-total_orders // per_page))
@@ -88,20 +94,31 @@ async def create_order(payload: schema.CreateOrder, token: AccessTokenOptional,
     order = await order_service.create_order(req_payload, db, commit=False)
 
     # Payment
-    EXPIRE_SEC = 10 * 60
     MIN_AMOUNT = 100
     if req_payload['payment_method'] == 'bkash':
+        # The stock is held until the payment callback, released when the hold expires.
+        # The dry run order is detached first, committing the holds must not save it
+        db.expunge_all()
+        await stock_service.hold(order.id, {item.book_id: item.quantity for item in order.order_items}, db)
+        await db.commit()
+        req_payload['order_id'] = order.id
+
         callback_url = str(request.url_for('pay_with_bkash_callback'))
-        payment = await payment_service.initiate_bkash_payment(
-            order.id,
-            int(order.net_amount if order.is_full_paid else MIN_AMOUNT),
-            order.address.name if order.address else str(order.id),
-            callback_url
-        )
+        try:
+            payment = await payment_service.initiate_bkash_payment(
+                order.id,
+                int(order.net_amount if order.is_full_paid else MIN_AMOUNT),
+                order.address.name if order.address else str(order.id),
+                callback_url
+            )
+        except Exception:
+            await stock_service.release(order.id, db)
+            await db.commit()
+            raise
 
         await redis_service.set_redis(request, payment['payment_id'], json.dumps(
             utility_service.convert_uuid_to_str(req_payload)
-        ), EXPIRE_SEC)
+        ), settings.STOCK_HOLD_TTL)
         return {"payment_url": payment['payment_url']}
     else:
         raise BadRequestException('Invalid payment method')
@@ -119,6 +136,7 @@ async def create_order_by_admin(payload: schema.CreateOrderAdmin, _: AdminAccess
 
 
 @router.patch('/{id}', response_model=schema.OrderOutAdmin)
+@query_budget(30)  # An item change of an order with a coupon loads the coupon with its rules
 async def update_order(id: UUID, payload: schema.UpdateOrderAdmin, admin: CurrentAdmin, db: Session):
     logger.info("{} is updating order {}".format(admin, id))
     # logger.info("Payload: {}".format(payload))
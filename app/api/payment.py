@@ -6,8 +6,9 @@ from fastapi.responses import RedirectResponse
 import app.controller.payment as service
 from app.config.database import Session
 from app.config.settings import settings
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/payment')
+router = APIRouter(prefix='/payment', route_class=SerializedRoute)
 logger = logging.getLogger(__name__)
 
 
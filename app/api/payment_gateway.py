@@ -7,8 +7,9 @@ from app.controller.auth import AdminAccessToken
 import app.controller.payment_gateway as service
 import app.pydantic_schema.payment_gateway as schema
 from app.filter_schema.payment_gateway import PaymentGatewayFilter
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/payment_gateway')
+router = APIRouter(prefix='/payment_gateway', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=schema.PaymentGatewayOut)
@@ -3,21 +3,23 @@ from uuid import UUID
 from fastapi_filter import FilterDepends
 
 from app.filter_schema.publisher import PublisherFilter
-from app.config.database import Session
+from app.config.database import ReadSession, Session
+from app.constant import CountMode
 import app.controller.publisher as publisher_service
 import app.pydantic_schema.publisher as publisher_schema
 from app.controller.auth import AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/publisher')
+router = APIRouter(prefix='/publisher', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=publisher_schema.PublisherOut)
-async def get_publisher_by_id(id: UUID, db: Session):
+async def get_publisher_by_id(id: UUID, db: ReadSession):
     return await publisher_service.get_publisher_by_id(id, db)
 
 
 @router.get('/slug/{slug}', response_model=publisher_schema.PublisherOut)
-async def get_publisher_by_slug(slug: str, db: Session):
+async def get_publisher_by_slug(slug: str, db: ReadSession):
     return await publisher_service.get_publisher_by_slug(slug, db)
 
 
@@ -25,9 +27,9 @@ async def get_publisher_by_slug(slug: str, db: Session):
 async def get_all_publishers(*,
                              filter: PublisherFilter = FilterDepends(
                                  PublisherFilter),
-                             page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100), db: Session,  response: Response):
+                             page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100), db: ReadSession,  response: Response):
     publishers = await publisher_service.get_all_publishers(filter, page, per_page, db)
-    total_publishers = await publisher_service.count_publisher(filter, db)
+    total_publishers = await publisher_service.count_publisher(filter, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(total_publishers)
     response.headers['X-Total-Pages'] = str(-(-total_publishers // per_page))
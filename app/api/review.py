@@ -8,10 +8,11 @@ from app.config.database import Session
 from app.controller.auth import AccessToken, AdminAccessToken
 import app.controller.review as review_service
 import app.pydantic_schema.review as schema
+from app.library.serializer import SerializedRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix='/review')
+router = APIRouter(prefix='/review', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=schema.ReviewOut)
@@ -1,10 +1,17 @@
+from secrets import compare_digest
+
 from pydantic import BaseModel
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Response
 
 from app.pydantic_schema.user import UserOut
+from app.config.database import Session
+from app.config.settings import settings
 from app.controller.auth import CurrentUser
+from app.controller.exception import UnauthorizedException
+import app.controller.metrics as metrics_service
+from app.library.serializer import SerializedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=SerializedRoute)
 
 class SayHello(BaseModel):
     msg: str
@@ -17,6 +24,13 @@ async def say_hello():
 async def who_am_i(user: CurrentUser):
     return user
 
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics(db: Session, authorization: str | None = Header(None)):
+    # Prometheus scrape of every gunicorn worker, whichever worker serves it
+    if not settings.METRICS_TOKEN or not compare_digest(authorization or '', 'Bearer {}'.format(settings.METRICS_TOKEN)):
+        raise UnauthorizedException('Invalid metrics token')
+    return Response(await metrics_service.exposition(db), media_type=metrics_service.CONTENT_TYPE)
+
 # @router.post('/set-to-redis')
 # async def set_to_redis(msg: str, request: Request):
 #     await request.app.state.redis.set('msg', msg)
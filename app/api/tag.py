@@ -2,17 +2,19 @@ from fastapi import APIRouter, status, Query, Response
 from uuid import UUID
 from fastapi_filter import FilterDepends
 
-from app.config.database import Session
+from app.config.database import ReadSession, Session
+from app.constant import CountMode
 import app.controller.tag as tag_service
 import app.pydantic_schema.tag as tag_schema
 from app.filter_schema.tag import TagFilter
 from app.controller.auth import AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/tag')
+router = APIRouter(prefix='/tag', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=tag_schema.TagOut)
-async def get_tag_by_id(id: UUID, db: Session):
+async def get_tag_by_id(id: UUID, db: ReadSession):
     return await tag_service.get_tag_by_id(id, db)
 
 
@@ -21,9 +23,9 @@ async def get_all_tags(*,
                        filter: TagFilter = FilterDepends(TagFilter),
                        page: int = Query(1, ge=1),
                        per_page: int = Query(10, ge=1, le=100),
-                       db: Session,  response: Response):
+                       db: ReadSession,  response: Response):
     tags = await tag_service.get_all_tags(filter, page, per_page, db)
-    total_tags = await tag_service.count_tag(filter, db)
+    total_tags = await tag_service.count_tag(filter, db, CountMode.cached)
 
     response.headers['X-Total-Count'] = str(total_tags)
     response.headers['X-Total-Pages'] = str(-(-total_tags // per_page))
@@ -7,8 +7,9 @@ from app.config.database import Session
 import app.controller.transaction as service
 import app.pydantic_schema.transaction as schema
 from app.controller.auth import AdminAccessToken, AccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/transaction')
+router = APIRouter(prefix='/transaction', route_class=SerializedRoute)
 
 
 @router.get('/id/{id}', response_model=schema.TransactionOut)
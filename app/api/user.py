@@ -7,8 +7,9 @@ from app.config.database import Session
 import app.controller.user as user_service
 import app.pydantic_schema.user as user_schema
 from app.controller.auth import CurrentUser, AdminAccessToken
+from app.library.serializer import SerializedRoute
 
-router = APIRouter(prefix='/user')
+router = APIRouter(prefix='/user', route_class=SerializedRoute)
 
 
 @router.get('/me', response_model=user_schema.UserOut)
@@ -0,0 +1,132 @@
+"""Compares the legacy outer-join + DISTINCT ON book listing query with the EXISTS based query builder.
+
+Seed the catalog first (python seed.py seeds 500k books), then run:
+    python -m app.benchmark.book_query [--runs 5] [--plans]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from app.config.settings import settings
+from app.controller.book import apply_filter, query_selectinload
+from app.filter_schema.book import (
+    AuthorFilter,
+    BookFilter,
+    CategoryFilter,
+    PublisherFilter,
+    TagFilter,
+)
+from app.models import Author, Book, Category, Publisher, Tag
+
+
+def legacy_query(filter: BookFilter, page: int, per_page: int):
+    filter = filter.model_copy()
+    query = select(Book,
+                   Author.id, Author.name, Author.slug,
+                   Category.id, Category.name, Category.slug,
+                   Publisher.id, Publisher.name, Publisher.slug,
+                   Tag.id, Tag.name, Tag.slug
+                   ).outerjoin(Book.authors).outerjoin(Book.categories).outerjoin(Book.publisher).outerjoin(Book.tags)
+    filter.pop('q')
+    query = filter.filter(query)
+    query = query.distinct(Book.id)
+    subquery = query.subquery()
+
+    stmt = query_selectinload.join(subquery, Book.id == subquery.c.id)
+    stmt = filter.sort(stmt).offset((page - 1) * per_page).limit(per_page)
+    return stmt, select(func.count()).select_from(subquery)
+
+
+def exists_query(filter: BookFilter, page: int, per_page: int):
+    stmt = filter.sort(apply_filter(filter, query_selectinload))
+    stmt = stmt.offset((page - 1) * per_page).limit(per_page)
+    return stmt, apply_filter(filter, select(func.count(Book.id)))
+
+
+def book_filter(**kwargs) -> BookFilter:
+    return BookFilter(q=None,
+                      author=kwargs.pop('author', AuthorFilter()),
+                      category=kwargs.pop('category', CategoryFilter()),
+                      publisher=kwargs.pop('publisher', PublisherFilter()),
+                      tag=kwargs.pop('tag', TagFilter()),
+                      **kwargs)
+
+
+async def scenarios(conn: AsyncConnection) -> dict[str, BookFilter]:
+    author = await conn.scalar(select(Author.slug).limit(1))
+    category = await conn.scalar(select(Category.slug).limit(1))
+    tag = await conn.scalar(select(Tag.slug).limit(1))
+    publisher = await conn.scalar(select(Publisher.slug).limit(1))
+
+    return {
+        'no filter': book_filter(),
+        'is_used, -created_at': book_filter(is_used=True, order_by=['-created_at']),
+        'author slug': book_filter(author=AuthorFilter(slug__in=[author])),
+        'category + tag slug': book_filter(category=CategoryFilter(slug__in=[category]),
+                                           tag=TagFilter(slug__in=[tag])),
+        'publisher slug, sale_price': book_filter(publisher=PublisherFilter(slug__in=[publisher]),
+                                                  order_by=['sale_price']),
+    }
+
+
+async def explain(conn: AsyncConnection, stmt) -> dict:
+    sql = stmt.compile(dialect=conn.dialect,
+                       compile_kwargs={'literal_binds': True})
+    result = await conn.execute(text(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}'))
+    plan = result.scalar_one()
+    return plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+
+
+async def timed(conn: AsyncConnection, stmt, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        (await conn.execute(stmt)).all()
+        durations.append(time.perf_counter() - st)
+    return statistics.median(durations) * 1000
+
+
+async def run(runs: int, pages: list[int], per_page: int, show_plans: bool):
+    engine = create_async_engine(settings.DATABASE_URL)
+    async with engine.connect() as conn:
+        total = await conn.scalar(select(func.count(Book.id)))
+        print(f'Books in table: {total}, runs per query: {runs}\n')
+        print('{:<30} {:>6} {:>14} {:>14} {:>14} {:>14}'.format(
+            'scenario', 'page', 'legacy ms', 'exists ms', 'legacy count', 'exists count'))
+
+        for name, filter in (await scenarios(conn)).items():
+            for page in pages:
+                row = []
+                for builder in (legacy_query, exists_query):
+                    stmt, _ = builder(filter, page, per_page)
+                    row.append(await timed(conn, stmt, runs))
+                for builder in (legacy_query, exists_query):
+                    _, count_stmt = builder(filter, page, per_page)
+                    row.append(await timed(conn, count_stmt, runs))
+                print('{:<30} {:>6} {:>14.1f} {:>14.1f} {:>14.1f} {:>14.1f}'.format(
+                    name, page, *row))
+
+                if show_plans:
+                    for builder in (legacy_query, exists_query):
+                        stmt, _ = builder(filter, page, per_page)
+                        plan = await explain(conn, stmt)
+                        print('  {}: planning {:.1f} ms, execution {:.1f} ms, top node {}'.format(
+                            builder.__name__, plan['Planning Time'], plan['Execution Time'],
+                            plan['Plan']['Node Type']))
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000])
+    parser.add_argument('--plans', action='store_true',
+                        help='Print EXPLAIN ANALYZE summary for every query')
+    args = parser.parse_args()
+    asyncio.run(run(args.runs, args.pages, args.per_page, args.plans))
@@ -0,0 +1,124 @@
+"""Coupon eligibility of a cart with the legacy per item evaluation (lazy loads of the publisher, authors,
+categories and tags of every book per rule) and app.controller.coupon_engine (rules compiled into id sets,
+relation ids of the cart loaded in one query).
+
+Builds carts from the books of DATABASE_URL (python seed.py) and a coupon with include and exclude rules
+taken from them, nothing is written:
+    python -m app.benchmark.coupon_engine [--items 50] [--runs 30]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.constant import Condition, DiscountType
+from app.controller import coupon_engine
+from app.models import Author, Book, Category, Coupon, OrderItem, Publisher, Tag
+
+
+async def legacy(coupon: Coupon, items: list[OrderItem]) -> list[OrderItem]:
+    # The rules of order.apply_coupon before the engine, an item is dropped at its first failing rule
+    eligible = []
+    for item in items:
+        book = item.book
+        if coupon.include_conditions and book.condition not in coupon.include_conditions:
+            continue
+        if coupon.include_books and book not in coupon.include_books:
+            continue
+        if coupon.include_publishers and (await book.awaitable_attrs.publisher) not in coupon.include_publishers:
+            continue
+        if coupon.include_authors and not any(author in coupon.include_authors for author in (await book.awaitable_attrs.authors)):
+            continue
+        if coupon.include_categories and not any(category in coupon.include_categories for category in (await book.awaitable_attrs.categories)):
+            continue
+        if coupon.include_tags and not any(tag in coupon.include_tags for tag in (await book.awaitable_attrs.tags)):
+            continue
+        if book in coupon.exclude_books:
+            continue
+        if coupon.exclude_publishers and (await book.awaitable_attrs.publisher) in coupon.exclude_publishers:
+            continue
+        if coupon.exclude_authors and any(author in coupon.exclude_authors for author in (await book.awaitable_attrs.authors)):
+            continue
+        if coupon.exclude_categories and any(category in coupon.exclude_categories for category in (await book.awaitable_attrs.categories)):
+            continue
+        if coupon.exclude_tags and any(tag in coupon.exclude_tags for tag in (await book.awaitable_attrs.tags)):
+            continue
+        eligible.append(item)
+    return eligible
+
+
+async def engine_path(coupon: Coupon, items: list[OrderItem], db: AsyncSession) -> list[OrderItem]:
+    return await coupon_engine.eligible_items(coupon_engine.compile_coupon(coupon), items, db)
+
+
+async def cart(book_ids: list, db: AsyncSession) -> list[OrderItem]:
+    # Books are loaded like cart.apply_coupon loads them, without relations
+    books = {book.id: book for book in await db.scalars(select(Book).where(Book.id.in_(book_ids)))}
+    return [OrderItem(book=books[id], regular_price=books[id].regular_price, sold_price=books[id].sale_price,
+                      quantity=1) for id in book_ids]
+
+
+async def make_coupon(rules: dict, db: AsyncSession) -> Coupon:
+    # Loaded by the session of the cart like app.controller.coupon.query, the legacy rules compare entities
+    values = {name: list(await db.scalars(select(model).where(model.id.in_(ids)))) for name, (model, ids) in rules.items()}
+    return Coupon(code='BENCH', discount_type=DiscountType.percentage, include_conditions=list(Condition),
+                  exclude_couriers=[], **values)
+
+
+async def run(count: int, runs: int):
+    engine = create_async_engine(settings.DATABASE_URL)
+    statements = [0]
+    event.listen(engine.sync_engine, 'before_cursor_execute', lambda *args: statements.__setitem__(0, statements[0] + 1))
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async with factory() as db:
+        books = (await db.scalars(select(Book).options(
+            selectinload(Book.publisher), selectinload(Book.authors), selectinload(Book.categories),
+            selectinload(Book.tags)).limit(count))).all()
+    if len(books) < count:
+        print('Need {} books, found {}. Seed the database first.'.format(count, len(books)))
+        return
+    # Rules on every relation, about half of the cart stays eligible
+    rules = {
+        'include_categories': (Category, {c.id for book in books for c in book.categories}),
+        'exclude_books': (Book, {book.id for book in books[:count // 10]}),
+        'exclude_publishers': (Publisher, {book.publisher_id for book in books[count // 10:count // 5] if book.publisher_id}),
+        'exclude_authors': (Author, {a.id for book in books[count // 5:count // 3] for a in book.authors}),
+        'exclude_tags': (Tag, {t.id for book in books[count // 3:count // 2] for t in book.tags}),
+    }
+    book_ids = [book.id for book in books]
+
+    results = {}
+    print(f'{count} item cart, {runs} runs\n')
+    print('{:<8} {:>8} {:>10} {:>10} {:>8}'.format('path', 'eligible', 'p50 ms', 'p95 ms', 'queries'))
+    for name in ('legacy', 'engine'):
+        durations = []
+        for _ in range(runs):
+            # A new session per run, the identity map would keep the relations loaded by the previous run
+            async with factory() as db:
+                items = await cart(book_ids, db)
+                coupon = await make_coupon(rules, db)
+                statements[0] = 0
+                st = time.perf_counter()
+                eligible = await (legacy(coupon, items) if name == 'legacy' else engine_path(coupon, items, db))
+                durations.append((time.perf_counter() - st) * 1000)
+                queries = statements[0]
+        durations.sort()
+        results[name] = sorted(item.book.id for item in eligible)
+        print('{:<8} {:>8} {:>10.2f} {:>10.2f} {:>8}'.format(
+            name, len(eligible), statistics.median(durations), durations[int(len(durations) * 0.95)], queries))
+    assert results['legacy'] == results['engine'], 'eligible items differ'
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.runs))
@@ -0,0 +1,106 @@
+"""Serialization time of a /book/all page with the legacy image url (built by a load event for every image row
+and validated as HttpUrl) and the url built from (name, folder) when the response is serialized.
+
+No database is needed, the books are built in memory:
+    python -m app.benchmark.image_serialization [--books 100] [--images 4] [--runs 50]
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from pydantic import HttpUrl, TypeAdapter
+
+from app.config.settings import settings
+from app.constant import Condition, ImageFolder
+from app.models import Author, Book, Image, Publisher
+from app.pydantic_schema.book import BookOut
+from app.pydantic_schema.mixins import IdTimestampMixin
+
+
+class LegacyImageOut(IdTimestampMixin):
+    name: str
+    src: HttpUrl
+    folder: str
+
+
+class LegacyBookOut(BookOut):
+    images: List[LegacyImageOut] = []  # type: ignore
+
+
+def legacy_public_url(filename: str, folder: str) -> str:
+    key = os.path.join(folder, filename)
+    return f"https://{settings.BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
+
+
+# Column defaults are applied on flush, transient books need them set
+defaults = {
+    'in_stock': True, 'pre_order': False, 'shipping_required': True, 'is_draft': False, 'condition': Condition.new,
+    'weight_in_gm': 0, 'is_featured': False, 'is_must_read': False, 'is_vintage': False, 'is_islamic': False,
+    'is_translated': False, 'is_recommended': False, 'is_big_sale': False, 'is_popular': False,
+}
+
+
+def make_books(count: int, images: int) -> list[Book]:
+    now = datetime.now(timezone.utc)
+    publisher = Publisher(id=uuid.uuid4(), name='অনন্যা', slug='ananya')
+    author = Author(id=uuid.uuid4(), name='হুমায়ূন আহমেদ', slug='humayun-ahmed')
+    books = []
+    for i in range(count):
+        book = Book(id=uuid.uuid4(), public_id=i + 1, sku='sku-{}'.format(i), name='Book {}'.format(i),
+                    slug='book-{}'.format(i), regular_price=500, sale_price=400, quantity=10,
+                    manage_stock=True, is_used=False, created_at=now, updated_at=now, **defaults)
+        book.authors = [author]
+        book.publisher = publisher
+        book.images = [Image(id=uuid.uuid4(), name='{}-{}.webp'.format(i, j), folder=ImageFolder.book.value,
+                             variants=[], created_at=now, updated_at=now) for j in range(images)]
+        books.append(book)
+    return books
+
+
+def timed(fn, runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - st) * 1000)
+    return sorted(durations)
+
+
+def run(count: int, images: int, runs: int):
+    books = make_books(count, images)
+    legacy_adapter = TypeAdapter(List[LegacyBookOut])
+    adapter = TypeAdapter(List[BookOut])
+
+    def legacy():
+        for book in books:  # What the load event did for every image row
+            for image in book.images:
+                image.src = legacy_public_url(image.name, image.folder)  # type: ignore
+        legacy_adapter.dump_json(legacy_adapter.validate_python(books, from_attributes=True))
+
+    def lazy():
+        adapter.dump_json(adapter.validate_python(books, from_attributes=True))
+
+    legacy()
+    assert legacy_adapter.dump_python(legacy_adapter.validate_python(books, from_attributes=True), mode='json')[0][
+        'images'][0]['src'] == adapter.dump_python(adapter.validate_python(books, from_attributes=True),
+                                                   mode='json')[0]['images'][0]['src']
+
+    print(f'{count} books with {images} images, {runs} runs\n')
+    print('{:<10} {:>10} {:>10}'.format('url', 'p50 ms', 'p95 ms'))
+    for name, fn in (('legacy', legacy), ('lazy', lazy)):
+        durations = timed(fn, runs)
+        print('{:<10} {:>10.2f} {:>10.2f}'.format(
+            name, statistics.median(durations), durations[int(len(durations) * 0.95)]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+    run(args.books, args.images, args.runs)
@@ -0,0 +1,71 @@
+"""Per call latency of S3 operations with a new client per call (the old behaviour) and the shared pooled client.
+
+Start a local S3 stand-in and point the app to it, e.g. with MinIO:
+    docker run -p 9000:9000 minio/minio server /data
+    AWS_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin \
+        python -m app.benchmark.s3_client [--calls 200] [--concurrency 1 16]
+(or moto: moto_server -p 9000)
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from botocore.exceptions import ClientError
+
+import app.library.s3 as s3
+from app.config.settings import settings
+
+FOLDER = 'benchmark'
+BODY = b'0' * 20 * 1024  # size of an optimized book image
+
+
+async def create_bucket():
+    async with s3.client() as client:
+        try:
+            await client.create_bucket(Bucket=settings.BUCKET_NAME)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('BucketAlreadyOwnedByYou', 'BucketAlreadyExists'):
+                raise
+
+
+async def timed_calls(calls: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+
+    async def call(i: int):
+        async with semaphore:
+            st = time.perf_counter()
+            await s3.upload_file(BODY, f'{i}.jpg', FOLDER)
+            await s3.is_file_exists(f'{i}.jpg', FOLDER)
+            await s3.delete_file(f'{i}.jpg', FOLDER)
+            durations.append((time.perf_counter() - st) * 1000 / 3)
+
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    return durations
+
+
+async def run(calls: int, concurrencies: list[int]):
+    await create_bucket()
+    print(f'S3 endpoint: {settings.AWS_ENDPOINT_URL or "aws"}, calls per run: {calls} (put, head, delete)\n')
+    print('{:<12} {:>12} {:>12} {:>12} {:>12}'.format(
+        'concurrency', 'client', 'p50 ms', 'p95 ms', 'total s'))
+
+    for concurrency in concurrencies:
+        for name in ('per call', 'shared'):
+            if name == 'shared':
+                await s3.manager.start()
+            st = time.perf_counter()
+            durations = sorted(await timed_calls(calls, concurrency))
+            total = time.perf_counter() - st
+            await s3.manager.close()
+            print('{:<12} {:>12} {:>12.2f} {:>12.2f} {:>12.2f}'.format(
+                concurrency, name, statistics.median(durations), durations[int(len(durations) * 0.95)], total))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16])
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.concurrency))
@@ -0,0 +1,77 @@
+"""Serialization time of the book, order and coupon list responses with FastAPI's serialize_response + JSONResponse
+(the old behaviour) and serializer.dump_json (SerializedRoute).
+
+Loads one page of each list from DATABASE_URL (python seed.py seeds books, orders and coupons are used if present):
+    python -m app.benchmark.serialization [--per-page 100] [--runs 50]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Awaitable, Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config.settings import settings
+from app.controller.book import query_selectinload
+from app.controller.coupon import query as coupon_query
+from app.controller.order import order_query
+from app.library import serializer
+from app.pydantic_schema.book import BookOut
+from app.pydantic_schema.coupon import CouponOut
+from app.pydantic_schema.order import OrderOutAdmin
+
+
+async def timed(fn: Callable[[], Awaitable[Any]], runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        await fn()
+        durations.append((time.perf_counter() - st) * 1000)
+    return sorted(durations)
+
+
+async def compare(name: str, content: list, schema: Any, runs: int):
+    field = create_response_field(name='Response_{}'.format(name), type_=schema)
+
+    async def legacy():
+        return JSONResponse(await serialize_response(field=field, response_content=content, is_coroutine=True)).body
+
+    async def serialized():
+        return serializer.dump_json(content, schema)
+
+    assert (await legacy()) == (await serialized()), 'responses differ'
+    for path, fn in (('fastapi', legacy), ('dump_json', serialized)):
+        durations = await timed(fn, runs)
+        print('{:<10} {:>6} {:<10} {:>10.2f} {:>10.2f}'.format(
+            name, len(content), path, statistics.median(durations), durations[int(len(durations) * 0.95)]))
+
+
+async def run(per_page: int, runs: int):
+    engine = create_async_engine(settings.DATABASE_URL)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        pages = {
+            'books': ((await db.scalars(query_selectinload.limit(per_page))).all(), list[BookOut]),
+            'orders': ((await db.scalars(order_query.limit(per_page))).unique().all(), list[OrderOutAdmin]),
+            'coupons': ((await db.scalars(coupon_query.limit(per_page))).unique().all(), list[CouponOut]),
+        }
+
+    print(f'{runs} runs per list\n')
+    print('{:<10} {:>6} {:<10} {:>10} {:>10}'.format('list', 'items', 'path', 'p50 ms', 'p95 ms'))
+    for name, (content, schema) in pages.items():
+        if not content:
+            print('{:<10} {:>6} skipped, no rows'.format(name, 0))
+            continue
+        await compare(name, list(content), schema, runs)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.per_page, args.runs))
@@ -1,20 +1,247 @@
-from typing import AsyncGenerator
+import asyncio
+import logging
+import os
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable
+from uuid import uuid4
+from sqlalchemy import DDL, event, inspect, text
+from sqlalchemy.sql.dml import UpdateBase
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncAttrs
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, ORMExecuteState, Session as SyncSession
 from typing import Annotated
 from fastapi import Depends
 
 from app.config.settings import settings
+from app.library import metrics, query_stats
+
+logger = logging.getLogger(__name__)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
+# gin_trgm_ops indexes and similarity() need pg_trgm
+event.listen(Base.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
+@dataclass
+class Writes:
+    tables: set[str] = field(default_factory=set)
+    # '<table>:<primary key>' of flushed objects
+    rows: set[str] = field(default_factory=set)
+    # Tables written by insert/update/delete statements, the rows are unknown
+    statements: set[str] = field(default_factory=set)
+
+
+# Coroutines called with the writes of every committed transaction
+commit_listeners: list[Callable[[Writes], Awaitable[None]]] = []
+
+
+def on_commit(listener: Callable[[Writes], Awaitable[None]]):
+    commit_listeners.append(listener)
+    return listener
+
+
+def session_writes(session: SyncSession) -> Writes:
+    return session.info.setdefault('writes', Writes())
+
+
+class RoutingSession(SyncSession):
+    """_summary_
+        Sessions opened with info={'replica': True} (read_session_factory) read from the replica while it is
+        within REPLICA_MAX_LAG. Flushes and insert/update/delete statements go to the primary and keep the rest
+        of the session on it, so a session reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not self.info.get('replica'):
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['replica'] = False
+        elif replica.usable():
+            return replica_engine.sync_engine  # type: ignore
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class TrackedAsyncSession(AsyncSession):
+    sync_session_class = RoutingSession
+
+    async def commit(self) -> None:
+        await super().commit()
+        writes = self.sync_session.info.pop('writes', None)
+        if not writes or not writes.tables:
+            return
+        for listener in commit_listeners:
+            try:
+                await listener(writes)
+            except Exception:
+                logger.error(traceback.format_exc())
+
+
+@event.listens_for(SyncSession, 'after_flush')
+def track_flushed_rows(session: SyncSession, flush_context):
+    writes = session_writes(session)
+    inserted_or_deleted = set(session.new) | set(session.deleted)
+    for obj in inserted_or_deleted | set(session.dirty):
+        state = inspect(obj)
+        writes.tables.update(table.name for table in state.mapper.tables)
+        pk = state.mapper.primary_key_from_instance(obj)
+        if len(pk) == 1:
+            writes.rows.add('{}:{}'.format(state.mapper.local_table.name, pk[0]))
+        for rel in state.mapper.relationships:
+            if rel.secondary is None:
+                continue
+            if obj in inserted_or_deleted or state.attrs[rel.key].history.has_changes():
+                writes.tables.add(rel.secondary.name)
+
+
+@event.listens_for(SyncSession, 'do_orm_execute')
+def track_bulk_statements(orm_execute_state: ORMExecuteState):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        # Statements writing only what no cached response shows (e.g. books.held) pass invalidates_cache=False
+        if orm_execute_state.execution_options.get('invalidates_cache') is False:
+            return
+        writes = session_writes(orm_execute_state.session)
+        table = orm_execute_state.statement.table.name  # type: ignore
+        writes.tables.add(table)
+        # Statements that know the primary keys they write pass them as written_rows
+        rows = orm_execute_state.execution_options.get('written_rows')
+        if rows is None:
+            writes.statements.add(table)
+        else:
+            writes.rows.update('{}:{}'.format(table, id) for id in rows)
+
+
+@event.listens_for(SyncSession, 'after_rollback')
+def discard_writes(session: SyncSession):
+    session.info.pop('writes', None)
+
+
+def engine_options() -> dict:
+    connect_args: dict = {
+        'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    if settings.DB_PGBOUNCER:
+        # A transaction may run on another server connection than the one a statement was prepared on,
+        # so nothing is cached and every prepared statement gets a unique name
+        connect_args = {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: '__asyncpg_{}__'.format(uuid4()),
+        }
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
 engine = create_async_engine(
-    settings.DATABASE_URL, echo=False, future=True)
+    settings.DATABASE_URL, echo=False, future=True, **engine_options())
+
+# Pool events of this worker process since it started
+pool_counters = {'connects': 0, 'checkouts': 0, 'invalidated': 0}
+
+
+@event.listens_for(engine.sync_engine.pool, 'connect')
+def count_connect(dbapi_connection, connection_record):
+    pool_counters['connects'] += 1
+
+
+@event.listens_for(engine.sync_engine.pool, 'checkout')
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_counters['checkouts'] += 1
+
+
+@event.listens_for(engine.sync_engine.pool, 'invalidate')
+def count_invalidate(dbapi_connection, connection_record, exception):
+    pool_counters['invalidated'] += 1
+
+
+def pool_stats() -> dict:
+    pool: Any = engine.sync_engine.pool
+    return {
+        'pid': os.getpid(),
+        'pgbouncer': settings.DB_PGBOUNCER,
+        'pool_size': pool.size(),
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        **pool_counters,
+    }
+
+
+@metrics.on_collect
+def collect_pool():
+    stats = pool_stats()
+    for state in ('checked_in', 'checked_out', 'overflow'):
+        metrics.DB_POOL_CONNECTIONS.set(state, value=stats[state])
+    metrics.DB_POOL_CONNECTIONS.set('size', value=stats['pool_size'])
+    for name, count in pool_counters.items():
+        metrics.DB_POOL_EVENTS.set(name, value=count)
+
+
+replica_engine = create_async_engine(
+    settings.REPLICA_DATABASE_URL, echo=False, future=True, **engine_options()) if settings.REPLICA_DATABASE_URL else None
+
+query_stats.instrument(engine.sync_engine)
+if replica_engine is not None:
+    query_stats.instrument(replica_engine.sync_engine)
+
+# 0 when the replica has replayed everything it received (or is not a standby, e.g. a second local database)
+replica_lag_sql = text('''
+SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END''')
+
+
+class ReplicaMonitor:
+    """_summary_
+        Measures the replica lag every REPLICA_LAG_CHECK_INTERVAL, started by the app lifespan. Reads fall back
+        to the primary until the first check, while the lag is over REPLICA_MAX_LAG and while it is unreachable.
+    """
+
+    def __init__(self):
+        self.lag: float | None = None
+
+    def usable(self) -> bool:
+        return replica_engine is not None and self.lag is not None and self.lag <= settings.REPLICA_MAX_LAG
+
+    async def check(self):
+        try:
+            async with replica_engine.connect() as conn:  # type: ignore
+                self.lag = float(await conn.scalar(replica_lag_sql) or 0)
+        except Exception as err:
+            if self.lag is not None:
+                logger.error('Replica is unreachable, reading from the primary: {}: {}'.format(err.__class__, err))
+            self.lag = None
+            return
+        if self.lag > settings.REPLICA_MAX_LAG:
+            logger.warning('Replica lag {:.1f}s, reading from the primary'.format(self.lag))
+
+    async def run(self, stop: asyncio.Event):
+        while replica_engine is not None and not stop.is_set():
+            await self.check()
+            try:
+                await asyncio.wait_for(stop.wait(), settings.REPLICA_LAG_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+replica = ReplicaMonitor()
+
 session_factory = async_sessionmaker(
-    engine, autoflush=False, expire_on_commit=False)
+    engine, class_=TrackedAsyncSession, autoflush=False, expire_on_commit=False)
+# Sessions of heavy reads (catalog, dashboard, exports) that tolerate REPLICA_MAX_LAG
+read_session_factory = async_sessionmaker(
+    engine, class_=TrackedAsyncSession, autoflush=False, expire_on_commit=False, info={'replica': True})
 
 
 async def create_tables():
@@ -32,4 +259,10 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session_factory() as session:
+        yield session
+
+
 Session = Annotated[AsyncSession, Depends(get_db)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_db)]
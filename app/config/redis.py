@@ -1,14 +1,27 @@
 import redis.asyncio as aioredis
 from app.config.settings import settings
+from app.library.metrics import REDIS_SECONDS
+
+
+class TimedRedis(aioredis.Redis):
+    # Latency of every command by name, pipelines are sent without execute_command
+
+    async def execute_command(self, *args, **options):
+        with REDIS_SECONDS.time(str(args[0]).lower()):
+            return await super().execute_command(*args, **options)
+
 
 async def get_redis():
-    return await aioredis.from_url(settings.REDIS_URL,
-                                   encoding="utf-8",
-                                   decode_responses=True)
+    return await TimedRedis.from_url(settings.REDIS_URL,
+                                     encoding="utf-8",
+                                     decode_responses=True)
     
     
 async def get_cache():
-    return await aioredis.from_url(
+    return await TimedRedis.from_url(
         settings.REDIS_URL,
         decode_responses=True
-    )
\ No newline at end of file
+    )
+
+# Shared client for services that run outside a request (e.g. commit listeners)
+cache = TimedRedis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -15,8 +15,30 @@ class Settings(BaseSettings):
 
     DATABASE_URL: str
     TEST_DATABASE_URL: str
+    # Pool of every worker process, keep workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below max_connections
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # in secs, waiting for a free connection
+    DB_POOL_RECYCLE: int = 1800  # in secs, older connections are replaced
+    DB_POOL_PRE_PING: bool = True  # check a connection before handing it out
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection
+    DB_PGBOUNCER: bool = False  # DATABASE_URL points to pgbouncer in transaction pooling mode
+    REPLICA_DATABASE_URL: str | None = None  # Read replica of the catalog, dashboard and export reads
+    REPLICA_MAX_LAG: float = 5  # in secs, reads go to the primary above this
+    REPLICA_LAG_CHECK_INTERVAL: float = 5  # in secs
 
     REDIS_URL: str
+    COUNT_CACHE_TTL: int = 300  # in secs
+    COUNT_ESTIMATE_THRESHOLD: int = 10000  # estimates below this are counted exactly
+    RESPONSE_CACHE_TTL: int = 600  # in secs
+    RESPONSE_CACHE_PAGES: int = 3  # first pages of /book/all that are cached
+    BULK_COPY_BATCH: int = 10000  # rows per COPY into the bulk staging table
+    CSV_CHUNK_SIZE: int = 1000  # rows per upsert and commit of the CSV import
+    IMAGE_IMPORT_CONCURRENCY: int = 8  # parallel image downloads/uploads of the CSV import
+    IMAGE_DOWNLOAD_TIMEOUT: float = 30  # in secs
+    IMAGE_PROCESS_WORKERS: int = 2  # processes resizing and encoding uploaded images
+    IMAGE_MAX_UPLOAD_KB: int = 5120  # size limit of an upload before optimization
+    DASHBOARD_TIMEZONE: str = 'Asia/Dhaka'  # days, weeks and months of the dashboard series start at its midnight
 
     JWT_SECRET: str
     JWT_REFRESH_SECRET_KEY: str
@@ -40,6 +62,22 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str
     AWS_REGION: str
     BUCKET_NAME: str
+    IMAGE_BASE_URL: str | None = None  # CDN in front of the bucket (e.g. https://cdn.pathokpoint.com)
+    AWS_ENDPOINT_URL: str | None = None  # Local S3 stand-in (e.g. http://localhost:9000 for MinIO)
+    S3_MAX_POOL_CONNECTIONS: int = 50  # connections of the shared S3 client
+    IMAGE_DELETION_BATCH: int = 1000  # keys per DeleteObjects call, 1000 at most
+    IMAGE_DELETION_INTERVAL: float = 10  # in secs, between polls of an empty queue
+    IMAGE_DELETION_RETRY_AFTER: int = 30  # in secs, doubled on every failed attempt
+    IMAGE_DELETION_MAX_ATTEMPTS: int = 8  # failed keys are kept for inspection after this
+    ORDER_ROLLUP_FOLD_INTERVAL: float = 10  # in secs, between folds of the order rollup deltas
+    INVENTORY_FOLD_INTERVAL: float = 10  # in secs, between folds of the inventory valuation deltas
+    INVENTORY_RECONCILE_INTERVAL: float = 3600  # in secs, between checks of the inventory valuation
+    STOCK_HOLD_TTL: int = 10 * 60  # in secs, stock is held for a pending payment
+    STOCK_HOLD_SWEEP_INTERVAL: float = 30  # in secs, between releases of expired holds
+    QUERY_BUDGET_STRICT: bool = False  # Raise instead of logging when a route exceeds its query budget (tests)
+    METRICS_TOKEN: str | None = None  # Bearer token of GET /metrics, which is closed when not set
+    METRICS_PUSH_INTERVAL: float = 15  # in secs, between snapshots of a worker in redis
+    METRICS_WORKER_TTL: int = 60  # in secs, a worker that stopped publishing is dropped from /metrics
 
     model_config = SettingsConfigDict(env_file='.env', extra='allow')
 
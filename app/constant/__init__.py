@@ -8,4 +8,9 @@ from .role import Role # noqa : F401
 from .discount_type import DiscountType # noqa : F401
 from .orderstatus import Status # noqa : F401
 from .gender import Gender # noqa : F401
-from .image import ImageFolder # noqa : F401
\ No newline at end of file
+from .image import ImageFolder # noqa : F401
+from .count_mode import CountMode # noqa : F401
+from .bulk_status import BulkStatus # noqa : F401
+from .load_mode import LoadMode # noqa : F401
+from .granularity import Granularity # noqa : F401
+from .inventory_dimension import InventoryDimension # noqa : F401
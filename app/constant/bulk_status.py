@@ -0,0 +1,8 @@
+from enum import Enum
+
+class BulkStatus(str, Enum):
+    created = 'created'
+    invalid = 'invalid'
+    duplicate = 'duplicate'
+    exists = 'exists'
+    not_found = 'not_found'
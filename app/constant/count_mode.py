@@ -0,0 +1,6 @@
+from enum import Enum
+
+class CountMode(str, Enum):
+    exact = 'exact'
+    cached = 'cached'
+    estimate = 'estimate'
@@ -0,0 +1,7 @@
+from enum import Enum
+
+class Granularity(str, Enum):
+    hour = 'hour'
+    day = 'day'
+    week = 'week'
+    month = 'month'
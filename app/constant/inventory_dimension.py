@@ -0,0 +1,6 @@
+from enum import Enum
+
+class InventoryDimension(str, Enum):
+    tag = 'tag'
+    stock_location = 'stock_location'
+    condition = 'condition'
@@ -0,0 +1,5 @@
+from enum import Enum
+
+class LoadMode(str, Enum):
+    orm = 'orm'  # Book entities with every relation loaded by selectinload
+    projection = 'projection'  # Response columns only, relations aggregated as json in the same query
@@ -8,12 +8,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Query, selectinload
 from sqlalchemy.sql.selectable import Select
 
+import app.controller.count as count_service
+from app.constant import CountMode
 from app.controller.exception import (
     ConflictException,
     NotFoundException,
     UnhandledException,
 )
 from app.controller.image import validate_img
+from app.controller.search import search_condition, search_rank
 from app.filter_schema.author import AuthorFilter
 from app.models import Author, Book, Category, Publisher, Tag, User
 
@@ -45,7 +48,8 @@ def apply_filter(fltr: AuthorFilter, query: Union[Query, Select]) -> Union[Query
     publisher__slug__in = filter.pop('publisher__slug__in')
     tag__slug__in = filter.pop('tag__slug__in')
 
-    if publisher__slug__in or category__slug__in or tag__slug__in:
+    joined = bool(publisher__slug__in or category__slug__in or tag__slug__in)
+    if joined:
         query = query.join(Author.books)
 
     if publisher__slug__in:
@@ -61,15 +65,15 @@ def apply_filter(fltr: AuthorFilter, query: Union[Query, Select]) -> Union[Query
             Book.tags.any(Tag.slug.in_(tag__slug__in))
         )
     if q := filter.pop('q'):
-        query = query.filter(or_(
-            Author.name.ilike(f'%{q}%'),
-            Author.slug.ilike('%{}%'.format(q.replace(' ', '-'))),
-            func.similarity(Author.name, q) > 0.5,
-            func.similarity(Author.slug, q) > 0.5
-        ))
+        query = query.filter(search_condition(
+            q, Author.search_vector, Author.name))
+        if not joined:
+            query = query.order_by(search_rank(
+                q, Author.search_vector, Author.name))
 
     query = filter.filter(query)
-    query = query.distinct()
+    if joined:
+        query = query.distinct()
     return query
 
 
@@ -87,17 +91,9 @@ async def get_all_authors(filter: AuthorFilter, page: int, per_page: int, db: As
     return result.scalars().unique().all()
 
 
-async def count_author(filter: AuthorFilter, db: AsyncSession) -> int:
+async def count_author(filter: AuthorFilter, db: AsyncSession, count_mode: CountMode = CountMode.exact) -> int:
     query = apply_filter(filter, select(Author))
-    count_query = select(func.count()).select_from(query.subquery())
-
-    try:
-        result = await db.execute(count_query)
-    except Exception:
-        logger.error(traceback.format_exc())
-        raise UnhandledException()
-
-    return result.scalar_one()
+    return await count_service.get_count(query, db, count_mode)
 
 
 async def create_author(payload: dict, db: AsyncSession) -> Author:
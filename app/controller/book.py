@@ -1,23 +1,36 @@
+import base64
+import json
 import logging
-import time
 import traceback
-from typing import Sequence, Tuple
+from datetime import datetime
+from itertools import chain
+from typing import Any, Sequence, Tuple, Union
 from uuid import UUID
 
 import pandas as pd
 from slugify import slugify
-from sqlalchemy import delete, func, select, or_
+from sqlalchemy import JSON, Table, and_, delete, func, literal_column, or_, select, tuple_, type_coerce
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import Query, joinedload, selectinload
+from sqlalchemy.sql.selectable import Select
 
+import app.controller.count as count_service
+from app.constant import CountMode, LoadMode
 from app.controller.exception import (
+    BadRequestException,
     ConflictException,
     NotFoundException,
     UnhandledException,
 )
 from app.controller.image import validate_imgs
+from app.controller.search import search_condition, search_rank, set_book_search_keys
 from app.filter_schema.book import BookFilter
-from app.models import Author, Book, Category, Image, Publisher, Tag
+from app.models import Author, Book, Category, Image, Publisher, Tag, book_tag_link
+from app.models.author import book_author_link, book_translator_link
+from app.models.book import book_image_link
+from app.models.category import book_category_link
+from app.pydantic_schema.book import BookOut
+from app.pydantic_schema.common import AuthorOut, CategoryOut, ImageOut, PublisherOut, TagOut
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +44,45 @@ query_selectinload = select(Book).options(
     selectinload(Book.tags)
 )
 
+
+
+def json_object(model: Any, schema: Any) -> Any:
+    return func.json_build_object(*chain.from_iterable(
+        (literal_column("'{}'".format(name)), getattr(model, name)) for name in schema.model_fields))
+
+
+def json_list(model: Any, schema: Any, link: Table, link_column: str) -> Any:
+    return type_coerce(select(func.coalesce(func.json_agg(json_object(model, schema)), literal_column("'[]'::json")))
+                       .select_from(link.join(model, link.c[link_column] == model.id))
+                       .where(link.c.book_id == Book.id).scalar_subquery(), JSON)
+
+
+def projection_query(schema: Any) -> Select:
+    """_summary_
+        Only the book columns of the schema, with every relation aggregated as json by a correlated subquery,
+        so a page is one round trip and no ORM object is built.
+    Args:
+        schema (Any): Response model (e.g. BookOut)
+    Returns:
+        Select: Statement to filter, sort and paginate like query_selectinload
+    """
+    return select(
+        *[getattr(Book, name) for name in schema.model_fields if name in Book.__table__.c],
+        type_coerce(select(json_object(Publisher, PublisherOut)).where(Publisher.id == Book.publisher_id)
+                    .scalar_subquery(), JSON).label('publisher'),
+        json_list(Author, AuthorOut, book_author_link, 'author_id').label('authors'),
+        json_list(Author, AuthorOut, book_translator_link, 'translator_id').label('translators'),
+        json_list(Category, CategoryOut, book_category_link, 'category_id').label('categories'),
+        json_list(Image, ImageOut, book_image_link, 'image_id').label('images'),
+        json_list(Tag, TagOut, book_tag_link, 'tag_id').label('tags'),
+    )
+
+
+query_projection = projection_query(BookOut)
+# Tables of the relations in query_projection, to tag cached responses
+projection_relations = {'publisher': 'publishers', 'authors': 'authors', 'translators': 'authors',
+                        'categories': 'categories', 'images': 'images', 'tags': 'tags'}
+
 query_joinedload = select(Book).options(
     joinedload(Book.publisher),
     joinedload(Book.authors),
@@ -55,49 +107,207 @@ async def get_book_by_public_id(public_id: int, db: AsyncSession) -> Book:
     return book
 
 
-async def get_all_books(filter: BookFilter, page: int, per_page: int, db: AsyncSession) -> Tuple[Sequence[Book], int]:
-    offset = (page - 1) * per_page
+def relation_filter(sub_filter: Any, link: Table, link_column: str) -> Any:
+    """_summary_
+        Semi-join on the link table, the related table is joined only when name/slug is filtered.
+    Args:
+        sub_filter (Filter): author, category or tag sub-filter of BookFilter
+        link (Table): Link table (e.g. book_author_link)
+        link_column (str): Foreign key column of the related table (e.g. 'author_id')
+    Returns:
+        Exists: EXISTS predicate correlated to Book.id
+    """
+    model = sub_filter.Constants.model
+    query = select(1).select_from(link).where(link.c.book_id == Book.id)
 
-    query = select(Book,
-                   Author.id, Author.name, Author.slug,
-                   Category.id, Category.name, Category.slug,
-                   Publisher.id, Publisher.name, Publisher.slug,
-                   Tag.id, Tag.name, Tag.slug
-                   ).outerjoin(Book.authors).outerjoin(Book.categories).outerjoin(Book.publisher).outerjoin(Book.tags)
+    if sub_filter.id__in:
+        query = query.where(link.c[link_column].in_(sub_filter.id__in))
+    sub_filter = sub_filter.model_copy(update={'id__in': None})
+    if sub_filter.filtering_fields:
+        query = sub_filter.filter(query.join(
+            model, model.id == link.c[link_column]))
+    return query.exists()
+
+
+def publisher_filter(sub_filter: Any) -> Any:
+    clauses = []
+    if sub_filter.id__in:
+        clauses.append(Book.publisher_id.in_(sub_filter.id__in))
+
+    sub_filter = sub_filter.model_copy(update={'id__in': None})
+    if sub_filter.filtering_fields:
+        clauses.append(sub_filter.filter(select(1).select_from(Publisher).where(
+            Publisher.id == Book.publisher_id)).exists())
+    return and_(*clauses)
+
+
+def apply_filter(fltr: BookFilter, query: Union[Query, Select]) -> Union[Query, Select]:
+    filter = fltr.model_copy()
 
     if q := filter.pop('q'):
-        query = query.filter(or_(
-            Book.name.ilike(f'%{q}%'),
-            Book.slug.ilike('%{}%'.format(q.replace(' ', '-'))),
-            func.similarity(Book.name, q) > 0.5,
-            func.similarity(Book.slug, q) > 0.5
-        ))
+        query = query.filter(search_condition(
+            q, Book.search_vector, Book.search_text))
+
+    # Relations are filtered by EXISTS, no join is added to the outer query so no DISTINCT is needed
+    for name, link, link_column in (('author', book_author_link, 'author_id'),
+                                    ('category', book_category_link, 'category_id'),
+                                    ('tag', book_tag_link, 'tag_id')):
+        sub_filter = filter.pop(name)
+        if sub_filter and sub_filter.filtering_fields:
+            query = query.filter(relation_filter(sub_filter, link, link_column))
+
+    sub_filter = filter.pop('publisher')
+    if sub_filter and sub_filter.filtering_fields:
+        query = query.filter(publisher_filter(sub_filter))
 
     query = filter.filter(query)
-    query = query.distinct(Book.id)
-    subquery = query.subquery()
+    return query
 
-    stmt = query_selectinload.join(subquery, Book.id == subquery.c.id)
-    stmt = filter.sort(stmt)
-    stmt = stmt.offset(offset).limit(per_page)
 
+async def fetch_books(stmt: Select, load_mode: LoadMode, db: AsyncSession) -> Tuple[Sequence[Any], Sequence[Any]]:
+    """_summary_
+    Returns:
+        Tuple[Sequence[Any], Sequence[Any]]: Books (Book entities or BookOut models) and the result rows
+    """
     try:
-        st = time.time()
-        result = await db.execute(stmt)
-        books = result.unique().scalars().all()
-        logger.debug(f'Time taken to fetch books: {time.time() - st}')
-
-        st = time.time()
-        count_stmt = select(func.count()).select_from(subquery)
-        count = await db.scalar(count_stmt) or 0
-        logger.debug(f'Time taken to fetch count: {time.time() - st}')
+        if load_mode == LoadMode.projection:
+            rows = (await db.execute(stmt)).all()
+            return [BookOut.model_validate(dict(row._mapping)) for row in rows], rows
+        books = (await db.scalars(stmt)).all()
+        return books, books
     except Exception:
         logger.error(traceback.format_exc())
         raise UnhandledException()
 
+
+async def get_all_books(filter: BookFilter, page: int, per_page: int, db: AsyncSession, count_mode: CountMode = CountMode.exact,
+                        load_mode: LoadMode = LoadMode.orm) -> Tuple[Sequence[Any], int]:
+    offset = (page - 1) * per_page
+
+    stmt = apply_filter(filter, query_projection if load_mode == LoadMode.projection else query_selectinload)
+    stmt = filter.sort(stmt)
+    if filter.q and not filter.order_by:
+        stmt = stmt.order_by(search_rank(
+            filter.q, Book.search_vector, Book.search_text))
+    stmt = stmt.offset(offset).limit(per_page)
+
+    books, _ = await fetch_books(stmt, load_mode, db)
+    count = await count_service.get_count(apply_filter(filter, select(Book)), db, count_mode)
+
     return books, count
 
 
+def sortable_column(field_name: str) -> Any:
+    column = getattr(Book, field_name)
+    if field_name == 'shelf':
+        # NULL breaks the row comparison of the keyset predicate
+        return func.coalesce(column, '')
+    return column
+
+
+def keyset_columns(order_by: list[str] | None) -> list[Tuple[str, Any, bool]]:
+    """_summary_
+    Args:
+        order_by (list[str] | None): Active sort fields (e.g. ['-sale_price', 'name'])
+    Returns:
+        list: (field_name, column, is_desc) for each sort field followed by Book.id as the tie breaker
+    """
+    columns = []
+    for field_name in order_by or []:
+        name = field_name.replace('-', '').replace('+', '')
+        columns.append((name, sortable_column(name), field_name.startswith('-')))
+
+    # Tie breaker follows the last sort direction so that a single (field, id) index can serve both directions
+    is_desc = columns[-1][2] if columns else False
+    columns.append(('id', Book.id, is_desc))
+    return columns
+
+
+def encode_cursor(order_by: list[str] | None, values: list[Any]) -> str:
+    data = json.dumps({
+        'order_by': order_by or [],
+        'values': [value.isoformat() if isinstance(value, datetime) else
+                   str(value) if isinstance(value, UUID) else value for value in values]
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, order_by: list[str] | None, columns: list[Tuple[str, Any, bool]]) -> list[Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)))
+        values = data['values']
+        assert data['order_by'] == (order_by or [])
+        assert len(values) == len(columns)
+
+        for i, (name, _, _) in enumerate(columns):
+            if name in ('created_at', 'updated_at'):
+                values[i] = datetime.fromisoformat(values[i])
+            elif name == 'id':
+                values[i] = UUID(values[i])
+        return values
+    except Exception:
+        raise BadRequestException(
+            'Invalid cursor, it does not match the current order_by')
+
+
+def keyset_predicate(columns: list[Tuple[str, Any, bool]], values: list[Any]) -> Any:
+    if len({is_desc for _, _, is_desc in columns}) == 1:
+        # Same direction on every column, compare as a row so the composite index can be used
+        left, right = tuple_(*[col for _, col, _ in columns]), tuple_(*values)
+        return left < right if columns[0][2] else left > right
+
+    clauses = []
+    for i, (_, column, is_desc) in enumerate(columns):
+        equals = [col == values[j] for j, (_, col, _) in enumerate(columns[:i])]
+        clauses.append(and_(*equals, column < values[i]
+                       if is_desc else column > values[i]))
+    return or_(*clauses)
+
+
+async def get_all_books_by_cursor(filter: BookFilter, cursor: str, per_page: int, db: AsyncSession, count_mode: CountMode = CountMode.exact,
+                                  load_mode: LoadMode = LoadMode.orm) -> Tuple[Sequence[Any], int, str | None]:
+    """_summary_
+        Keyset pagination, page N costs the same as page 1.
+
+    Args:
+        filter (BookFilter): Filter, order_by must be the same for every page
+        cursor (str): Empty string for the first page, then X-Next-Cursor of the previous page
+        per_page (int): Page size
+        count_mode (CountMode): How X-Total-Count is computed
+        load_mode (LoadMode): Book entities or BookOut models built from a projection
+
+    Returns:
+        Tuple[Sequence[Any], int, str | None]: Books, total count and the cursor of the next page
+    """
+    order_by = filter.order_by
+    columns = keyset_columns(order_by)
+
+    if load_mode == LoadMode.projection:
+        # Sort fields may not be in the response, they are selected for the cursor
+        stmt = apply_filter(filter, query_projection.add_columns(
+            *[column.label('cursor_{}'.format(name)) for name, column, _ in columns]))
+    else:
+        stmt = apply_filter(filter, query_selectinload)
+    if cursor:
+        stmt = stmt.filter(keyset_predicate(
+            columns, decode_cursor(cursor, order_by, columns)))
+    stmt = stmt.order_by(*[column.desc() if is_desc else column.asc()
+                           for _, column, is_desc in columns]).limit(per_page)
+
+    books, rows = await fetch_books(stmt, load_mode, db)
+    count = await count_service.get_count(apply_filter(filter, select(Book)), db, count_mode)
+
+    next_cursor = None
+    if len(rows) == per_page:
+        last = rows[-1]
+        next_cursor = encode_cursor(order_by, [
+            last._mapping['cursor_{}'.format(name)] if load_mode == LoadMode.projection else
+            (getattr(last, name) or '') if name == 'shelf' else getattr(last, name)
+            for name, _, _ in columns])
+    return books, count, next_cursor
+
+
 async def create_book(payload: dict, db: AsyncSession) -> Book:
     _book = await db.scalar(select(Book).where(Book.sku == payload['sku']))
     if _book:
@@ -111,6 +321,7 @@ async def create_book(payload: dict, db: AsyncSession) -> Book:
 
     logger.debug(f'Creating book with payload: {payload}')
     book = Book(**payload)
+    set_book_search_keys(book)
     db.add(book)
     await db.commit()
 
@@ -163,6 +374,7 @@ async def create_book_bulk(payload: list[dict], db: AsyncSession) -> Sequence[Bo
                                   for image_id in book['images']]
                 book['tags'] = [tags[tag_id] for tag_id in book['tags']]
                 item = Book(**book)
+                set_book_search_keys(item)
                 items.append(item)
 
             logger.debug(f'Adding {len(items)} books')
@@ -191,6 +403,7 @@ async def update_book(id: UUID, payload: dict, db: AsyncSession) -> Book:
 
     logger.debug(f'Updating book with payload: {payload}')
     [setattr(book, key, value) for key, value in payload.items()]
+    set_book_search_keys(book)
 
     await db.commit()
     logger.info(f'Book updated successfully {book}')
@@ -209,6 +422,9 @@ async def delete_book(id: UUID, db: AsyncSession) -> None:
 
 
 async def delete_book_bulk(ids: list[UUID], db: AsyncSession) -> None:
+    # The images trigger queues their files for deletion from s3
+    await db.execute(delete(Image).where(Image.id.in_(
+        select(book_image_link.c.image_id).where(book_image_link.c.book_id.in_(ids)))))
     await db.execute(delete(Book).filter(Book.id.in_(ids)))
     await db.commit()
     logger.info(f'{len(ids)} Books deleted successfully')
@@ -217,6 +433,9 @@ async def delete_book_bulk(ids: list[UUID], db: AsyncSession) -> None:
 async def handle_relationship(payload: dict, db: AsyncSession) -> dict:
     if payload.get('publisher_id'):
         payload['publisher'] = await db.get(Publisher, payload['publisher_id'])
+    elif 'publisher_id' in payload:
+        # The loaded publisher would stay on the book and in its search keys
+        payload['publisher'] = None
     if payload.get('authors'):
         payload['authors'] = (await db.scalars(select(Author).where(Author.id.in_(payload['authors'])))).all()
     if payload.get('translators'):
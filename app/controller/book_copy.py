@@ -0,0 +1,225 @@
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator
+
+from pydantic import ValidationError
+from slugify import slugify
+from sqlalchemy import (
+    Column,
+    Enum,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    any_,
+    case,
+    cast,
+    func,
+    insert,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.config.settings import settings
+from app.constant import BulkStatus
+from app.controller.search import refresh_book_search_text
+from app.library import bangla
+from app.models import Author, Book, Category, Image, Publisher, Tag, book_tag_link
+from app.models.author import book_author_link, book_translator_link
+from app.models.book import book_image_link
+from app.models.category import book_category_link
+from app.pydantic_schema.book import CreateBook
+
+logger = logging.getLogger(__name__)
+
+# Payload field -> (link table, column of the related id, related model)
+LINKS = {
+    'authors': (book_author_link, 'author_id', Author),
+    'translators': (book_translator_link, 'translator_id', Author),
+    'categories': (book_category_link, 'category_id', Category),
+    'images': (book_image_link, 'image_id', Image),
+    'tags': (book_tag_link, 'tag_id', Tag),
+}
+BOOK_COLUMNS = [column for column in Book.__table__.c
+                if column.name in CreateBook.model_fields or column.name in ('id', 'search_keys')]
+
+
+def staging_table() -> Table:
+    # Enums are staged by name as text and cast on insert, a temporary table can't own the enum types
+    return Table(
+        'book_staging', MetaData(),
+        Column('row', Integer, primary_key=True, autoincrement=False),
+        Column('status', String),
+        Column('detail', String),
+        *(Column(column.name, String if isinstance(column.type, Enum) else column.type) for column in BOOK_COLUMNS),
+        *(Column(field, ARRAY(UUID(as_uuid=True))) for field in LINKS),
+        prefixes=['TEMPORARY'],
+        postgresql_on_commit='DROP',
+    )
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+    yield buffer
+
+
+def validation_detail(exc: ValidationError) -> str:
+    return '; '.join('{}: {}'.format('.'.join(map(str, error['loc'])), error['msg']) for error in exc.errors())
+
+
+def payload_sku(line: bytes) -> str | None:
+    try:
+        sku = json.loads(line).get('sku')
+        return sku if isinstance(sku, str) else None
+    except Exception:
+        return None
+
+
+class Names:
+    """_summary_
+        Author and publisher names by id for the search keys, loaded once per batch for unseen ids.
+    """
+
+    def __init__(self):
+        self.authors: dict[uuid.UUID, str] = {}
+        self.publishers: dict[uuid.UUID, str] = {}
+
+    async def load(self, books: list[CreateBook], conn: AsyncConnection):
+        author_ids = {id for book in books for id in book.authors} - self.authors.keys()
+        publisher_ids = {book.publisher_id for book in books if book.publisher_id} - self.publishers.keys()
+        if author_ids:
+            self.authors.update((await conn.execute(select(Author.id, Author.name).where(Author.id.in_(author_ids)))).tuples())
+        if publisher_ids:
+            self.publishers.update((await conn.execute(select(Publisher.id, Publisher.name).where(Publisher.id.in_(publisher_ids)))).tuples())
+
+    def search_keys(self, book: CreateBook) -> str:
+        return bangla.search_keys(book.name, *(self.authors.get(id) for id in book.authors),
+                                  self.publishers.get(book.publisher_id) if book.publisher_id else None)
+
+
+def staging_record(row: int, book: CreateBook, names: Names) -> tuple:
+    values: dict[str, Any] = book.model_dump(exclude=set(LINKS))
+    values['id'] = uuid.uuid4()
+    values['slug'] = slugify(book.slug)
+    values['search_keys'] = names.search_keys(book)
+    for column in BOOK_COLUMNS:
+        if isinstance(column.type, Enum) and values[column.name] is not None:
+            values[column.name] = values[column.name].name
+    return (row, None, None, *(values[column.name] for column in BOOK_COLUMNS), *(getattr(book, field) for field in LINKS))
+
+
+def missing_reference(ids: Any, model: Any) -> Any:
+    ref = func.unnest(ids).table_valued('id').render_derived()
+    return select(ref.c.id).where(~select(model.id).where(model.id == ref.c.id).exists()).exists()
+
+
+async def mark_rows(staging: Table, conn: AsyncConnection):
+    """_summary_
+        Set based validation of the staged rows, the first failing check sets the status of a row.
+    """
+    pending = staging.c.status.is_(None)
+    first_rows = select(func.min(staging.c.row)).group_by(staging.c.sku)
+    checks = [
+        (staging.c.row.not_in(first_rows), BulkStatus.duplicate, 'Duplicate sku in payload'),
+        (select(Book.id).where(Book.sku == staging.c.sku).exists(), BulkStatus.exists, 'Book with sku already exists'),
+        (staging.c.publisher_id.is_not(None) & ~select(Publisher.id).where(Publisher.id == staging.c.publisher_id).exists(),
+         BulkStatus.not_found, 'Publisher not found'),
+        *((missing_reference(staging.c[field], model), BulkStatus.not_found, '{} not found'.format(model.__name__))
+          for field, (_, _, model) in LINKS.items()),
+        (select(book_image_link.c.image_id).where(book_image_link.c.image_id == any_(staging.c.images)).exists(),
+         BulkStatus.invalid, 'Image already belongs to a book'),
+    ]
+    for condition, status, detail in checks:
+        await conn.execute(update(staging).where(pending, condition).values(status=status.value, detail=detail))
+    await conn.execute(update(staging).where(pending).values(status=BulkStatus.created.value))
+
+
+async def insert_staged(staging: Table, db: AsyncSession):
+    created = staging.c.status == BulkStatus.created.value
+    columns = [staging.c[column.name] if not isinstance(column.type, Enum) else cast(staging.c[column.name], column.type)
+               for column in BOOK_COLUMNS]
+    await db.execute(insert(Book).from_select(
+        [column.name for column in BOOK_COLUMNS] + ['created_at', 'updated_at'],
+        select(*columns, func.now(), func.now()).where(created)))
+
+    for field, (table, column, _) in LINKS.items():
+        ref = func.unnest(staging.c[field]).table_valued('id').render_derived()
+        await db.execute(pg_insert(table).from_select(
+            ['book_id', column], select(staging.c.id, ref.c.id).select_from(staging).join(ref, true()).where(created)
+        ).on_conflict_do_nothing())
+
+    # Core inserts skip the flush listener that fills search_text
+    await db.execute(refresh_book_search_text(Book.id.in_(select(staging.c.id).where(created)))
+                     .execution_options(synchronize_session=False))
+
+
+async def copy_books(chunks: AsyncIterator[bytes], db: AsyncSession) -> dict:
+    """_summary_
+        Streams NDJSON books into a temporary staging table with COPY, validates them set based and inserts
+        the valid rows into books and the link tables with one statement each. Only a batch of rows is held in memory.
+    Args:
+        chunks (AsyncIterator[bytes]): Request body, one CreateBook json per line
+        db (AsyncSession): Database session
+    Returns:
+        dict: Per row status (BulkBookResult)
+    """
+    start = time.perf_counter()
+    conn = await db.connection()
+    staging = staging_table()
+    await conn.run_sync(staging.create)
+    driver = (await conn.get_raw_connection()).driver_connection
+    columns = [column.name for column in staging.c]
+
+    names = Names()
+    rows: list[dict] = []
+    batch: list[tuple[int, CreateBook]] = []
+    total = 0
+
+    async def copy_batch():
+        await names.load([book for _, book in batch], conn)
+        await driver.copy_records_to_table(  # type: ignore
+            staging.name, records=[staging_record(row, book, names) for row, book in batch], columns=columns)
+        batch.clear()
+
+    async for line in ndjson_lines(chunks):
+        if not line.strip():
+            continue
+        total += 1
+        try:
+            batch.append((total, CreateBook.model_validate_json(line)))
+        except ValidationError as exc:
+            rows.append({'row': total, 'sku': payload_sku(line), 'status': BulkStatus.invalid, 'detail': validation_detail(exc)})
+        if len(batch) >= settings.BULK_COPY_BATCH:
+            await copy_batch()
+    if batch:
+        await copy_batch()
+
+    await mark_rows(staging, conn)
+    await insert_staged(staging, db)
+    staged = select(staging.c.row, staging.c.sku, staging.c.status, staging.c.detail,
+                    case((staging.c.status == BulkStatus.created.value, staging.c.id)).label('id'))
+    rows.extend(dict(row) for row in (await conn.execute(staged)).mappings())
+    await db.commit()
+
+    rows.sort(key=lambda row: row['row'])
+    created = sum(row['status'] == BulkStatus.created for row in rows)
+    elapsed = time.perf_counter() - start
+    logger.info('{}/{} books copied in {:.2f} sec'.format(created, total, elapsed))
+    return {
+        'total': total,
+        'created': created,
+        'elapsed': elapsed,
+        'rows_per_sec': total / elapsed if elapsed else 0,
+        'rows': rows,
+    }
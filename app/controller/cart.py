@@ -56,8 +56,9 @@ async def verify_stock(payload: dict[str, Any], db: AsyncSession):
             raise BadRequestException(
                 "Book '{}' is out of stock".format(book.name), str(book.id))
 
-        if book.manage_stock and book.quantity < item['quantity']:
+        # Copies held for pending payments are not available
+        if book.manage_stock and book.quantity - book.held < item['quantity']:
             raise BadRequestException(
-                "Book '{}' has only {} in stock".format(book.name, book.quantity), str(book.id))
+                "Book '{}' has only {} in stock".format(book.name, max(book.quantity - book.held, 0)), str(book.id))
 
     return {"status": "ok"}
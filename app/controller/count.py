@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import traceback
+from typing import Union
+
+from sqlalchemy import Select, Table, func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import visitors
+
+from app.config.database import Writes, on_commit
+from app.config.redis import cache
+from app.config.settings import settings
+from app.constant import CountMode
+from app.controller.exception import UnhandledException
+from app.controller.redis import redis_available, redis_failed
+
+logger = logging.getLogger(__name__)
+
+dialect = postgresql.dialect()
+
+
+def query_tables(query: Union[Query, Select]) -> set[str]:
+    return {element.name for element in visitors.iterate(query) if isinstance(element, Table)}
+
+
+def count_statement(query: Union[Query, Select]) -> Select:
+    query = query.order_by(None).limit(None).offset(None)
+    if query._distinct:
+        return select(func.count()).select_from(query.subquery())
+    return query.with_only_columns(func.count(), maintain_column_froms=True)
+
+
+async def exact_count(query: Union[Query, Select], db: AsyncSession) -> int:
+    try:
+        return (await db.scalar(count_statement(query))) or 0
+    except Exception:
+        logger.error(traceback.format_exc())
+        raise UnhandledException()
+
+
+async def cached_count(query: Union[Query, Select], db: AsyncSession) -> int:
+    """Exact count cached in redis. The key holds the compiled query and the write version of every table it reads, so a commit touching any of them makes the entry unreachable.
+    """
+    if not redis_available():
+        return await exact_count(query, db)
+
+    tables = sorted(query_tables(query))
+    compiled = count_statement(query).compile(dialect=dialect)
+    try:
+        versions = await cache.mget(['count:version:{}'.format(table) for table in tables]) if tables else []
+        digest = hashlib.sha1(json.dumps([str(compiled), compiled.params, tables, versions],
+                                         sort_keys=True, default=str).encode()).hexdigest()
+        key = 'count:{}'.format(digest)
+        cached = await cache.get(key)
+    except Exception:
+        redis_failed()
+        return await exact_count(query, db)
+
+    if cached is not None:
+        return int(cached)
+
+    count = await exact_count(query, db)
+    try:
+        await cache.set(key, count, ex=settings.COUNT_CACHE_TTL)
+    except Exception:
+        redis_failed()
+    return count
+
+
+async def estimated_count(query: Union[Query, Select], db: AsyncSession) -> int:
+    """Planner estimate, from pg_class.reltuples for an unfiltered table or from the EXPLAIN row estimate otherwise.
+    Estimates below COUNT_ESTIMATE_THRESHOLD, or unknown ones, fall back to an exact count.
+    """
+    froms = query.get_final_froms()
+    try:
+        if query.whereclause is None and not query._distinct and len(froms) == 1 and isinstance(froms[0], Table):
+            estimate = await db.scalar(text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)'),
+                                       {'table': froms[0].fullname})
+        else:
+            conn = await db.connection()
+            # Compiled for the driver in use, pyformat dialects would double the % in literals
+            sql = query.order_by(None).limit(None).offset(None).compile(
+                dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+            async with conn.begin_nested():
+                plan = (await conn.exec_driver_sql('EXPLAIN (FORMAT JSON) {}'.format(sql))).scalar_one()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            estimate = plan[0]['Plan']['Plan Rows']
+    except Exception:
+        logger.warning('Count estimate failed, counting exactly: {}'.format(traceback.format_exc(limit=1)))
+        return await exact_count(query, db)
+
+    if estimate is None or estimate < settings.COUNT_ESTIMATE_THRESHOLD:
+        return await exact_count(query, db)
+    return int(estimate)
+
+
+async def get_count(query: Union[Query, Select], db: AsyncSession, mode: CountMode = CountMode.exact) -> int:
+    """_summary_
+
+    Args:
+        query: Filtered select of the listing, without pagination
+        mode: exact runs count(*), cached reuses a redis entry until the tables are written, estimate asks the planner
+
+    Returns:
+        int: Total number of rows matched by the query
+    """
+    if mode == CountMode.cached:
+        return await cached_count(query, db)
+    elif mode == CountMode.estimate:
+        return await estimated_count(query, db)
+    return await exact_count(query, db)
+
+
+@on_commit
+async def invalidate_counts(writes: Writes):
+    if not redis_available():
+        return
+    try:
+        async with cache.pipeline(transaction=False) as pipe:
+            for table in writes.tables:
+                pipe.incr('count:version:{}'.format(table))
+            await pipe.execute()
+    except Exception:
+        redis_failed()
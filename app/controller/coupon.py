@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
+from sqlalchemy import select, or_
 from sqlalchemy.orm import selectinload
 from typing import Sequence
 from uuid import UUID
@@ -8,6 +8,8 @@ from datetime import timezone, datetime
 
 from app.models.coupon import Coupon
 from app.models import Book, Publisher, Author, Category, Tag, User, Courier
+import app.controller.count as count_service
+from app.constant import CountMode
 from app.controller.exception import NotFoundException, ConflictException
 from app.filter_schema.coupon import CouponFilter
 
@@ -68,11 +70,9 @@ async def get_suggested_coupons(page: int, per_page: int, db: AsyncSession) -> S
     return result.scalars().unique().all()
 
 
-async def count_coupon(filter: CouponFilter, db: AsyncSession) -> int:
-    stmt = select(func.count()).select_from(Coupon)
-    stmt = filter.filter(stmt)
-    result = await db.execute(stmt)
-    return result.scalar_one()
+async def count_coupon(filter: CouponFilter, db: AsyncSession, count_mode: CountMode = CountMode.exact) -> int:
+    stmt = filter.filter(select(Coupon))
+    return await count_service.get_count(stmt, db, count_mode)
 
 
 async def create_coupon(payload: dict, db: AsyncSession) -> Coupon:
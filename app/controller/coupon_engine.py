@@ -0,0 +1,121 @@
+import uuid
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constant.condition import Condition
+from app.models import Book, Coupon, OrderItem, book_tag_link
+from app.models.author import book_author_link
+from app.models.category import book_category_link
+
+Ids = frozenset[uuid.UUID]
+
+# Link table and column of the relation ids of a book
+LINKS = {
+    'authors': (book_author_link, book_author_link.c.author_id),
+    'categories': (book_category_link, book_category_link.c.category_id),
+    'tags': (book_tag_link, book_tag_link.c.tag_id),
+}
+
+
+def ids(objects: Iterable) -> Ids:
+    return frozenset(obj.id for obj in objects)
+
+
+@dataclass(frozen=True)
+class CompiledCoupon:
+    include_conditions: frozenset[Condition]
+    include_books: Ids
+    include_publishers: Ids
+    include_authors: Ids
+    include_categories: Ids
+    include_tags: Ids
+    exclude_books: Ids
+    exclude_publishers: Ids
+    exclude_authors: Ids
+    exclude_categories: Ids
+    exclude_tags: Ids
+    exclude_couriers: Ids
+
+    def relations(self) -> list[str]:
+        # Relations of the books the rules need, the others are not loaded
+        return [name for name in LINKS
+                if getattr(self, 'include_' + name) or getattr(self, 'exclude_' + name)]
+
+
+@dataclass(frozen=True)
+class BookRelations:
+    id: uuid.UUID
+    condition: Condition
+    publisher_id: uuid.UUID | None
+    authors: Ids = frozenset()
+    categories: Ids = frozenset()
+    tags: Ids = frozenset()
+
+
+def compile_coupon(coupon: Coupon) -> CompiledCoupon:
+    """_summary_
+        Rules of a coupon loaded by app.controller.coupon.query as id sets, built once per evaluation
+    """
+    return CompiledCoupon(
+        include_conditions=frozenset(coupon.include_conditions or []),
+        include_books=ids(coupon.include_books),
+        include_publishers=ids(coupon.include_publishers),
+        include_authors=ids(coupon.include_authors),
+        include_categories=ids(coupon.include_categories),
+        include_tags=ids(coupon.include_tags),
+        exclude_books=ids(coupon.exclude_books),
+        exclude_publishers=ids(coupon.exclude_publishers),
+        exclude_authors=ids(coupon.exclude_authors),
+        exclude_categories=ids(coupon.exclude_categories),
+        exclude_tags=ids(coupon.exclude_tags),
+        exclude_couriers=ids(coupon.exclude_couriers),
+    )
+
+
+async def relation_ids(book_ids: set[uuid.UUID], relations: list[str], db: AsyncSession) -> dict[uuid.UUID, dict[str, Ids]]:
+    """_summary_
+        Loads the relation ids of every book of the cart in one query, an array per relation
+    Args:
+        book_ids (set[UUID]): Books of the cart
+        relations (list[str]): Names of LINKS to load, CompiledCoupon.relations()
+        db (AsyncSession): Database session
+    Returns:
+        dict[UUID, dict[str, Ids]]: Ids per relation by book id
+    """
+    arrays = []
+    for name in relations:
+        link, column = LINKS[name]
+        arrays.append(select(func.array_agg(column)).where(link.c.book_id == Book.id).scalar_subquery().label(name))
+    rows = await db.execute(select(Book.id, *arrays).where(Book.id.in_(book_ids)))
+    return {row.id: {name: frozenset(getattr(row, name) or []) for name in relations} for row in rows}
+
+
+def eligible(coupon: CompiledCoupon, book: BookRelations) -> bool:
+    if coupon.include_conditions and book.condition not in coupon.include_conditions:
+        return False
+    if coupon.include_books and book.id not in coupon.include_books:
+        return False
+    if coupon.include_publishers and book.publisher_id not in coupon.include_publishers:
+        return False
+    if coupon.include_authors and coupon.include_authors.isdisjoint(book.authors):
+        return False
+    if coupon.include_categories and coupon.include_categories.isdisjoint(book.categories):
+        return False
+    if coupon.include_tags and coupon.include_tags.isdisjoint(book.tags):
+        return False
+
+    return (book.id not in coupon.exclude_books
+            and book.publisher_id not in coupon.exclude_publishers
+            and coupon.exclude_authors.isdisjoint(book.authors)
+            and coupon.exclude_categories.isdisjoint(book.categories)
+            and coupon.exclude_tags.isdisjoint(book.tags))
+
+
+async def eligible_items(coupon: CompiledCoupon, items: list[OrderItem], db: AsyncSession) -> list[OrderItem]:
+    relations = coupon.relations()
+    loaded = await relation_ids({item.book.id for item in items}, relations, db) if relations and items else {}
+    return [item for item in items if eligible(coupon, BookRelations(
+        item.book.id, item.book.condition, item.book.publisher_id, **loaded.get(item.book.id, {})))]
@@ -4,26 +4,34 @@ import logging
 import os
 import time
 import traceback
+import unicodedata
 from typing import Any
+from uuid import UUID, uuid4
 
-import httpx
 import pandas as pd
 from fastapi import BackgroundTasks, UploadFile
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, HttpUrl
-from sqlalchemy import select, delete
+from pydantic import ValidationError
+from sqlalchemy import Table, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
-import unicodedata
+from sqlalchemy.orm import selectinload
 
 import app.controller.email as email_service
 import app.library.s3 as s3
+from app.config.settings import settings
 from app.constant import ImageFolder
 from app.controller.book import get_all_books
 from app.controller.exception import BadRequestException, NotFoundException
-from app.controller.utility import is_filename, unique_slug
+from app.controller.image_import import image_refs, import_images
+from app.controller.search import refresh_book_search_text
+from app.controller.utility import unique_slugs
 from app.filter_schema.book import BookFilter
-from app.models import Author, Book, Category, Image, Publisher, Tag, User
+from app.library import bangla
+from app.models import Author, Book, Category, Image, Publisher, Tag, User, book_tag_link
+from app.models.author import book_author_link, book_translator_link
+from app.models.book import book_image_link
+from app.models.category import book_category_link
 from app.pydantic_schema.author import CreateAuthor
 from app.pydantic_schema.book import CreateBook, UpdateBook
 from app.pydantic_schema.category import CreateCategory
@@ -41,15 +49,6 @@ query_selectinload = select(Book).options(
     selectinload(Book.tags)
 )
 
-query_joinedload = select(Book).options(
-    joinedload(Book.publisher),
-    joinedload(Book.authors),
-    joinedload(Book.translators),
-    joinedload(Book.categories),
-    joinedload(Book.images),
-    joinedload(Book.tags)
-)
-
 db_cols = Book.__table__.columns.keys(
 ) + ['authors', 'translators', 'publisher', 'categories', 'tags', 'images']
 reqd_cols = {'sku', 'name', 'slug', 'authors', 'publisher', 'regular_price', 'sale_price', 'quantity', 'manage_stock', 'in_stock', 'is_used',
@@ -98,76 +97,245 @@ async def export_books_to_csv(filter: BookFilter, page: int, per_page: int, db:
     return response, count
 
 
-async def find_or_create_relation(name_str: str | None, slug_str: str | None,
-                                  schema: Any,
-                                  cls: Any, db: AsyncSession):
+# Relation column -> (model, create schema, link table, link column), publisher is a foreign key
+relations: dict[str, tuple[Any, Any, Table | None, str | None]] = {
+    'authors': (Author, CreateAuthor, book_author_link, 'author_id'),
+    'translators': (Author, CreateAuthor, book_translator_link, 'translator_id'),
+    'categories': (Category, CreateCategory, book_category_link, 'category_id'),
+    'tags': (Tag, CreateTag, book_tag_link, 'tag_id'),
+    'publisher': (Publisher, CreatePublisher, None, None),
+}
+book_cols = [col.name for col in Book.__table__.columns
+             if col.name in CreateBook.model_fields or col.name == 'id']
+
+
+def parse_names(name_str: str | None, slug_str: str | None) -> dict[str, str | None]:
+    """_summary_
+    Args:
+        name_str (str | None): '|' separated names (e.g. 'আতিউর রহমান | Motin')
+        slug_str (str | None): '|' separated slugs of the names, optional
+    Returns:
+        dict[str, str | None]: NFC normalized name to its slug (e.g. {'আতিউর রহমান': None, 'Motin': None})
+    """
     if not name_str:
-        return []
-
-    if isinstance(slug_str, float):
-        print("slug str debug:", name_str, slug_str)
-    slug = {name.strip(): slug.strip() for name, slug in zip(
-        name_str.split('|'), slug_str.split('|'))} if slug_str else {}
-    items = []
-    for name in name_str.split('|'):
-        name = unicodedata.normalize('NFC', name).strip()
-        if name:
-            entity = await db.scalar(select(cls).filter(cls.name == name))
-            if entity:
-                items.append(entity)
-            else:
-                pydantic_item = schema(name=name, slug=(await unique_slug(slug.get(name) or name, cls, db)))
-                new_item = cls(**pydantic_item.model_dump())
-                items.append(new_item)
-    return items
+        return {}
+    names = [unicodedata.normalize('NFC', name).strip()
+             for name in name_str.split('|')]
+    slugs = [slug.strip() for slug in slug_str.split('|')] if isinstance(slug_str, str) else []
+    slug = dict(zip(names, slugs))
+    return {name: slug.get(name) for name in names if name}
 
 
-class URLModel(BaseModel):
-    url: HttpUrl
+async def find_or_create_relations(wanted: dict[str, str | None], schema: Any, cls: Any,
+                                   db: AsyncSession) -> tuple[dict[str, UUID], dict[str, str]]:
+    """_summary_
+        Resolves the names of a whole chunk with one IN query and inserts the missing ones in bulk.
+    Args:
+        wanted (dict[str, str | None]): Name to its slug from the CSV
+        schema (Any): Create schema (e.g. CreateAuthor)
+        cls (Any): Model (e.g. Author)
+    Returns:
+        tuple[dict[str, UUID], dict[str, str]]: Id of every name and the validation error of names that can't be created
+    """
+    if not wanted:
+        return {}, {}
+    ids: dict[str, UUID] = {}
+    for name, id in (await db.execute(select(cls.name, cls.id).where(cls.name.in_(wanted)))).tuples():
+        ids.setdefault(name, id)
+
+    missing = [name for name in wanted if name not in ids]
+    if not missing:
+        return ids, {}
+    slugs = await unique_slugs([wanted[name] or name for name in missing], cls, db)
+
+    rows, errors = [], {}
+    for name, slug in zip(missing, slugs):
+        try:
+            rows.append({'id': uuid4(), **schema(name=name, slug=slug).model_dump(include=set(cls.__table__.columns.keys()))})
+            ids[name] = rows[-1]['id']
+        except ValidationError as e:
+            errors[name] = str(e)
+    if rows:
+        await db.execute(insert(cls), rows)
+    return ids, errors
 
 
-async def download(url: str) -> bytes | None:
-    async with httpx.AsyncClient() as client:
+async def delete_uploaded_images(images: list[dict]):
+    for image in images:
         try:
-            res = await client.get(url)
-            return res.content
+            await s3.delete_file(image['name'], image['folder'])
         except Exception:
-            return None
+            pass
+
+
+async def refresh_search_keys(book_ids: list[UUID], db: AsyncSession):
+    author_names = select(func.array_agg(Author.name)).select_from(book_author_link).join(
+        Author, Author.id == book_author_link.c.author_id).where(book_author_link.c.book_id == Book.id).scalar_subquery()
+    stmt = select(Book.id, Book.name, Publisher.name, author_names).outerjoin(
+        Publisher, Publisher.id == Book.publisher_id).where(Book.id.in_(book_ids))
+    keys = [{'id': id, 'search_keys': bangla.search_keys(name, *(authors or []), publisher)}
+            for id, name, publisher, authors in (await db.execute(stmt)).tuples()]
+    if keys:
+        await db.execute(update(Book), keys)
+    # Statements skip the flush listener that fills search_text
+    await db.execute(refresh_book_search_text(Book.id.in_(book_ids)).execution_options(synchronize_session=False))
+
+
+async def process_chunk(chunk: pd.DataFrame, db: AsyncSession, insert_outofstock: bool) -> dict[str, str]:
+    """_summary_
+        Validates the rows of a chunk, resolves their relations with a few IN queries and writes them with one
+        INSERT ... ON CONFLICT (sku) DO UPDATE, one DELETE and INSERT per link table and one commit. A row
+        the database rejects fails alone, the rest of the chunk is written (see write_books_in_halves).
+    Args:
+        chunk (pd.DataFrame): Rows indexed by sku
+        db (AsyncSession): Session Object
+        insert_outofstock (bool): Insert new books that are out of stock
+    Returns:
+        dict[str, str]: Status by sku
+    """
+    status: dict[str, str] = {}
+    existing = {row['sku']: dict(row) for row in (await db.execute(
+        select(*(Book.__table__.c[col] for col in book_cols)).where(Book.sku.in_(chunk.index.tolist())))).mappings()}
 
+    # Validate, relations are resolved for the valid rows only
+    books: dict[str, tuple[dict, dict[str, dict[str, str | None]], str | None]] = {}
+    for idx, row in chunk.iterrows():
+        try:
+            payload = row.dropna().to_dict()
 
-async def upload_images(images: str | None, db: AsyncSession) -> list[Image]:
-    if not images:
-        return []
-    folder = ImageFolder.new_book.value  # 'new_book' For internet images
-    items = []
-    for val in images.split('|'):
-        if not val.strip():
+            # Check if the book is out of stock and creating out of stock is disabled
+            if idx not in existing and insert_outofstock is False and payload['in_stock'] is False:
+                status[idx] = 'ignored inserting out of stock product'  # type: ignore
+                continue
+
+            names = {field: parse_names(payload.pop(field, None), payload.get(f'{field}_slug'))
+                     for field in relations}
+            images = payload.pop('images', None)
+            if idx in existing:
+                values = {**existing[idx], **UpdateBook(**payload).model_dump(exclude_unset=True)}
+            else:
+                values = {'id': uuid4(), **CreateBook(**payload).model_dump(include=set(book_cols))}
+            books[idx] = (values, names, images)  # type: ignore
+        except Exception as e:
+            logger.debug(f'{traceback.format_exc()}')
+            status[idx] = 'error: {}: {}'.format(e.__class__, str(e))  # type: ignore
+
+    ids: dict[Any, dict[str, UUID]] = {}
+    for field, (cls, schema, _, _) in relations.items():
+        wanted = {name: slug for _, names, _ in books.values()
+                  for name, slug in names[field].items()}
+        wanted = {name: slug for name, slug in wanted.items() if name not in ids.get(cls, {})}
+        found, errors = await find_or_create_relations(wanted, schema, cls, db)
+        ids.setdefault(cls, {}).update(found)
+        for sku, (_, names, _) in list(books.items()):
+            if invalid := errors.keys() & names[field].keys():
+                status[sku] = 'error: invalid {} {}: {}'.format(field, ', '.join(invalid), errors[invalid.pop()])
+                del books[sku]
+
+    filenames = [filename for _, _, val in books.values() for _, filename in image_refs(val)]
+    existing_images = set((await db.scalars(select(Image.name).where(
+        Image.folder == ImageFolder.new_book.value, Image.name.in_(filenames)))).all()) if filenames else set()
+    images, errors = await import_images({sku: val for sku, (_, _, val) in books.items()}, existing_images)
+    for sku, error in errors.items():
+        status[sku] = error
+        del books[sku]
+
+    if not books:
+        await db.commit()
+        return status
+
+    written, errors = await write_books_in_halves(books, existing, ids, images, db)
+    try:
+        await db.commit()
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        await db.rollback()
+        await delete_uploaded_images([image for sku in written for image in images[sku]])
+        errors.update({sku: 'error: {}: {}'.format(e.__class__, str(e)) for sku in written})
+        written = []
+
+    status.update(errors)
+    for sku in written:
+        status[sku] = 'successfully updated' if sku in existing else 'successfully inserted'
+    return status
+
+
+async def write_books(books: dict[str, tuple[dict, dict[str, dict[str, str | None]], str | None]],
+                      existing: dict[str, dict], ids: dict[Any, dict[str, UUID]], images: dict[str, list[dict]],
+                      db: AsyncSession):
+    rows = []
+    for values, names, _ in books.values():
+        if names['publisher']:
+            values['publisher_id'] = ids[Publisher][next(iter(names['publisher']))]
+        rows.append({col: values.get(col) for col in book_cols})
+    book_ids = [values['id'] for values, _, _ in books.values()]
+
+    stmt = pg_insert(Book)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[Book.sku],
+        set_={**{col: stmt.excluded[col] for col in book_cols if col not in ('id', 'sku')}, 'updated_at': func.now()}
+    ), rows)
+
+    # Old images of updated books, the images trigger queues their files for deletion from s3
+    replaced = [values['id'] for sku, (values, _, _) in books.items() if sku in existing and images[sku]]
+    if replaced:
+        await db.execute(delete(Image).where(Image.id.in_(
+            select(book_image_link.c.image_id).where(book_image_link.c.book_id.in_(replaced)))))
+    uploaded = [image for sku in books for image in images[sku]]
+    if uploaded:
+        await db.execute(insert(Image), uploaded)
+        await db.execute(insert(book_image_link), [
+            {'book_id': books[sku][0]['id'], 'image_id': image['id']}
+            for sku in books for image in images[sku]])
+
+    # Relations of updated books are replaced only when the row has them, like a missing column
+    for field, (cls, _, table, col) in relations.items():
+        if table is None or col is None:
             continue
+        replaced = [values['id'] for sku, (values, names, _) in books.items()
+                    if sku in existing and names[field]]
+        if replaced:
+            await db.execute(delete(table).where(table.c.book_id.in_(replaced)))
+        links = [{'book_id': values['id'], col: ids[cls][name]}
+                 for values, names, _ in books.values() for name in names[field]]
+        if links:
+            await db.execute(pg_insert(table).on_conflict_do_nothing(), links)
 
-        if is_filename(val):
-            is_exists = await s3.is_file_exists(filename=val, folder=folder)
-            assert is_exists, 'error: {} not found in s3'.format(val)
+    await refresh_search_keys(book_ids, db)
 
-            img = await db.scalar(select(Image).filter(Image.name == val, Image.folder == folder))
-            if not img:
-                items.append(Image(name=val, folder=folder))
-        else:
-            URLModel(url=val)  # type: ignore # Validate URL
-            filename = val.split('/')[-1]
 
-            img = await db.scalar(select(Image).filter(Image.name == filename, Image.folder == folder))
-            if not img:
-                blob = await download(val)
-                assert blob, 'error: {} download failed'.format(val)
-                key = await s3.upload_file(blob, filename, folder)
-                assert key, 'error: image upload failed'
-                items.append(Image(name=filename, folder=folder))
-    return items
+async def write_books_in_halves(books: dict[str, tuple[dict, dict[str, dict[str, str | None]], str | None]],
+                                existing: dict[str, dict], ids: dict[Any, dict[str, UUID]],
+                                images: dict[str, list[dict]], db: AsyncSession) -> tuple[list[str], dict[str, str]]:
+    """_summary_
+        Writes the books in a savepoint. When a statement fails the savepoint is rolled back and each half is
+        retried, so only the failing rows get the error and the relations created for the chunk are kept.
+    Returns:
+        tuple[list[str], dict[str, str]]: Skus written and the error of the skus that failed
+    """
+    try:
+        async with db.begin_nested():
+            await write_books(books, existing, ids, images, db)
+        return list(books), {}
+    except Exception as e:
+        if len(books) > 1:
+            logger.debug(traceback.format_exc())
+            skus = list(books)
+            written, errors = [], {}
+            for half in (skus[:len(skus) // 2], skus[len(skus) // 2:]):
+                ok, failed = await write_books_in_halves({sku: books[sku] for sku in half}, existing, ids, images, db)
+                written.extend(ok)
+                errors.update(failed)
+            return written, errors
+
+        logger.error(traceback.format_exc())
+        await delete_uploaded_images([image for sku in books for image in images[sku]])
+        return [], {sku: 'error: {}: {}'.format(e.__class__, str(e)) for sku in books}
 
 
 async def process_dataframe(df: pd.DataFrame, db: AsyncSession, email: str | None = None, insert_outofstock: bool = True):
     """_summary_
-        Inserts or updates the books in the database.
+        Inserts or updates the books in the database, CSV_CHUNK_SIZE rows at a time.
 
     Args:
         df (pd.DataFrame): Dataframe
@@ -182,75 +350,9 @@ async def process_dataframe(df: pd.DataFrame, db: AsyncSession, email: str | Non
     df.set_index('sku', inplace=True, drop=False)
     df['status'] = ''
 
-    for idx, row in df.iterrows():
-        try:
-            payload = row.dropna().to_dict()
-            _book = await db.scalar(query_joinedload.filter(Book.sku == idx))
-
-            # Check if the book is out of stock and creating out of stock is disabled
-            if (not _book) and insert_outofstock is False and payload['in_stock'] is False:
-                df.at[idx, 'status'] = 'ignored inserting out of stock product'
-                continue
-
-            authors = await find_or_create_relation(payload.pop('authors', None),
-                                                    payload.get('authors_slug'), CreateAuthor, Author, db)
-            translators = await find_or_create_relation(payload.pop('translators', None),
-                                                        payload.get('translators_slug'), CreateAuthor, Author, db)
-            categories = await find_or_create_relation(payload.pop('categories', None),
-                                                       payload.get('categories_slug'), CreateCategory, Category, db)
-            tags = await find_or_create_relation(payload.pop('tags', None),
-                                                 payload.get('tags_slug'), CreateTag, Tag, db)
-            publisher = await find_or_create_relation(payload.pop('publisher', None),
-                                                      payload.get('publisher_slug'), CreatePublisher, Publisher, db)
-            images = await upload_images(payload.pop('images', None), db)
-
-            if _book:
-                # Update
-                pydantic_book = UpdateBook(**payload)
-                for key, val in pydantic_book.model_dump(exclude_unset=True).items():
-                    setattr(_book, key, val)
-                if authors:
-                    _book.authors = authors
-                if translators:
-                    _book.translators = translators
-                if categories:
-                    _book.categories = categories
-                if tags:
-                    _book.tags = tags
-                if publisher:
-                    _book.publisher = publisher[0]
-                if images:
-                    _book.images = images
-
-                await db.commit()
-                df.at[idx, 'status'] = 'successfully updated'  # type: ignore
-            else:
-                # Insert
-                pydantic_book = CreateBook(**payload)
-                book = Book(**pydantic_book.model_dump())
-                book.authors = authors
-                book.translators = translators
-                book.categories = categories
-                book.tags = tags
-                if publisher:
-                    book.publisher = publisher[0]
-                book.images = images
-
-                db.add(book)
-                await db.commit()
-                df.at[idx, 'status'] = 'successfully inserted'
-        except Exception as e:
-            logger.debug(f'{traceback.format_exc()}')
-            df.at[idx, 'status'] = 'error: {}: {}'.format(  # type: ignore
-                e.__class__, str(e))
-
-            # Remove uploaded images
-            try:
-                if isinstance(images[0], Image):
-                    for image in images:
-                        await s3.delete_file(image.name, image.folder)
-            except Exception:
-                pass
+    for start in range(0, len(df), settings.CSV_CHUNK_SIZE):
+        status = await process_chunk(df.iloc[start:start + settings.CSV_CHUNK_SIZE], db, insert_outofstock)
+        df.loc[list(status), 'status'] = list(status.values())
 
     et = time.strftime("%H:%M:%S", time.gmtime(time.time() - st))
     count = df['status'].value_counts().to_dict()
@@ -1,85 +1,119 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping
 
-from sqlalchemy import Integer, func, not_, select
+from sqlalchemy import Numeric, Select, String, cast, func, select, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Book, Order, Tag, book_tag_link
+from app.config.settings import settings
+from app.constant import Condition, Granularity, InventoryDimension, StockLocation
+from app.controller import inventory_valuation, order_rollup
+from app.controller.order_rollup import AMOUNTS
+from app.models import Order, Tag
 
 logger = logging.getLogger(__name__)
 
 
-async def order_analysis(from_date: datetime | None, to_date: datetime | None, db: AsyncSession) -> dict:
-    query = select(
-        func.count(Order.id),
-        func.sum(Order.total),
-        func.sum(Order.new_book_total),
-        func.sum(Order.old_book_total),
-        func.sum(Order.cost_of_good_new),
-        func.sum(Order.cost_of_good_old),
-        func.sum(Order.shipping_charge),
-        func.sum(Order.weight_charge)
-    )
-
-    if from_date and to_date:
-        query = query.filter(Order.created_at.between(from_date, to_date))
-    elif from_date:
-        query = query.filter(Order.created_at >= from_date)
-    elif to_date:
-        query = query.filter(Order.created_at <= to_date)
+HOUR = timedelta(hours=1)
 
-    logger.debug(f'Query: {query}')
 
-    result = (await db.execute(query))
-    (
-        total_order,
-        order_value,
-        order_value_new_book,
-        order_value_old_book,
-        cog_new_book,
-        cog_old_book,
-        shipping_charge,
-        weight_charge
-    ) = result.all()[0]
+def utc(date: datetime) -> datetime:
+    return date.replace(tzinfo=timezone.utc) if date.tzinfo is None else date.astimezone(timezone.utc)
+
+
+def floor_hour(date: datetime) -> datetime:
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(date: datetime) -> datetime:
+    floor = floor_hour(date)
+    return floor if floor == date else floor + HOUR
+
+
+def orders_by_hour(*where: Any) -> Select:
+    bucket = func.date_trunc('hour', Order.created_at, 'UTC')
+    return select(bucket.label('bucket'), func.count(Order.id).label('total_order'),
+                  *[func.sum(cast(getattr(Order, name), Numeric)).label(name) for name in AMOUNTS]
+                  ).where(*where).group_by(bucket)
+
+
+def hourly_totals(from_date: datetime | None, to_date: datetime | None) -> Select:
+    """_summary_
+        Order totals per UTC hour of the range, whole hours from the order_rollups table and only the hours
+        the range starts or ends within from the orders themselves.
+    """
+    start = ceil_hour(from_date) if from_date else None
+    end = floor_hour(to_date) if to_date else None
+    if from_date and to_date and start >= end:  # type: ignore
+        return orders_by_hour(Order.created_at.between(from_date, to_date))
+
+    parts = [order_rollup.hourly(start, end)]
+    if from_date and from_date < start:  # type: ignore
+        parts.append(orders_by_hour(Order.created_at >= from_date, Order.created_at < start))
+    if to_date:
+        parts.append(orders_by_hour(Order.created_at >= end, Order.created_at <= to_date))
+    return union_all(*parts)  # type: ignore
 
+
+def analysis(totals: Mapping[str, Any]) -> dict:
+    amounts = {name: float(totals[name] or 0) for name in AMOUNTS}
+    total_order = int(totals['total_order'] or 0)
     return {
         'total_order': total_order,
-        'order_value': order_value or 0,
-        'order_value_new_book': order_value_new_book or 0,
-        'order_value_old_book': order_value_old_book or 0,
-        'cog_new_book': cog_new_book or 0,
-        'cog_old_book': cog_old_book or 0,
-        'profit': (order_value - shipping_charge - weight_charge - cog_new_book - cog_old_book) if total_order else 0,
-        'shipping_charge': shipping_charge or 0,
-        'weight_charge': weight_charge or 0
+        'order_value': amounts['total'],
+        'order_value_new_book': amounts['new_book_total'],
+        'order_value_old_book': amounts['old_book_total'],
+        'cog_new_book': amounts['cost_of_good_new'],
+        'cog_old_book': amounts['cost_of_good_old'],
+        'profit': (amounts['total'] - amounts['shipping_charge'] - amounts['weight_charge'] - amounts['cost_of_good_new'] - amounts['cost_of_good_old']) if total_order else 0,
+        'shipping_charge': amounts['shipping_charge'],
+        'weight_charge': amounts['weight_charge']
+    }
+
+
+async def order_analysis(from_date: datetime | None, to_date: datetime | None, db: AsyncSession,
+                         granularity: Granularity | None = None) -> dict:
+    """_summary_
+        Sums of the orders created between the dates, read from the hourly rollups.
+    Args:
+        granularity (Granularity | None): Adds the sums per hour/day/week/month (DASHBOARD_TIMEZONE) as 'series'
+    Returns:
+        dict: OrderAnalysis
+    """
+    hourly = hourly_totals(from_date and utc(from_date), to_date and utc(to_date)).subquery()
+    sums = [func.sum(hourly.c[name]).label(name) for name in ('total_order', *AMOUNTS)]
+    if granularity is None:
+        result = await db.execute(select(*sums))
+        return analysis(result.mappings().one())
+
+    period = func.date_trunc(granularity.value, hourly.c.bucket, settings.DASHBOARD_TIMEZONE).label('period')
+    query = select(period, *sums).group_by(period).having(func.sum(hourly.c.total_order) > 0).order_by(period)
+    logger.debug(f'Query: {query}')
+    rows = (await db.execute(query)).mappings().all()
+    totals = {name: sum(row[name] or 0 for row in rows) for name in ('total_order', *AMOUNTS)}
+    return {
+        **analysis(totals),
+        'series': [{'period': row['period'], **analysis(row)} for row in rows]
     }
 
 
 async def inventory_analysis(db: AsyncSession) -> list[dict]:
-    query = select(
-        Tag.name,
-        func.sum(Book.quantity),
-        func.count(Book.id),
-        func.sum(func.cast(Book.in_stock, Integer)),
-        func.sum(func.cast(not_(Book.in_stock), Integer)),
-        func.sum(Book.cost * Book.quantity),
-        func.sum(Book.regular_price * Book.quantity),
-        func.sum(Book.sale_price * Book.quantity)
-    ).select_from(Tag).join(book_tag_link, Tag.id == book_tag_link.c.tag_id).join(Book, book_tag_link.c.book_id == Book.id).group_by(Tag.name)
-
-    result = (await db.execute(query))
-    group = []
-    for row in result.all():
-        tag, quantity, unique_product, in_stock, out_of_stock, cost, regular_price, sale_price = row
-        group.append({
-            'tag': tag,
-            'quantity': quantity,
-            'unique_product': unique_product,
-            'in_stock': in_stock,
-            'out_of_stock': out_of_stock,
-            'cost': cost,
-            'regular_price': regular_price,
-            'sale_price': sale_price
-        })
-    # logger.debug(f'Group: {group}')
-    return group
+    valuations = inventory_valuation.current().subquery()
+    query = select(Tag.name.label('tag'), *[valuations.c[name] for name in inventory_valuation.COLUMNS]).join(
+        Tag, cast(Tag.id, String) == valuations.c.key).where(
+        valuations.c.dimension == InventoryDimension.tag, valuations.c.unique_product > 0)
+    return [dict(row) for row in (await db.execute(query)).mappings()]
+
+
+async def inventory_groups(dimension: InventoryDimension, db: AsyncSession) -> list[dict]:
+    if dimension == InventoryDimension.tag:
+        return [{'group': row.pop('tag'), **row} for row in await inventory_analysis(db)]
+
+    enum = StockLocation if dimension == InventoryDimension.stock_location else Condition
+    valuations = inventory_valuation.current().subquery()
+    rows = await db.execute(select(valuations).where(
+        valuations.c.dimension == dimension, valuations.c.unique_product > 0
+    ).order_by(valuations.c.key))
+    # Keys are the enum names stored by the book columns
+    return [{'group': enum[row.key].value, **{name: row._mapping[name] for name in inventory_valuation.COLUMNS}}
+            for row in rows]
@@ -1,3 +1,5 @@
+import asyncio
+import traceback
 from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, delete
@@ -5,11 +7,12 @@ from typing import Sequence
 from uuid import UUID
 import logging
 from typing import Tuple, List
-from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models import Image, User, Book, Author, Category, Publisher, Review, PaymentGateway
 from app.controller.exception import NotFoundException, ServerErrorException, BadRequestException
 import app.library.s3 as s3
+from app.config.settings import settings
+from app.library.img_resize import img_resize
 from app.constant.image import ImageFolder
 
 logger = logging.getLogger(__name__)
@@ -34,7 +37,7 @@ async def count_image(db: AsyncSession) -> int:
 
 
 async def create_image(file: UploadFile, folder: ImageFolder, dimension: Tuple[int, int], max_kb: int, db: AsyncSession, optimizer: bool = True) -> Image:
-    MAX_KB = 30
+    MAX_KB = settings.IMAGE_MAX_UPLOAD_KB if optimizer else 30
 
     if not file.filename:
         raise BadRequestException('Filename is required')
@@ -45,14 +48,33 @@ async def create_image(file: UploadFile, folder: ImageFolder, dimension: Tuple[i
             'File size should not exceed {}KB'.format(MAX_KB))
 
     blob = await file.read()
-    key = await s3.upload_file(blob, file.filename, folder.value)
-    if not key:
+    files = [(file.filename, blob)]
+    if optimizer:
+        try:
+            files = await img_resize(blob, file.filename, dimension, max_kb)
+        except Exception:
+            logger.error(traceback.format_exc())
+            raise BadRequestException('Invalid image file')
+
+    async with s3.client() as client:
+        keys = await asyncio.gather(*(s3.upload_file(content, filename, folder.value, client)
+                                      for filename, content in files))
+    if not all(keys):
+        # No Image row points to the variants that were uploaded, remove them before failing
+        uploaded = [key for key in keys if key]
+        if uploaded:
+            try:
+                errors = await s3.delete_files(uploaded)
+            except Exception:
+                logger.error(traceback.format_exc())
+                errors = dict.fromkeys(uploaded, 'not deleted')
+            if errors:
+                logger.error('Orphaned image uploads: {}'.format(errors))
         raise ServerErrorException('Image upload failed')
 
-    image = Image(name=file.filename, folder=folder)
+    name = files[0][0]
+    image = Image(name=name, folder=folder, variants=[filename for filename, _ in files[1:]])
     db.add(image)
-    set_committed_value(image, 'src', s3.public_url(
-        file.filename, folder.value))
     return image
 
 
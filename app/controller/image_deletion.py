@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.library.s3 as s3
+from app.config.database import session_factory
+from app.config.settings import settings
+from app.models import ImageDeletion
+
+logger = logging.getLogger(__name__)
+
+# Counters since the process started
+metrics = {'batches': 0, 'deleted': 0, 'failed': 0, 'given_up': 0}
+
+
+async def drain(db: AsyncSession) -> int:
+    """_summary_
+        Deletes one batch of due keys from S3 with a single DeleteObjects call. Rows are claimed with
+        FOR UPDATE SKIP LOCKED so the workers of every process can drain the queue together.
+    Args:
+        db (AsyncSession): Database session
+    Returns:
+        int: Number of claimed rows
+    """
+    rows = (await db.scalars(select(ImageDeletion).where(
+        ImageDeletion.next_attempt_at <= func.now(),
+        ImageDeletion.attempts < settings.IMAGE_DELETION_MAX_ATTEMPTS,
+    ).order_by(ImageDeletion.id).limit(settings.IMAGE_DELETION_BATCH).with_for_update(skip_locked=True))).all()
+    if not rows:
+        await db.commit()
+        return 0
+
+    keys = sorted({row.key for row in rows})
+    try:
+        errors = await s3.delete_files(keys)
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        errors = {key: '{}: {}'.format(e.__class__.__name__, e) for key in keys}
+
+    now = datetime.now(timezone.utc)
+    done = [row.id for row in rows if row.key not in errors]
+    for row in rows:
+        if row.key in errors:
+            row.attempts += 1
+            row.last_error = errors[row.key][:1000]
+            row.next_attempt_at = now + timedelta(seconds=settings.IMAGE_DELETION_RETRY_AFTER * 2 ** (row.attempts - 1))
+            if row.attempts >= settings.IMAGE_DELETION_MAX_ATTEMPTS:
+                metrics['given_up'] += 1
+                logger.error('Giving up deleting {} after {} attempts: {}'.format(row.key, row.attempts, row.last_error))
+    if done:
+        await db.execute(delete(ImageDeletion).where(ImageDeletion.id.in_(done)))
+    await db.commit()
+
+    metrics['batches'] += 1
+    metrics['deleted'] += len(done)
+    metrics['failed'] += len(rows) - len(done)
+    logger.info('Deleted {}/{} images from s3'.format(len(done), len(rows)))
+    return len(rows)
+
+
+async def worker(stop: asyncio.Event):
+    while not stop.is_set():
+        claimed = 0
+        try:
+            async with session_factory() as db:
+                claimed = await drain(db)
+        except Exception:
+            logger.error(traceback.format_exc())
+
+        # A full batch means more keys are due, drain them right away
+        if claimed < settings.IMAGE_DELETION_BATCH:
+            try:
+                await asyncio.wait_for(stop.wait(), settings.IMAGE_DELETION_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def queue_stats(db: AsyncSession) -> dict:
+    pending, given_up, oldest = (await db.execute(select(
+        func.count().filter(ImageDeletion.attempts < settings.IMAGE_DELETION_MAX_ATTEMPTS),
+        func.count().filter(ImageDeletion.attempts >= settings.IMAGE_DELETION_MAX_ATTEMPTS),
+        func.min(ImageDeletion.created_at),
+    ))).one()
+    return {'pending': pending, 'given_up': given_up, 'oldest': oldest, 'process': metrics}
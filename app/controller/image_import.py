@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import traceback
+from contextlib import nullcontext
+from uuid import uuid4
+
+import httpx
+from pydantic import BaseModel, HttpUrl
+
+import app.library.s3 as s3
+from app.config.settings import settings
+from app.constant import ImageFolder
+from app.controller.utility import is_filename
+
+logger = logging.getLogger(__name__)
+
+
+class URLModel(BaseModel):
+    url: HttpUrl
+
+
+def image_refs(images: str | None) -> list[tuple[str, str]]:
+    """_summary_
+    Args:
+        images (str | None): '|' separated s3 filenames or urls (e.g. 'a.jpg|https://x.com/b.png')
+    Returns:
+        list[tuple[str, str]]: (value, filename) pairs (e.g. [('a.jpg', 'a.jpg'), ('https://x.com/b.png', 'b.png')])
+    """
+    if not images:
+        return []
+    return [(val, val if is_filename(val) else val.split('/')[-1])
+            for val in images.split('|') if val.strip()]
+
+
+async def fetch_image(val: str, filename: str, folder: str, http: httpx.AsyncClient, client, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        if is_filename(val):
+            is_exists = await s3.is_file_exists(filename, folder, client)
+            assert is_exists, 'error: {} not found in s3'.format(val)
+            return
+
+        URLModel(url=val)  # type: ignore # Validate URL
+        res = await http.get(val)
+        res.raise_for_status()
+        assert res.content, 'error: {} download failed'.format(val)
+        key = await s3.upload_file(res.content, filename, folder, client)
+        assert key, 'error: image upload failed'
+
+
+async def import_images(images: dict[str, str | None], existing: set[str],
+                        http: httpx.AsyncClient | None = None) -> tuple[dict[str, list[dict]], dict[str, str]]:
+    """_summary_
+        Image stage of the CSV import. Every new filename is downloaded and uploaded once, with at most
+        IMAGE_IMPORT_CONCURRENCY in flight through one HTTP connection pool and one S3 client.
+    Args:
+        images (dict[str, str | None]): Images column by sku
+        existing (set[str]): Filenames already in the images table, new filenames are added to it
+        http (httpx.AsyncClient | None): HTTP client, e.g. with a mock transport in tests
+    Returns:
+        tuple[dict[str, list[dict]], dict[str, str]]: New images table rows by sku (a filename is linked to the
+            first successful row referring it) and the error of the rows with a failed image
+    """
+    folder = ImageFolder.new_book.value  # 'new_book' For internet images
+    refs = {sku: image_refs(val) for sku, val in images.items()}
+    owners: dict[str, tuple[str, str]] = {}  # New filename -> first (sku, value) referring it
+    for sku, items in refs.items():
+        for val, filename in items:
+            if filename not in existing and filename not in owners:
+                owners[filename] = (sku, val)
+
+    failed: dict[str, str] = {}
+    if owners:
+        semaphore = asyncio.Semaphore(settings.IMAGE_IMPORT_CONCURRENCY)
+        limits = httpx.Limits(max_connections=settings.IMAGE_IMPORT_CONCURRENCY)
+        http_context = nullcontext(http) if http else httpx.AsyncClient(
+            limits=limits, timeout=settings.IMAGE_DOWNLOAD_TIMEOUT, follow_redirects=True)
+        async with http_context as http_client, s3.client() as client:
+            results = await asyncio.gather(*(fetch_image(val, filename, folder, http_client, client, semaphore)
+                                             for filename, (_, val) in owners.items()), return_exceptions=True)
+        for filename, result in zip(owners, results):
+            if isinstance(result, Exception):
+                logger.debug(''.join(traceback.format_exception(result)))
+                failed[filename] = 'error: {}: {}'.format(result.__class__, str(result))
+
+    errors = {sku: error for sku, items in refs.items()
+              if (error := next((failed[filename] for _, filename in items if filename in failed), None))}
+    new_images: dict[str, list[dict]] = {sku: [] for sku in refs if sku not in errors}
+    linked: set[str] = set()
+    for sku in new_images:
+        for _, filename in refs[sku]:
+            if filename in owners and filename not in linked:
+                linked.add(filename)
+                new_images[sku].append({'id': uuid4(), 'name': filename, 'folder': folder})
+    existing.update(linked)
+
+    # Uploads referred only by failed rows are not linked to any book
+    orphans = [filename for filename, (_, val) in owners.items()
+               if filename not in linked and filename not in failed and not is_filename(val)]
+    if orphans:
+        await asyncio.gather(*(s3.delete_file(filename, folder) for filename in orphans), return_exceptions=True)
+    return new_images, errors
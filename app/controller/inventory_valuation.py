@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+import traceback
+from typing import Any
+
+from sqlalchemy import (Integer, Numeric, Select, String, and_, cast, delete, func, insert, literal, not_, or_, select,
+                        union_all)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.database import session_factory
+from app.config.settings import settings
+from app.constant import InventoryDimension
+from app.models import Book, InventoryValuation, InventoryValuationDelta, book_tag_link
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('quantity', 'unique_product', 'in_stock', 'out_of_stock', 'cost', 'regular_price', 'sale_price')
+# Advisory locks of the reconciliation and of the fold, one process repairs or folds at a time
+RECONCILE_LOCK = 4711
+FOLD_LOCK = 4713
+
+# Counters since the process started
+metrics = {'runs': 0, 'differences': 0}
+
+
+def book_groups(dimension: InventoryDimension, key: Any) -> Select:
+    return select(
+        literal(dimension.value).label('dimension'),
+        cast(key, String).label('key'),
+        func.sum(Book.quantity).label('quantity'),
+        func.count(Book.id).label('unique_product'),
+        func.sum(cast(Book.in_stock, Integer)).label('in_stock'),
+        func.sum(cast(not_(Book.in_stock), Integer)).label('out_of_stock'),
+        func.sum(cast(Book.cost, Numeric) * Book.quantity).label('cost'),
+        func.sum(cast(Book.regular_price, Numeric) * Book.quantity).label('regular_price'),
+        func.sum(cast(Book.sale_price, Numeric) * Book.quantity).label('sale_price'),
+    ).select_from(Book).group_by(key)
+
+
+def recompute() -> Select:
+    return union_all(
+        book_groups(InventoryDimension.condition, Book.condition),
+        book_groups(InventoryDimension.stock_location, Book.stock_location),
+        book_groups(InventoryDimension.tag, book_tag_link.c.tag_id).join(
+            book_tag_link, book_tag_link.c.book_id == Book.id),
+    )  # type: ignore
+
+
+def current() -> Select:
+    # The folded groups plus the deltas the worker has not folded yet
+    parts = union_all(*[select(model.dimension, model.key, *[getattr(model, name) for name in COLUMNS])
+                        for model in (InventoryValuation, InventoryValuationDelta)]).subquery()
+    return select(parts.c.dimension, parts.c.key, *[func.sum(parts.c[name]).label(name) for name in COLUMNS]
+                  ).group_by(parts.c.dimension, parts.c.key)
+
+
+def differences() -> Select:
+    expected = recompute().subquery()
+    stored = current().subquery()
+    deltas = [func.coalesce(expected.c[name], 0) - func.coalesce(stored.c[name], 0) for name in COLUMNS]
+    return select(
+        func.coalesce(expected.c.dimension, stored.c.dimension).label('dimension'),
+        func.coalesce(expected.c.key, stored.c.key).label('key'),
+        *[delta.label(name) for delta, name in zip(deltas, COLUMNS)],
+    ).select_from(expected.join(stored, and_(expected.c.dimension == stored.c.dimension,
+                                             expected.c.key == stored.c.key), full=True)
+                  ).where(or_(*[delta != 0 for delta in deltas]))
+
+
+async def reconcile(db: AsyncSession) -> list[dict]:
+    """_summary_
+        Compares the valuation with a full recompute from books in one snapshot and adds the differences as
+        deltas. Differences are added, not written over the groups, so concurrent stock changes are kept.
+    Args:
+        db (AsyncSession): Database session
+    Returns:
+        list[dict]: Groups that were off by the returned amounts, empty when another process is reconciling
+    """
+    if not await db.scalar(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK))):
+        await db.commit()
+        return []
+
+    rows = [dict(row) for row in (await db.execute(differences())).mappings()]
+    if rows:
+        logger.error('Inventory valuation is off in {} groups: {}'.format(len(rows), rows))
+        await db.execute(insert(InventoryValuationDelta), rows)
+    await db.commit()
+
+    metrics['runs'] += 1
+    metrics['differences'] += len(rows)
+    return rows
+
+
+async def fold(db: AsyncSession) -> int:
+    """_summary_
+        Moves the deltas appended by the triggers into inventory_valuations with one statement, the groups are
+        updated in (dimension, key) order. Deleted and added in the same transaction, so readers count every
+        change exactly once.
+    Args:
+        db (AsyncSession): Database session
+    Returns:
+        int: Groups updated, 0 when another process is folding
+    """
+    if not await db.scalar(select(func.pg_try_advisory_xact_lock(FOLD_LOCK))):
+        await db.commit()
+        return 0
+
+    moved = delete(InventoryValuationDelta).returning(
+        InventoryValuationDelta.dimension, InventoryValuationDelta.key,
+        *[getattr(InventoryValuationDelta, name) for name in COLUMNS]).cte('moved')
+    sums = select(moved.c.dimension, moved.c.key, *[func.sum(moved.c[name]).label(name) for name in COLUMNS]
+                  ).group_by(moved.c.dimension, moved.c.key).order_by(moved.c.dimension, moved.c.key)
+    stmt = pg_insert(InventoryValuation).from_select(['dimension', 'key', *COLUMNS], sums)
+    result = await db.execute(stmt.on_conflict_do_update(
+        index_elements=[InventoryValuation.dimension, InventoryValuation.key],
+        set_={name: getattr(InventoryValuation, name) + stmt.excluded[name] for name in COLUMNS}))
+    await db.commit()
+    return result.rowcount
+
+
+async def worker(stop: asyncio.Event):
+    # Folds every INVENTORY_FOLD_INTERVAL, reconciles every INVENTORY_RECONCILE_INTERVAL
+    reconciled = time.monotonic()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), settings.INVENTORY_FOLD_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if stop.is_set():
+            break
+        try:
+            async with session_factory() as db:
+                await fold(db)
+                if time.monotonic() - reconciled >= settings.INVENTORY_RECONCILE_INTERVAL:
+                    reconciled = time.monotonic()
+                    await reconcile(db)
+        except Exception:
+            logger.error(traceback.format_exc())
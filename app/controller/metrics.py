@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import traceback
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.redis import cache
+from app.config.settings import settings
+from app.controller import image_deletion
+from app.controller.redis import redis_available, redis_failed
+from app.library import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Snapshot of every worker process ('metrics:host:pid'), expires when the worker stops publishing it
+WORKER_KEY = 'metrics:{}:{}'
+
+
+def worker_key() -> str:
+    return WORKER_KEY.format(socket.gethostname(), os.getpid())
+
+
+async def publish(snapshot: dict) -> None:
+    await cache.set(worker_key(), json.dumps(snapshot), ex=settings.METRICS_WORKER_TTL)
+
+
+async def worker_snapshots() -> dict[str, dict]:
+    """_summary_
+        Publishes the snapshot of this worker and reads the ones of the other gunicorn workers from redis.
+        Only this worker is counted while redis is unavailable.
+    Returns:
+        dict[str, dict]: Snapshot by worker ('host:pid')
+    """
+    local = {worker_key().split(':', 1)[1]: metrics.snapshot()}
+    if not redis_available():
+        return local
+    try:
+        await publish(next(iter(local.values())))
+        keys = [key async for key in cache.scan_iter(WORKER_KEY.format('*', '*'))]
+        values = await cache.mget(keys) if keys else []
+        return {key.split(':', 1)[1]: json.loads(value) for key, value in zip(keys, values) if value} or local
+    except Exception:
+        redis_failed()
+        return local
+
+
+def merge(snapshots: dict[str, dict]) -> dict:
+    """_summary_
+        Samples of every worker under a worker label. Summing them would make a counter drop when a worker
+        is recycled and its snapshot expires, which rate() reads as a reset; a series per worker just ends.
+    """
+    merged: dict = {}
+    for worker, snapshot in sorted(snapshots.items()):
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {**family, 'labels': ['worker', *family['labels']], 'samples': {}})
+            if family['bounds'] != target['bounds']:
+                continue  # Buckets changed by a deploy, until the old workers are gone
+            for labels, value in family['samples']:
+                target['samples'][(worker, *labels)] = value
+    return merged
+
+
+def label_text(names: list[str], values: tuple, extra: str = '') -> str:
+    pairs = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(merged: dict) -> str:
+    lines = []
+    for name, family in sorted(merged.items()):
+        lines.append('# HELP {} {}'.format(name, family['help']))
+        lines.append('# TYPE {} {}'.format(name, family['type']))
+        for labels, value in sorted(family['samples'].items()):
+            if family['type'] != 'histogram':
+                lines.append('{}{} {}'.format(name, label_text(family['labels'], labels), value))
+                continue
+            cumulative = 0
+            for bound, count in zip(family['bounds'] + ['+Inf'], value['counts']):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, label_text(family['labels'], labels, 'le="{}"'.format(bound)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, label_text(family['labels'], labels), value['sum']))
+            lines.append('{}_count{} {}'.format(name, label_text(family['labels'], labels), value['count']))
+    return '\n'.join(lines) + '\n'
+
+
+async def exposition(db: AsyncSession) -> str:
+    """_summary_
+        Metrics of every gunicorn worker in the Prometheus text format
+    Args:
+        db (AsyncSession): Database session, for the queues kept in tables
+    Returns:
+        str: Body of GET /metrics
+    """
+    merged = merge(await worker_snapshots())
+
+    # Queues in tables are the same for every worker, added once without a worker
+    try:
+        queue = merged.setdefault(metrics.QUEUE_DEPTH.name, {
+            **metrics.QUEUE_DEPTH.state(), 'labels': ['worker', *metrics.QUEUE_DEPTH.labels], 'samples': {}})
+        queue['samples'][('', 'image_deletions')] = (await image_deletion.queue_stats(db))['pending']
+    except Exception:
+        logger.error(traceback.format_exc())
+    return render(merged)
+
+
+async def worker(stop: asyncio.Event):
+    # Keeps the snapshot of this worker in redis for the scrapes served by the other workers
+    while not stop.is_set():
+        if redis_available():
+            try:
+                await publish(metrics.snapshot())
+            except Exception:
+                redis_failed()
+        try:
+            await asyncio.wait_for(stop.wait(), settings.METRICS_PUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -4,19 +4,22 @@ from datetime import datetime, timezone
 from typing import Any, List, Sequence, Tuple
 from uuid import UUID, uuid4
 
-from sqlalchemy import func, select
+from sqlalchemy import Select, func, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased, selectinload
+from sqlalchemy.orm import aliased, joinedload, lazyload, selectinload
 
 import app.controller.coupon as coupon_service
+import app.controller.coupon_engine as coupon_engine
+import app.controller.stock as stock_service
 import app.controller.transaction as transaction_service
 from app.constant.discount_type import DiscountType
 from app.constant.orderstatus import Status
 from app.controller.courier import get_courier_by_id
+import app.controller.count as count_service
+from app.constant import CountMode
 from app.controller.exception import (
     BadRequestException,
     NotFoundException,
-    ServerErrorException,
     UnhandledException,
 )
 from app.filter_schema.order import OrderFilter, OrderFilterCustomer
@@ -34,19 +37,57 @@ from app.models import (
 
 logger = logging.getLogger(__name__)
 
-order_query = select(Order).options(
-    selectinload(Order.order_items).selectinload(
-        OrderItem.book).selectinload(Book.authors),
-    selectinload(Order.order_items).selectinload(
-        OrderItem.book).selectinload(Book.images),
-    selectinload(Order.order_status).selectinload(OrderStatus.updated_by),
-    selectinload(Order.transactions).selectinload(Transaction.gateway),
-    selectinload(Order.transactions).selectinload(Transaction.refunded_by),
-    selectinload(Order.address),
-    selectinload(Order.courier),
-    selectinload(Order.coupon),
-    selectinload(Order.customer),
-)
+# Loader options of the relations an order response shows. Many-to-one relations are joined into the query
+# of their parent, a full order is loaded in six queries
+ORDER_LOADS = {
+    'order_items': [
+        selectinload(Order.order_items).joinedload(OrderItem.book).selectinload(Book.authors),
+        selectinload(Order.order_items).joinedload(OrderItem.book).selectinload(Book.images),
+    ],
+    'order_status': [selectinload(Order.order_status).joinedload(OrderStatus.updated_by)],
+    'transactions': [
+        selectinload(Order.transactions).joinedload(Transaction.gateway),
+        selectinload(Order.transactions).joinedload(Transaction.refunded_by),
+    ],
+    'address': [joinedload(Order.address)],
+    'courier': [joinedload(Order.courier)],
+    'coupon': [joinedload(Order.coupon)],
+    'customer': [joinedload(Order.customer)],
+}
+
+# Relations each key of an update payload reads or changes. The books of the items are loaded without their
+# authors and images, manage_inventory reloads the books of the updated items with them
+UPDATE_LOADS = {
+    'order_items': [selectinload(Order.order_items).joinedload(OrderItem.book).lazyload(Book.images)],
+    'order_status': ORDER_LOADS['order_status'],
+    'transaction': ORDER_LOADS['transactions'] + ORDER_LOADS['customer'],
+    'customer_id': ORDER_LOADS['customer'],
+}
+
+order_query = select(Order).options(*[option for options in ORDER_LOADS.values() for option in options])
+
+
+def update_query(payload: dict[str, Any]) -> Select:
+    # Only the relations of the payload keys, the others are left unloaded instead of the lazy='joined' defaults
+    return select(Order).options(lazyload('*'), *[option for key, options in UPDATE_LOADS.items()
+                                                  if payload.get(key) for option in options])
+
+
+async def load_relations(order: Order, db: AsyncSession) -> Order:
+    """_summary_
+        Loads the relations of ORDER_LOADS an order does not have yet in one order query, the loaded ones are
+        kept as they are
+    Args:
+        order (Order): Persistent order, e.g. loaded by update_query
+        db (AsyncSession): Database session
+    Returns:
+        Order: The order with every relation of the response
+    """
+    unloaded = inspect(order).unloaded
+    options = [option for name, options in ORDER_LOADS.items() if name in unloaded for option in options]
+    if options:
+        await db.execute(select(Order).where(Order.id == order.id).options(lazyload('*'), *options))
+    return order
 
 
 async def get_order_by_id(id: UUID, db: AsyncSession) -> Order:
@@ -68,7 +109,7 @@ async def get_order_by_invoice(invoice: int | str, db: AsyncSession) -> Order:
     return order
 
 
-async def get_all_orders(filter: OrderFilter, page: int, per_page: int, db: AsyncSession) -> Tuple[Sequence[Order], int]:
+async def get_all_orders(filter: OrderFilter, page: int, per_page: int, db: AsyncSession, count_mode: CountMode = CountMode.exact) -> Tuple[Sequence[Order], int]:
     offset = (page - 1) * per_page
     query = order_query
 
@@ -98,14 +139,11 @@ async def get_all_orders(filter: OrderFilter, page: int, per_page: int, db: Asyn
     try:
         result = await db.execute(stmt)
         orders = result.unique().scalars().all()
-
-        # Count
-        stmt = select(func.count()).select_from(query.subquery())
-        count = (await db.scalar(stmt)) or 0
     except Exception:
         logger.error(traceback.format_exc())
         raise UnhandledException()
 
+    count = await count_service.get_count(query, db, count_mode)
     return orders, count
 
 
@@ -154,7 +192,7 @@ async def create_order(payload: dict[str, Any], db: AsyncSession, commit: bool =
         order.new_book_total,
         order.cost_of_good_old,
         order.cost_of_good_new
-    ) = await manage_inventory(payload['order_items'], db)
+    ) = await manage_inventory(payload['order_items'], db, reserve=commit)
 
     # Shipping
     order.shipping_charge, order.weight_charge = 0, 0
@@ -245,7 +283,7 @@ async def create_order(payload: dict[str, Any], db: AsyncSession, commit: bool =
 
 async def update_order(id: UUID, payload: dict[str, Any], db: AsyncSession) -> Order:
     logger.debug(f'Updating order with payload: {payload}')
-    order = await db.scalar(order_query.where(Order.id == id))
+    order = await db.scalar(update_query(payload).where(Order.id == id))
     if not order:
         raise NotFoundException('Order not found')
 
@@ -257,7 +295,7 @@ async def update_order(id: UUID, payload: dict[str, Any], db: AsyncSession) -> O
             order.new_book_total,
             order.cost_of_good_old,
             order.cost_of_good_new
-        ) = await manage_inventory(payload['order_items'], db, order_id=order.id)
+        ) = await manage_inventory(payload['order_items'], db, existing=order.order_items)
 
         if order.coupon_id:
             coupon = await coupon_service.get_coupon_by_id(
@@ -342,7 +380,7 @@ async def update_order(id: UUID, payload: dict[str, Any], db: AsyncSession) -> O
 
     await db.commit()
     logger.info('Order updated: {}'.format(order))
-    return order
+    return await load_relations(order, db)
 
 
 async def delete_order(id: UUID, restock: bool, db: AsyncSession) -> None:
@@ -351,9 +389,7 @@ async def delete_order(id: UUID, restock: bool, db: AsyncSession) -> None:
         raise NotFoundException('Order not found')
 
     if restock:
-        for item in order.order_items:
-            book = await item.awaitable_attrs.book
-            await restock_item(book, item.quantity)
+        await stock_service.reserve({item.book_id: -item.quantity for item in order.order_items}, db)
 
     for trx in (await order.awaitable_attrs.transactions):
         logger.info('Deleting transaction: {}'.format(trx))
@@ -364,16 +400,22 @@ async def delete_order(id: UUID, restock: bool, db: AsyncSession) -> None:
     await db.commit()
 
 
-async def manage_inventory(items_in: list[dict], db: AsyncSession, order_id: UUID | None = None) -> Tuple[list[OrderItem], float, float, float, float]:
-    book_ids = [item['book_id'] for item in items_in]
-    query = select(Book).options(selectinload(
-        Book.authors), selectinload(Book.images))
-    books = {book.id: book for book in (await db.scalars(query.filter(Book.id.in_(book_ids))))}
+async def manage_inventory(items_in: list[dict], db: AsyncSession, existing: list[OrderItem] | None = None, reserve: bool = True) -> Tuple[list[OrderItem], float, float, float, float]:
+    # Items of an updated order, loaded with the order
+    existing_items = {item.book_id: item for item in existing or []}
 
-    existing_items = {item.book_id: item for item in
-                      (await db.scalars(select(OrderItem).options(
-                          selectinload(OrderItem.book)
-                      ).filter(OrderItem.order_id == order_id)))} if order_id else {}
+    # Stock changes, the removed items of an updated order are given back
+    changes = {item['book_id']: item['quantity'] - (existing_items[item['book_id']].quantity
+                                                     if item['book_id'] in existing_items else 0) for item in items_in}
+    for book_id, _item in existing_items.items():
+        if book_id not in changes:
+            changes[book_id] = -_item.quantity
+    await stock_service.reserve(changes, db, dry_run=not reserve)
+
+    # Loaded after the stock is written, the books show the quantity left
+    query = select(Book).options(selectinload(
+        Book.authors), selectinload(Book.images)).execution_options(populate_existing=True)
+    books = {book.id: book for book in (await db.scalars(query.filter(Book.id.in_(changes))))}
 
     items: list[OrderItem] = []
     for item in items_in:
@@ -384,14 +426,9 @@ async def manage_inventory(items_in: list[dict], db: AsyncSession, order_id: UUI
 
         _item = existing_items.get(book.id)  # applicable for update order
         if _item:
-            if item['quantity'] > _item.quantity:  # Asking more quantity
-                await reduce_stock(book, (item['quantity'] - _item.quantity))
-            elif item['quantity'] < _item.quantity:
-                await restock_item(book, (_item.quantity - item['quantity']))
             _item.quantity = item['quantity']
             items.append(_item)
         else:
-            await reduce_stock(book, item['quantity'])
             items.append(OrderItem(
                 book_id=book.id,
                 book=book,
@@ -400,11 +437,6 @@ async def manage_inventory(items_in: list[dict], db: AsyncSession, order_id: UUI
                 quantity=item['quantity'],
             ))
 
-    # Restock removed items
-    for book_id, _item in existing_items.items():
-        if book_id not in book_ids:
-            await restock_item(_item.book, _item.quantity)
-
     # Sum
     old_book_total, new_book_total, cog_old, cog_new = 0, 0, 0, 0
     for item in items:
@@ -428,8 +460,6 @@ async def apply_coupon(coupon: Coupon,
                        customer_id: UUID | None = None,
                        courier_id: UUID | None = None,
                        new_order: bool = True) -> Tuple[Coupon, float, float, float]:
-    items = order_items.copy()
-
     if new_order:
         if not coupon.is_active:
             raise BadRequestException(
@@ -459,39 +489,13 @@ async def apply_coupon(coupon: Coupon,
             raise BadRequestException(
                 "Coupon '{}' is not applicable for you".format(coupon.code))
 
-    if courier_id and coupon.exclude_couriers:
-        courier = await get_courier_by_id(courier_id, db)
-        if courier in coupon.exclude_couriers:
-            raise BadRequestException(
-                "Coupon '{}' is not applicable with '{}'".format(coupon.code, courier.method_name))
+    rules = coupon_engine.compile_coupon(coupon)
+    if courier_id in rules.exclude_couriers:
+        courier = await get_courier_by_id(courier_id, db)  # type: ignore
+        raise BadRequestException(
+            "Coupon '{}' is not applicable with '{}'".format(coupon.code, courier.method_name))
 
-    # Include items
-    for item in items:
-        if coupon.include_conditions and item.book.condition not in coupon.include_conditions:
-            items.remove(item)
-        if coupon.include_books and item.book not in coupon.include_books:
-            items.remove(item)
-        if coupon.include_publishers and (await item.book.awaitable_attrs.publisher) not in coupon.include_publishers:
-            items.remove(item)
-        if coupon.include_authors and not any(author in coupon.include_authors for author in (await item.book.awaitable_attrs.authors)):
-            items.remove(item)
-        if coupon.include_categories and not any(category in coupon.include_categories for category in (await item.book.awaitable_attrs.categories)):
-            items.remove(item)
-        if coupon.include_tags and not any(tag in coupon.include_tags for tag in (await item.book.awaitable_attrs.tags)):
-            items.remove(item)
-
-    # Exclude items
-    for item in items:
-        if item.book in coupon.exclude_books:
-            items.remove(item)
-        if coupon.exclude_publishers and (await item.book.awaitable_attrs.publisher) in coupon.exclude_publishers:
-            items.remove(item)
-        if coupon.exclude_authors and any(author in coupon.exclude_authors for author in (await item.book.awaitable_attrs.authors)):
-            items.remove(item)
-        if coupon.exclude_categories and any(category in coupon.exclude_categories for category in (await item.book.awaitable_attrs.categories)):
-            items.remove(item)
-        if coupon.exclude_tags and any(tag in coupon.exclude_tags for tag in (await item.book.awaitable_attrs.tags)):
-            items.remove(item)
+    items = await coupon_engine.eligible_items(rules, order_items, db)
 
     old_book_total = sum(
         [item.sold_price * item.quantity for item in items if item.book.is_used])
@@ -572,33 +576,6 @@ async def handle_shipping(address_id: UUID | Address, courier_id: UUID, weight_k
     return shipping_charge, weight_charge, address, courier
 
 
-async def reduce_stock(book: Book, quantity: int) -> None:
-    if quantity < 1:
-        logger.error('Cannot reduce stock by %s', quantity)
-        raise ServerErrorException('Something went wrong.')
-
-    if not book.in_stock:
-        raise BadRequestException(
-            "Book '{}' is out of stock".format(book.name), str(book.id))
-
-    if book.manage_stock:
-        if book.quantity < quantity:
-            raise BadRequestException(
-                "Book '{}' has insufficient stock".format(book.name), str(book.id))
-        book.quantity -= quantity
-        book.in_stock = book.quantity > 0
-
-
-async def restock_item(book: Book, quantity: int) -> None:
-    if quantity < 1:
-        logger.error('Cannot restock by %s', quantity)
-        raise ServerErrorException('Something went wrong.')
-
-    if book.manage_stock:
-        book.quantity += quantity
-        book.in_stock = True
-
-
 async def additional_weight_charge(items: List[OrderItem], weight_charge_per_kg) -> float:
     sub_total = sum(
         [item.sold_price * item.quantity for item in items if item.book.weight_in_gm == 0])
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import traceback
+from datetime import datetime
+
+from sqlalchemy import Select, delete, func, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.database import session_factory
+from app.config.settings import settings
+from app.models import OrderRollup, OrderRollupDelta
+
+logger = logging.getLogger(__name__)
+
+AMOUNTS = ('total', 'new_book_total', 'old_book_total', 'cost_of_good_new', 'cost_of_good_old',
+           'shipping_charge', 'weight_charge')
+COLUMNS = ('total_order', *AMOUNTS)
+# Advisory lock of the fold, one process folds at a time
+FOLD_LOCK = 4712
+
+
+def hourly(start: datetime | None = None, end: datetime | None = None) -> Select:
+    """_summary_
+        Totals per UTC hour from start (inclusive) to end (exclusive), the folded hours plus the deltas the
+        worker has not folded yet
+    """
+    parts = union_all(*[
+        select(model.bucket, *[getattr(model, name) for name in COLUMNS]).where(
+            *([model.bucket >= start] if start else []), *([model.bucket < end] if end else []))
+        for model in (OrderRollup, OrderRollupDelta)
+    ]).subquery()
+    return select(parts.c.bucket, *[func.sum(parts.c[name]).label(name) for name in COLUMNS]).group_by(parts.c.bucket)
+
+
+async def fold(db: AsyncSession) -> int:
+    """_summary_
+        Moves the deltas appended by the orders trigger into order_rollups with one statement. The deltas are
+        deleted and added in the same transaction, readers see every order exactly once.
+    Args:
+        db (AsyncSession): Database session
+    Returns:
+        int: Hours updated, 0 when another process is folding
+    """
+    if not await db.scalar(select(func.pg_try_advisory_xact_lock(FOLD_LOCK))):
+        await db.commit()
+        return 0
+
+    moved = delete(OrderRollupDelta).returning(
+        OrderRollupDelta.bucket, *[getattr(OrderRollupDelta, name) for name in COLUMNS]).cte('moved')
+    sums = select(moved.c.bucket, *[func.sum(moved.c[name]).label(name) for name in COLUMNS]
+                  ).group_by(moved.c.bucket).order_by(moved.c.bucket)
+    stmt = insert(OrderRollup).from_select(['bucket', *COLUMNS], sums)
+    result = await db.execute(stmt.on_conflict_do_update(
+        index_elements=[OrderRollup.bucket],
+        set_={name: getattr(OrderRollup, name) + stmt.excluded[name] for name in COLUMNS}))
+    await db.commit()
+    return result.rowcount
+
+
+async def worker(stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), settings.ORDER_ROLLUP_FOLD_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if stop.is_set():
+            break
+        try:
+            async with session_factory() as db:
+                await fold(db)
+        except Exception:
+            logger.error(traceback.format_exc())
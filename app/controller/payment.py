@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import app.controller.email as email_service
 import app.controller.order as order_service
 import app.controller.redis as redis_service
+import app.controller.stock as stock_service
 import app.controller.utility as utility_service
 import app.library.bkash as bkash
 from app.config.settings import settings
@@ -83,6 +84,8 @@ async def execute_payment(payment_id: str, status: str, request: Request, bg_tas
         payload['is_manual'] = False  # Payment is verified by bkash API
         order_payload['transactions'] = [payload]
 
+        # The held stock is taken by the order in the same transaction
+        await stock_service.release(UUID(payment['merchantInvoiceNumber']), db)
         order = await order_service.create_order(order_payload, db, commit=True,
                                                  order_id=payment['merchantInvoiceNumber'])
         bg_task.add_task(email_service.send_invoice_email, order)
@@ -98,13 +101,27 @@ async def execute_payment(payment_id: str, status: str, request: Request, bg_tas
     except AssertionError as err:
         logger.error(err)
         if order_payload and isinstance(order_payload, dict):
+            await release_stock(order_payload, db)
             await order_failed_post_action(order_payload, bg_task, db)
     except Exception:
         logger.error(traceback.format_exc())
         if order_payload and isinstance(order_payload, dict):
+            await release_stock(order_payload, db)
             await order_failed_post_action(order_payload, bg_task, db)
 
 
+async def release_stock(order_payload: dict, db: AsyncSession) -> None:
+    # The order was not created, its stock is available again without waiting for the hold to expire
+    if not order_payload.get('order_id'):
+        return
+    try:
+        await db.rollback()
+        await stock_service.release(order_payload['order_id'], db)
+        await db.commit()
+    except Exception:
+        logger.error(traceback.format_exc())
+
+
 async def order_failed_post_action(order_payload: dict, bg_task: BackgroundTasks, db: AsyncSession) -> None:
     if order_payload['address']['email']:
         await email_service.order_failed_email(
@@ -3,17 +3,20 @@ import traceback
 from typing import Sequence, Union
 from uuid import UUID
 
-from sqlalchemy import func, or_, select
+from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Query, joinedload, selectinload
 from sqlalchemy.sql.selectable import Select
 
+import app.controller.count as count_service
+from app.constant import CountMode
 from app.controller.exception import (
     ConflictException,
     NotFoundException,
     UnhandledException,
 )
 from app.controller.image import validate_img
+from app.controller.search import search_condition, search_rank
 from app.filter_schema.publisher import PublisherFilter
 from app.models import Author, Book, Category, Publisher, Tag
 
@@ -46,7 +49,8 @@ def apply_filter(fltr: PublisherFilter, query: Union[Query, Select]) -> Union[Qu
     category__slug__in = filter.pop('category__slug__in')
     tag__slug__in = filter.pop('tag__slug__in')
 
-    if author__slug__in or category__slug__in or tag__slug__in:
+    joined = bool(author__slug__in or category__slug__in or tag__slug__in)
+    if joined:
         query = query.join(Publisher.books)
 
     if author__slug__in:
@@ -62,15 +66,15 @@ def apply_filter(fltr: PublisherFilter, query: Union[Query, Select]) -> Union[Qu
             Book.tags.any(Tag.slug.in_(tag__slug__in))
         )
     if q := filter.pop('q'):
-        query = query.filter(or_(
-            Publisher.name.ilike(f'%{q}%'),
-            Publisher.slug.ilike('%{}%'.format(q.replace(' ', '-'))),
-            func.similarity(Publisher.name, q) > 0.5,
-            func.similarity(Publisher.slug, q) > 0.5
-        ))
+        query = query.filter(search_condition(
+            q, Publisher.search_vector, Publisher.name))
+        if not joined:
+            query = query.order_by(search_rank(
+                q, Publisher.search_vector, Publisher.name))
 
     query = filter.filter(query)
-    query = query.distinct()
+    if joined:
+        query = query.distinct()
     return query
 
 
@@ -88,17 +92,9 @@ async def get_all_publishers(filter: PublisherFilter, page: int, per_page: int,
     return result.scalars().unique().all()
 
 
-async def count_publisher(filter: PublisherFilter, db: AsyncSession) -> int:
+async def count_publisher(filter: PublisherFilter, db: AsyncSession, count_mode: CountMode = CountMode.exact) -> int:
     query = apply_filter(filter, select(Publisher))
-    count_query = select(func.count()).select_from(query.subquery())
-
-    try:
-        result = await db.execute(count_query)
-    except Exception:
-        logger.error(traceback.format_exc())
-        raise UnhandledException()
-
-    return result.scalar_one()
+    return await count_service.get_count(query, db, count_mode)
 
 
 async def create_publisher(payload: dict, db: AsyncSession) -> Publisher:
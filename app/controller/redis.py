@@ -1,11 +1,27 @@
 from fastapi import Request
 import logging
+import time
 import traceback
 
 from app.controller.exception import ServerErrorException
 
 logger = logging.getLogger(__name__)
 
+# Caches skip redis for a while after a failure instead of waiting on it for every request
+REDIS_RETRY_AFTER = 30  # in secs
+redis_retry_at = 0.0
+
+
+def redis_available() -> bool:
+    return time.monotonic() >= redis_retry_at
+
+
+def redis_failed():
+    global redis_retry_at
+    logger.warning('Redis is unavailable, skipping caches for {}s: {}'.format(
+        REDIS_RETRY_AFTER, traceback.format_exc(limit=1)))
+    redis_retry_at = time.monotonic() + REDIS_RETRY_AFTER
+
 
 async def set_redis(request: Request, key: str, value: str, ex: int) -> None:
     try:
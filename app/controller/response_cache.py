@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Iterable
+
+from fastapi import Request, Response
+from redis.exceptions import WatchError
+from sqlalchemy import inspect
+
+from app.config import database
+from app.config.database import Writes, on_commit
+from app.config.redis import cache
+from app.config.settings import settings
+from app.controller.redis import redis_available, redis_failed
+from app.library import serializer
+
+logger = logging.getLogger(__name__)
+
+# Hash of the commits that wrote each table, an entry built from rows read before a commit is not stored after it
+GENERATIONS = 'response-generations'
+
+
+def cache_key(request: Request) -> str:
+    query = sorted((key, value)
+                   for key, value in request.query_params.multi_items() if value != '')
+    digest = hashlib.sha1(json.dumps(query).encode()).hexdigest()
+    return 'response:{}:{}'.format(request.url.path, digest)
+
+
+def table_tags(table: str, id: Any) -> set[str]:
+    return {'{}:{}'.format(table, id), '{}:*'.format(table)}
+
+
+def row_tags(obj: Any) -> set[str]:
+    state = inspect(obj)
+    return table_tags(state.mapper.local_table.name, state.mapper.primary_key_from_instance(obj)[0])
+
+
+def entity_tags(obj: Any) -> set[str]:
+    """_summary_
+        Tags of the object and of every relation loaded on it, a commit writing any of these rows purges the entry.
+    Args:
+        obj (Base): ORM object the response is built from (e.g. Book)
+    Returns:
+        set[str]: Tags like 'books:<id>', 'authors:<id>' and 'books:*' for statements with unknown rows
+    """
+    state = inspect(obj)
+    tags = row_tags(obj)
+    for rel in state.mapper.relationships:
+        if rel.key in state.unloaded:
+            continue
+        value = state.attrs[rel.key].loaded_value
+        for related in (value if isinstance(value, list) else [value]):
+            if related is not None:
+                tags |= row_tags(related)
+    return tags
+
+
+def model_tags(model: Any, table: str, relations: dict[str, str]) -> set[str]:
+    """_summary_
+        entity_tags of a response model built without ORM objects (e.g. BookOut of a projection query).
+    Args:
+        model (Any): Response model with an id
+        table (str): Table of the model (e.g. 'books')
+        relations (dict[str, str]): Table of each relation field (e.g. {'authors': 'authors'})
+    Returns:
+        set[str]: Tags like 'books:<id>' and 'authors:<id>'
+    """
+    tags = table_tags(table, model.id)
+    for field, rel_table in relations.items():
+        value = getattr(model, field)
+        for related in (value if isinstance(value, list) else [value]):
+            if related is not None:
+                tags |= table_tags(rel_table, related.id)
+    return tags
+
+
+async def get(key: str) -> tuple[Response | None, dict[str, str] | None]:
+    """_summary_
+        Cached response of the key, with the table generations to pass to store() on a miss.
+    Args:
+        key (str): cache_key of the request
+    Returns:
+        tuple[Response | None, dict[str, str] | None]: Response or None, generations or None when redis is unavailable
+    """
+    if not redis_available():
+        return None, None
+    try:
+        async with cache.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.hgetall(GENERATIONS)
+            entry, generations = await pipe.execute()
+    except Exception:
+        redis_failed()
+        return None, None
+    if entry is None:
+        return None, generations
+
+    entry = json.loads(entry)
+    return Response(content=entry['body'], media_type='application/json',
+                    headers={**entry['headers'], 'X-Cache': 'HIT'}), generations
+
+
+async def store(key: str, content: Any, schema: Any, tags: Iterable[str], generations: dict[str, str] | None,
+                headers: dict[str, str] | None = None) -> Response:
+    """_summary_
+        Serializes the response once, stores it with its tags and returns it. The entry is not stored when a
+        commit wrote a table of its tags since get(), purge_writes may already have run for that commit.
+    Args:
+        key (str): cache_key of the request
+        content (Any): ORM object(s) returned by the service
+        schema (Any): Response model (e.g. BookOut, list[BookOut])
+        tags (Iterable[str]): Tags to purge the entry by
+        generations (dict[str, str] | None): Generations returned by get() before the rows were read
+        headers (dict[str, str] | None): Response headers (e.g. X-Total-Count), cached with the body
+    Returns:
+        Response: JSON response
+    """
+    body = serializer.dump_json(content, schema).decode()
+    headers = dict(headers or {})
+
+    if generations is not None and redis_available():
+        tags = set(tags)
+        tables = sorted({tag.split(':')[0] for tag in tags})
+        try:
+            async with cache.pipeline(transaction=True) as pipe:
+                # A commit bumping a generation between the check and the writes fails the transaction
+                await pipe.watch(GENERATIONS)
+                if await pipe.hmget(GENERATIONS, tables) == [generations.get(table) for table in tables]:
+                    pipe.multi()
+                    pipe.set(key, json.dumps(
+                        {'body': body, 'headers': headers}), ex=settings.RESPONSE_CACHE_TTL)
+                    for tag in tags:
+                        pipe.sadd('response-tag:{}'.format(tag), key)
+                        pipe.expire('response-tag:{}'.format(tag),
+                                    settings.RESPONSE_CACHE_TTL)
+                    await pipe.execute()
+        except WatchError:
+            pass
+        except Exception:
+            redis_failed()
+
+    return Response(content=body, media_type='application/json',
+                    headers={**headers, 'X-Cache': 'MISS'})
+
+
+async def purge(tags: Iterable[str]) -> None:
+    tag_keys = ['response-tag:{}'.format(tag) for tag in tags]
+    if not tag_keys:
+        return
+    async with cache.pipeline(transaction=False) as pipe:
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        members = await pipe.execute()
+
+    keys = set().union(*members)
+    await cache.delete(*keys, *tag_keys)
+    logger.debug('Purged {} cached responses'.format(len(keys)))
+
+
+@on_commit
+async def purge_writes(writes: Writes):
+    # Rows purge their detail and list entries, tables purge the list entries a new row may enter
+    if not redis_available():
+        return
+    try:
+        # Bumped before the purge, so responses read before the commit are not stored after it
+        async with cache.pipeline(transaction=False) as pipe:
+            for table in writes.tables:
+                pipe.hincrby(GENERATIONS, table, 1)
+            await pipe.execute()
+        tags = writes.rows | writes.tables | {'{}:*'.format(table) for table in writes.statements}
+        await purge(tags)
+    except Exception:
+        redis_failed()
+        return
+    if database.replica_engine is not None:
+        # A read served by a lagging replica after the purge may cache the old rows again
+        task = asyncio.create_task(purge_later(tags))
+        delayed_purges.add(task)
+        task.add_done_callback(delayed_purges.discard)
+
+
+# The event loop keeps only weak references to tasks, a pending purge could be garbage collected
+delayed_purges: set[asyncio.Task] = set()
+
+
+async def purge_later(tags: set[str]):
+    await asyncio.sleep(settings.REPLICA_MAX_LAG)
+    try:
+        await purge(tags)
+    except Exception:
+        redis_failed()
@@ -0,0 +1,116 @@
+from typing import Any
+
+from sqlalchemy import ColumnElement, bindparam, event, func, inspect, literal, literal_column, or_, select, update
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as SyncSession
+
+from app.config.database import session_writes
+from app.library import bangla
+from app.models import Author, Book, Publisher
+from app.models.author import book_author_link
+
+TS_CONFIG = literal_column("'simple'", REGCONFIG)
+
+
+def ts_query(q: str) -> ColumnElement | None:
+    terms = bangla.query_terms(q)
+    if not terms:
+        return None
+    # Every word must match in either script, the written and latin forms as prefixes, the phonetic key exactly
+    parts = []
+    for word, latin, key in terms:
+        alternatives = {f"'{word}':*", f"'{latin}':*"}
+        if key:
+            alternatives.add(f"'{key}'")
+        parts.append('({})'.format(' | '.join(sorted(alternatives))))
+    return func.to_tsquery(TS_CONFIG, literal(' & '.join(parts)))
+
+
+def search_condition(q: str, vector: Any, text: Any) -> ColumnElement:
+    """_summary_
+        Index friendly replacement of ilike OR similarity. The tsvector match is served by the GIN index on vector,
+        ilike and word similarity (%>) by the gin_trgm_ops index on text.
+    Args:
+        q (str): Search query
+        vector (Column): tsvector column
+        text (Column): Trigram indexed text column
+    Returns:
+        ColumnElement: Predicate for the WHERE clause
+    """
+    conditions = [text.ilike(f'%{q}%'), text.op('%>')(q)]
+    if (tsquery := ts_query(q)) is not None:
+        conditions.append(vector.op('@@')(tsquery))
+    return or_(*conditions)
+
+
+def search_rank(q: str, vector: Any, text: Any) -> ColumnElement:
+    rank = func.word_similarity(q, text)
+    if (tsquery := ts_query(q)) is not None:
+        rank = rank + func.ts_rank(vector, tsquery)
+    return rank.desc()
+
+
+def set_book_search_keys(book: Book):
+    book.search_keys = bangla.search_keys(
+        book.name, *(author.name for author in book.authors), book.publisher.name if book.publisher else None)
+
+
+def book_search_text() -> ColumnElement:
+    authors = select(func.string_agg(Author.name, ' ')).select_from(book_author_link).join(
+        Author, Author.id == book_author_link.c.author_id).where(book_author_link.c.book_id == Book.id).scalar_subquery()
+    publisher = select(Publisher.name).where(
+        Publisher.id == Book.publisher_id).scalar_subquery()
+    return func.concat_ws(' ', Book.name, func.replace(Book.slug, '-', ' '), authors, publisher)
+
+
+def refresh_book_search_text(where: ColumnElement):
+    return update(Book).where(where).values(search_text=book_search_text(), updated_at=Book.updated_at)
+
+
+def refresh_book_search_keys(connection: Connection, where: ColumnElement):
+    # The keys are computed in python by bangla.search_keys, written back in one executemany
+    authors = select(func.array_agg(Author.name)).select_from(book_author_link).join(
+        Author, Author.id == book_author_link.c.author_id).where(book_author_link.c.book_id == Book.id).scalar_subquery()
+    publisher = select(Publisher.name).where(Publisher.id == Book.publisher_id).scalar_subquery()
+    rows = connection.execute(select(Book.id, Book.name, authors.label('authors'), publisher.label('publisher')).where(where))
+    params = [{'b_id': row.id, 'b_keys': bangla.search_keys(row.name, *(row.authors or []), row.publisher)}
+              for row in rows]
+    if params:
+        connection.execute(update(Book).where(Book.id == bindparam('b_id')).values(
+            search_keys=bindparam('b_keys'), updated_at=Book.updated_at), params)
+
+
+@event.listens_for(SyncSession, 'after_flush')
+def refresh_flushed_books(session: SyncSession, flush_context):
+    book_ids = {obj.id for obj in session.new if isinstance(obj, Book)}
+    author_ids, publisher_ids = set(), set()
+
+    for obj in session.dirty:
+        attrs = inspect(obj).attrs
+        if isinstance(obj, Book):
+            if any(attrs[key].history.has_changes() for key in ('name', 'slug', 'authors', 'publisher', 'publisher_id')):
+                book_ids.add(obj.id)
+        elif isinstance(obj, Author) and attrs.name.history.has_changes():
+            author_ids.add(obj.id)
+        elif isinstance(obj, Publisher) and attrs.name.history.has_changes():
+            publisher_ids.add(obj.id)
+
+    conditions = []
+    if book_ids:
+        conditions.append(Book.id.in_(book_ids))
+    # Books of a renamed author or publisher, their search_keys were set with the old name
+    renamed = []
+    if author_ids:
+        renamed.append(Book.id.in_(select(book_author_link.c.book_id).where(
+            book_author_link.c.author_id.in_(author_ids))))
+    if publisher_ids:
+        renamed.append(Book.publisher_id.in_(publisher_ids))
+    if not conditions + renamed:
+        return
+
+    connection = session.connection()
+    connection.execute(refresh_book_search_text(or_(*conditions, *renamed)))
+    if renamed:
+        refresh_book_search_keys(connection, or_(*renamed))
+    session_writes(session).tables.add('books')
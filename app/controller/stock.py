@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import ColumnElement, UpdateBase, case, delete, func, insert, not_, or_, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.database import session_factory
+from app.config.settings import settings
+from app.controller.exception import BadRequestException, NotFoundException, ServerErrorException
+from app.models import Book, StockHold
+
+logger = logging.getLogger(__name__)
+
+
+async def reserve(changes: dict[UUID, int], db: AsyncSession, dry_run: bool = False) -> None:
+    """_summary_
+        Applies the stock changes of an order, positive quantities are taken and negative ones given back.
+        Every book is changed by one conditional UPDATE, so concurrent orders of the last copy cannot both
+        succeed. Books are updated in id order, two orders of the same books wait for each other instead of
+        deadlocking. The row locks are held until the order is committed.
+    Args:
+        changes (dict[UUID, int]): Quantity change by book id
+        db (AsyncSession): Database session
+        dry_run (bool): Only checks the stock (e.g. checkout summary), nothing is locked or written
+    """
+    for book_id in sorted(changes):
+        quantity = changes[book_id]
+        if quantity > 0:
+            await take(book_id, quantity, db, dry_run)
+        elif quantity < 0 and not dry_run:
+            await restock(book_id, -quantity, db)
+
+
+async def take(book_id: UUID, quantity: int, db: AsyncSession, dry_run: bool = False) -> None:
+    if quantity < 1:
+        logger.error('Cannot reduce stock by %s', quantity)
+        raise ServerErrorException('Something went wrong.')
+
+    if dry_run:
+        statement = select(Book.id).where(Book.id == book_id, available(quantity))
+    else:
+        statement = update(Book).where(Book.id == book_id, available(quantity)).values(
+            quantity=case((Book.manage_stock, Book.quantity - quantity), else_=Book.quantity),
+            in_stock=case((Book.manage_stock, Book.quantity - quantity > 0), else_=true()),
+        ).returning(Book.id).execution_options(synchronize_session=False, written_rows=[book_id])
+    await claim(statement, book_id, db)
+
+
+def available(quantity: int) -> ColumnElement[bool]:
+    # Copies held for pending payments of other orders are not available
+    return Book.in_stock & or_(not_(Book.manage_stock), Book.quantity - Book.held >= quantity)
+
+
+async def claim(statement, book_id: UUID, db: AsyncSession) -> None:
+    if await db.scalar(statement):
+        return
+    # Expired holds of the book may not be swept yet, a dry run leaves them to hold_worker
+    if isinstance(statement, UpdateBase) and await release_expired(db, book_id) and await db.scalar(statement):
+        return
+
+    book = await db.get(Book, book_id, populate_existing=True)
+    if not book:
+        raise NotFoundException('Book not found', str(book_id))
+    if not book.in_stock:
+        raise BadRequestException(
+            "Book '{}' is out of stock".format(book.name), str(book.id))
+    raise BadRequestException(
+        "Book '{}' has insufficient stock".format(book.name), str(book.id))
+
+
+async def restock(book_id: UUID, quantity: int, db: AsyncSession) -> None:
+    if quantity < 1:
+        logger.error('Cannot restock by %s', quantity)
+        raise ServerErrorException('Something went wrong.')
+
+    await db.execute(update(Book).where(Book.id == book_id, Book.manage_stock).values(
+        quantity=Book.quantity + quantity, in_stock=True,
+    ).execution_options(synchronize_session=False, written_rows=[book_id]))
+
+
+async def hold(order_id: UUID, changes: dict[UUID, int], db: AsyncSession) -> None:
+    """_summary_
+        Holds the stock of an order while its payment is pending. Held copies stay in books.quantity but are
+        not available to other orders, until release() or until the hold expires after STOCK_HOLD_TTL.
+    Args:
+        order_id (UUID): Order the payment is made for
+        changes (dict[UUID, int]): Quantity by book id
+        db (AsyncSession): Database session, the holds are kept once it is committed
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.STOCK_HOLD_TTL)
+    for book_id in sorted(changes):
+        quantity = changes[book_id]
+        if quantity < 1:
+            continue
+        await claim(update(Book).where(Book.id == book_id, available(quantity)).values(
+            held=Book.held + quantity, updated_at=Book.updated_at,
+        ).returning(Book.id).execution_options(synchronize_session=False, invalidates_cache=False), book_id, db)
+        await db.execute(insert(StockHold).values(
+            order_id=order_id, book_id=book_id, quantity=quantity, expires_at=expires_at))
+
+
+async def release(order_id: UUID, db: AsyncSession) -> int:
+    return await release_where(StockHold.order_id == order_id, db)
+
+
+async def release_expired(db: AsyncSession, book_id: UUID | None = None) -> int:
+    condition = StockHold.expires_at <= func.now()
+    if book_id:
+        condition &= StockHold.book_id == book_id
+    return await release_where(condition, db)
+
+
+async def release_where(condition: ColumnElement[bool], db: AsyncSession) -> int:
+    rows = await db.execute(delete(StockHold).where(condition).returning(StockHold.book_id, StockHold.quantity))
+    released: dict[UUID, int] = defaultdict(int)
+    for book_id, quantity in rows:
+        released[book_id] += quantity
+
+    for book_id in sorted(released):
+        await db.execute(update(Book).where(Book.id == book_id).values(
+            held=func.greatest(Book.held - released[book_id], 0), updated_at=Book.updated_at,
+        ).execution_options(synchronize_session=False, invalidates_cache=False))
+    return sum(released.values())
+
+
+async def hold_worker(stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), settings.STOCK_HOLD_SWEEP_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if stop.is_set():
+            break
+        try:
+            async with session_factory() as db:
+                if count := await release_expired(db):
+                    logger.info('Released {} expired stock holds'.format(count))
+                await db.commit()
+        except Exception:
+            logger.error(traceback.format_exc())
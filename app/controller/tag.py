@@ -1,11 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
+from sqlalchemy import select, or_
 from typing import Sequence
 from uuid import UUID
 import logging
 
 from app.models.tag import Tag
 from app.filter_schema.tag import TagFilter
+import app.controller.count as count_service
+from app.constant import CountMode
 from app.controller.exception import NotFoundException, ConflictException
 
 logger = logging.getLogger(__name__)
@@ -27,11 +29,9 @@ async def get_all_tags(filter: TagFilter, page: int, per_page: int, db: AsyncSes
     return result.scalars().all()
 
 
-async def count_tag(filter: TagFilter, db: AsyncSession) -> int:
-    query = select(func.count(Tag.id))
-    query = filter.filter(query)
-    result = await db.execute(query)
-    return result.scalar_one()
+async def count_tag(filter: TagFilter, db: AsyncSession, count_mode: CountMode = CountMode.exact) -> int:
+    query = filter.filter(select(Tag))
+    return await count_service.get_count(query, db, count_mode)
 
 
 async def create_tag(payload: dict, db: AsyncSession) -> Tag:
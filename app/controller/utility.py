@@ -3,7 +3,7 @@ from uuid import UUID
 import re
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import or_, select
 from typing import Any
 from datetime import datetime
 import pytz
@@ -30,6 +30,30 @@ async def unique_slug(base_slug: str, cls: Any, db: AsyncSession) -> str:
         slug = f"{base_slug}-{counter}"
 
 
+async def unique_slugs(base_slugs: list[str], cls: Any, db: AsyncSession) -> list[str]:
+    """_summary_
+        unique_slug for many names with two queries, the slugs are also unique among themselves.
+    Args:
+        base_slugs (list[str]): Names or slugs (e.g. ['Humayun Ahmed', 'humayun-ahmed'])
+    Returns:
+        list[str]: Slugs in the same order (e.g. ['humayun-ahmed-1', 'humayun-ahmed-2'] when humayun-ahmed exists)
+    """
+    bases = [slugify(base) for base in base_slugs]
+    taken = set((await db.scalars(select(cls.slug).where(cls.slug.in_(bases)))).all())
+    if taken:
+        taken.update((await db.scalars(select(cls.slug).where(or_(*(cls.slug.startswith(f'{base}-') for base in taken))))).all())
+
+    slugs = []
+    for base in bases:
+        slug, counter = base, 0
+        while slug in taken:
+            counter += 1
+            slug = f"{base}-{counter}"
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
 def bangladesh_time(utc_time: datetime) -> str:
     """_summary_
     Args:
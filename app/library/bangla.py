@@ -0,0 +1,133 @@
+import unicodedata
+
+VOWELS = {
+    'অ': 'o', 'আ': 'a', 'ই': 'i', 'ঈ': 'i', 'উ': 'u', 'ঊ': 'u',
+    'ঋ': 'ri', 'এ': 'e', 'ঐ': 'oi', 'ও': 'o', 'ঔ': 'ou',
+}
+VOWEL_SIGNS = {
+    'া': 'a', 'ি': 'i', 'ী': 'i', 'ু': 'u', 'ূ': 'u',
+    'ৃ': 'ri', 'ে': 'e', 'ৈ': 'oi', 'ো': 'o', 'ৌ': 'ou',
+}
+CONSONANTS = {
+    'ক': 'k', 'খ': 'kh', 'গ': 'g', 'ঘ': 'gh', 'ঙ': 'ng',
+    'চ': 'ch', 'ছ': 'chh', 'জ': 'j', 'ঝ': 'jh', 'ঞ': 'n',
+    'ট': 't', 'ঠ': 'th', 'ড': 'd', 'ঢ': 'dh', 'ণ': 'n',
+    'ত': 't', 'থ': 'th', 'দ': 'd', 'ধ': 'dh', 'ন': 'n',
+    'প': 'p', 'ফ': 'ph', 'ব': 'b', 'ভ': 'bh', 'ম': 'm',
+    'য': 'j', 'র': 'r', 'ল': 'l', 'শ': 'sh', 'ষ': 'sh',
+    'স': 's', 'হ': 'h',
+}
+# ড়, ঢ়, য় are decomposed to consonant + nukta by NFC
+NUKTA_FORMS = {'ড': 'r', 'ঢ': 'rh', 'য': 'y'}
+SIGNS = {'ং': 'ng', 'ঃ': 'h', 'ঁ': '', 'ৎ': 't'}
+HASANTA = '্'
+NUKTA = '়'
+ZERO_WIDTH = dict.fromkeys(map(ord, '\u200c\u200d\u200b\ufeff'))
+BANGLA_DIGITS = str.maketrans('০১২৩৪৫৬৭৮৯', '0123456789')
+
+# Spelling variants of romanized Bangla collapse to the same key (e.g. humayun, humaiun, হুমায়ূন -> hmn)
+PHONETIC_REPLACEMENTS = [
+    ('chh', 'c'), ('ch', 'c'), ('kh', 'k'), ('gh', 'g'), ('jh', 'j'),
+    ('th', 't'), ('dh', 'd'), ('ph', 'f'), ('bh', 'b'), ('sh', 's'),
+    ('rh', 'r'), ('ng', 'n'), ('ck', 'k'), ('z', 'j'), ('v', 'b'),
+    ('w', 'o'), ('q', 'k'), ('x', 'ks'),
+]
+PHONETIC_VOWELS = set('aeiouy')
+
+
+def normalize(text: str) -> str:
+    """_summary_
+    Args:
+        text (str): any text (e.g. 'হুমায়ূন  আহমেদ!', 'Himu-2')
+    Returns:
+        str: NFC, lower case words without punctuation, zero width joiners or Bangla digits (e.g. 'হুমায়ূন আহমেদ', 'himu 2')
+    """
+    text = unicodedata.normalize('NFC', text).translate(ZERO_WIDTH).translate(BANGLA_DIGITS).lower()
+    return ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in text).strip()
+
+
+def transliterate(text: str) -> str:
+    """_summary_
+    Args:
+        text (str): Normalized text (e.g. 'হুমায়ূন আহমেদ')
+    Returns:
+        str: Latin text, other scripts are kept as is (e.g. 'humayun ahomed')
+    """
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in CONSONANTS:
+            latin = CONSONANTS[ch]
+            if ch == 'য' and i > 0 and text[i - 1] == HASANTA:
+                latin = 'y'  # ya-phala
+            if i + 1 < n and text[i + 1] == NUKTA:
+                latin = NUKTA_FORMS.get(ch, latin)
+                i += 1
+            out.append(latin)
+
+            nxt = text[i + 1] if i + 1 < n else ''
+            if nxt in VOWEL_SIGNS:
+                out.append(VOWEL_SIGNS[nxt])
+                i += 1
+            elif nxt == HASANTA:
+                i += 1
+            elif nxt in CONSONANTS:
+                # Inherent vowel, dropped at the end of a word
+                out.append('o')
+        elif ch in VOWELS:
+            out.append(VOWELS[ch])
+        elif ch in VOWEL_SIGNS:
+            out.append(VOWEL_SIGNS[ch])
+        elif ch in SIGNS:
+            out.append(SIGNS[ch])
+        elif ch not in (HASANTA, NUKTA):
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def phonetic_key(word: str) -> str:
+    """_summary_
+    Args:
+        word (str): Transliterated word (e.g. 'humayun')
+    Returns:
+        str: Consonant skeleton without repeated letters (e.g. 'hmn'), empty when shorter than 2 letters
+    """
+    if not word.isascii() or not word.isalpha():
+        return ''
+    for old, new in PHONETIC_REPLACEMENTS:
+        word = word.replace(old, new)
+
+    key = []
+    for ch in word:
+        if ch in PHONETIC_VOWELS or (key and key[-1] == ch):
+            continue
+        key.append(ch)
+    return ''.join(key) if len(key) >= 2 else ''
+
+
+def word_keys(word: str) -> tuple[str, str, str]:
+    latin = transliterate(word)
+    return word, latin, phonetic_key(latin)
+
+
+def search_keys(*texts: str | None) -> str:
+    """_summary_
+        Precomputed at write time so searches in either script hit the index instead of computing similarity per row.
+    Args:
+        texts (str | None): Name, author names, publisher name etc.
+    Returns:
+        str: Space separated normalized, transliterated and phonetic keys of every word
+    """
+    keys: set[str] = set()
+    for text in texts:
+        if not text:
+            continue
+        for word in normalize(text).split():
+            keys.update(key for key in word_keys(word) if key)
+    return ' '.join(sorted(keys))
+
+
+def query_terms(q: str) -> list[tuple[str, str, str]]:
+    return [word_keys(word) for word in normalize(q).split()]
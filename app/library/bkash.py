@@ -3,6 +3,7 @@ import logging
 import traceback
 
 from app.config.settings import settings
+from app.library.metrics import BKASH_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +22,8 @@ async def grant_token() -> str | None:
     }
     try:
         async with AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers, timeout=10)
+            with BKASH_SECONDS.time('grant_token'):
+                response = await client.post(url, json=payload, headers=headers, timeout=10)
             if response.status_code != 200:
                 logger.error(
                     'Failed to init bkash grant token, response: %s', response.text)
@@ -42,7 +44,8 @@ async def initiate_payment(id_token: str, payload: dict) -> dict | None:
     }
     try:
         async with AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
+            with BKASH_SECONDS.time('create_payment'):
+                response = await client.post(url, json=payload, headers=headers)
             if response.status_code != 200:
                 logger.error(
                     'Failed to create bkash payment, response: %s', response.text)
@@ -65,7 +68,8 @@ async def execute_payment(payment_id: str, id_token: str) -> dict | None:
     }
     try:
         async with AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
+            with BKASH_SECONDS.time('execute_payment'):
+                response = await client.post(url, json=payload, headers=headers)
             if response.status_code != 200:
                 logger.error(
                     'Failed to execute bkash payment, response: %s', response.text)
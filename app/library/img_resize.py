@@ -1,40 +1,118 @@
-from PIL import Image
+import asyncio
 import io
 import logging
-import aiofiles
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple
+from uuid import uuid4
+
+from PIL import Image, ImageOps, features
+
+from app.config.settings import settings
+from app.library.metrics import QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
 
-async def img_resize(file_path: str, dimension: Tuple[int, int], max_kb: int) -> None:
+# The first format is the main file of an image, the others are alternatives for <picture> sources
+FORMATS = [fmt for fmt in ('WEBP', 'AVIF') if features.check(fmt.lower())]
+SCALES = (1, 2)  # Responsive sizes, 2 is for high density screens
+MIN_QUALITY, MAX_QUALITY = 20, 95
+# Encoder effort, every image is encoded ~7 times by the quality search
+OPTIONS = {'WEBP': {'method': 4}, 'AVIF': {'speed': 8}}
+
+
+class ImagePool:
+    """_summary_
+        Worker processes for the Pillow work of uploads, started by the app lifespan so resizing and
+        encoding never run on the event loop. Outside the lifespan (scripts, tests) a thread is used.
+    """
+
+    def __init__(self):
+        self.executor: ProcessPoolExecutor | None = None
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        logger.info('Image pool started with {} workers'.format(settings.IMAGE_PROCESS_WORKERS))
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+        self.executor = None
+
+
+pool = ImagePool()
+
+
+def encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, quality=quality, **OPTIONS.get(fmt, {}))
+    return buffer.getvalue()
+
+
+def fit_quality(image: Image.Image, fmt: str, max_bytes: int) -> Tuple[bytes, int]:
+    """_summary_
+        Binary search for the highest quality that fits in max_bytes, the lowest quality if none fits.
+    Returns:
+        Tuple[bytes, int]: Encoded image and the number of encodes
+    """
+    lo, hi = MIN_QUALITY, MAX_QUALITY
+    best, blob, count = None, b'', 0
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        blob = encode(image, fmt, quality)
+        count += 1
+        if len(blob) <= max_bytes:
+            best, lo = blob, quality + 1
+        else:
+            hi = quality - 1
+    # Nothing fits when the search ends with MIN_QUALITY as the last encode
+    return best or blob, count
+
+
+def optimize(blob: bytes, filename: str, dimension: Tuple[int, int], max_kb: int) -> list[Tuple[str, bytes]]:
+    """_summary_
+        Resizes the image to fit in dimension for every scale of SCALES and encodes it in every format of
+        FORMATS within max_kb (scaled with the area). Runs in a worker process, so it takes and returns bytes.
+    Args:
+        blob (bytes): Uploaded file
+        filename (str): Uploaded filename (e.g. 'cover.jpg')
+        dimension (Tuple[int, int]): Bounding box of the 1x size
+        max_kb (int): Size limit of the 1x size
+    Returns:
+        list[Tuple[str, bytes]]: (filename, content) pairs, the first is the main file (e.g. 'cover-1f3a9c0e.webp'),
+            followed by e.g. 'cover-1f3a9c0e.avif', 'cover-1f3a9c0e@2x.webp' and 'cover-1f3a9c0e@2x.avif'
+    """
+    # Every upload gets its own names, cover.jpg and cover.png would both become cover.webp
+    stem = '{}-{}'.format(os.path.splitext(filename)[0], uuid4().hex[:8])
+    with Image.open(io.BytesIO(blob)) as source:
+        source = ImageOps.exif_transpose(source)
+        source = source.convert('RGBA' if 'A' in source.getbands() or 'transparency' in source.info else 'RGB')
+
+        files: list[Tuple[str, bytes]] = []
+        for scale in SCALES:
+            box = (dimension[0] * scale, dimension[1] * scale)
+            if scale > 1 and source.width < box[0] and source.height < box[1]:
+                break  # The source is too small for a larger size
+            image = source.copy()
+            image.thumbnail(box, Image.Resampling.LANCZOS)
+
+            suffix = '' if scale == 1 else '@{}x'.format(scale)
+            for fmt in FORMATS:
+                content, count = fit_quality(image, fmt, max_kb * 1024 * scale ** 2)
+                files.append(('{}{}.{}'.format(stem, suffix, fmt.lower()), content))
+                logger.debug('{}: {} {}x{} {:,.1f}KB in {} encodes'.format(
+                    filename, fmt, *image.size, len(content) / 1024, count))
+    return files
+
+
+async def img_resize(blob: bytes, filename: str, dimension: Tuple[int, int], max_kb: int) -> list[Tuple[str, bytes]]:
+    loop = asyncio.get_running_loop()
+    # Images waiting for or in the pool of this worker
+    QUEUE_DEPTH.inc('image_resize')
     try:
-        logger.debug(f"Resizing image: {file_path}")
-        with Image.open(file_path) as image: 
-            if 'A' in image.getbands():
-                image = image.convert('RGB')
-            
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG')
-            initial_size = f"{img_buffer.tell() / 1024:,.1f}KB"
-            
-
-            image.thumbnail(dimension, Image.Resampling.LANCZOS)
-            quality = 100
-            counter = 0
-            while img_buffer.tell() > max_kb * 1024:
-                quality -= 5
-                img_buffer = io.BytesIO()
-                image.save(img_buffer, format='JPEG', optimize=True, quality=quality)
-                counter += 1
-                if quality <= 15:
-                    break
-                
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(img_buffer.getvalue())
-                
-            final_size = f"{img_buffer.tell() / 1024:,.1f}KB"
-            logger.info(f"Image size reduced from {initial_size} to {final_size} in {counter} iterations")
-            
-    except Exception as err:
-        logger.error(f'Error while resizing image: {err}')
-        
+        files = await loop.run_in_executor(pool.executor, optimize, blob, filename, dimension, max_kb)
+    finally:
+        QUEUE_DEPTH.inc('image_resize', value=-1)
+    logger.info('Image {} optimized from {:,.1f}KB to {:,.1f}KB'.format(
+        filename, len(blob) / 1024, len(files[0][1]) / 1024))
+    return files
@@ -0,0 +1,143 @@
+import logging
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SECOND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@dataclass
+class Histogram:
+    bounds: tuple
+    # Observations per bound, the last one above every bound
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0
+    count: int = 0
+
+    def observe(self, value: float):
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'buckets': {str(bound): count for bound, count in zip(self.bounds + ('+Inf',), self.counts)},
+            'sum': round(self.sum, 6),
+            'count': self.count,
+        }
+
+
+class Family:
+    """_summary_
+        Metric of this worker process with one sample per label values, rendered in the Prometheus text format
+        by app.controller.metrics with the samples of every worker under a worker label
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labels: tuple[str, ...] = (), bounds: tuple = SECOND_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind  # counter, gauge or histogram
+        self.labels = labels
+        self.bounds = bounds
+        self.samples: dict[tuple[str, ...], Any] = {}
+        registry[name] = self
+
+    def inc(self, *labels: str, value: float = 1):
+        self.samples[labels] = self.samples.get(labels, 0) + value
+
+    def set(self, *labels: str, value: float):
+        self.samples[labels] = value
+
+    def observe(self, *labels: str, value: float):
+        if labels not in self.samples:
+            self.samples[labels] = Histogram(self.bounds)
+        self.samples[labels].observe(value)
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    def state(self) -> dict:
+        return {
+            'help': self.help,
+            'type': self.kind,
+            'labels': list(self.labels),
+            'bounds': list(self.bounds) if self.kind == 'histogram' else [],
+            'samples': [[list(labels), {'counts': value.counts, 'sum': value.sum, 'count': value.count}
+                         if isinstance(value, Histogram) else value] for labels, value in self.samples.items()],
+        }
+
+
+registry: dict[str, Family] = {}
+# Called before a snapshot, to set gauges from their source (e.g. the connection pool)
+collectors: list[Callable[[], None]] = []
+
+
+def on_collect(collector: Callable[[], None]):
+    collectors.append(collector)
+    return collector
+
+
+def snapshot() -> dict:
+    for collect in collectors:
+        try:
+            collect()
+        except Exception:
+            logger.error(traceback.format_exc())
+    return {name: family.state() for name, family in registry.items()}
+
+
+REQUEST_SECONDS = Family('http_request_duration_seconds', 'Request latency by route template and status',
+                         'histogram', ('method', 'route', 'status'))
+DB_STATEMENTS = Family('db_statements_per_request', 'SQL statements sent by a request', 'histogram',
+                       ('route',), QUERY_BUCKETS)
+DB_SECONDS = Family('db_seconds_per_request', 'Time a request spent in SQL statements', 'histogram', ('route',))
+DB_POOL_CONNECTIONS = Family('db_pool_connections', 'Connections of the primary pool', 'gauge', ('state',))
+DB_POOL_EVENTS = Family('db_pool_events_total', 'Events of the primary pool', 'counter', ('event',))
+REDIS_SECONDS = Family('redis_command_duration_seconds', 'Redis command latency', 'histogram', ('command',))
+S3_SECONDS = Family('s3_request_duration_seconds', 'S3 request latency', 'histogram', ('operation',))
+BKASH_SECONDS = Family('bkash_request_duration_seconds', 'bKash API latency', 'histogram', ('operation',))
+QUEUE_DEPTH = Family('background_queue_depth', 'Work waiting for a background worker', 'gauge', ('queue',))
+
+
+class MetricsMiddleware:
+    """_summary_
+        Records the latency of every request by method, route template and status. Requests that match no
+        route are recorded under an empty route, their paths would make a label per url.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = ['500']
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            REQUEST_SECONDS.observe(scope['method'], route.path if route is not None else '', status[0],
+                                    value=time.perf_counter() - started)
@@ -0,0 +1,151 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from asgi_correlation_id import correlation_id
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.settings import settings
+from app.library.metrics import DB_SECONDS, DB_STATEMENTS, QUERY_BUCKETS, SECOND_BUCKETS, Histogram, on_collect
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(queries: int) -> Callable:
+    """_summary_
+        Declares the most SQL statements a request of the endpoint may send. Exceeding it is logged, and
+        raised when QUERY_BUDGET_STRICT is set (tests)
+    Args:
+        queries (int): Statements per request, dependencies (e.g. the user of the token) included
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = queries  # type: ignore
+        return endpoint
+    return decorator
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    sql_seconds: float = 0
+
+
+@dataclass
+class RouteStats:
+    queries: Histogram = field(default_factory=lambda: Histogram(QUERY_BUCKETS))
+    sql_seconds: Histogram = field(default_factory=lambda: Histogram(SECOND_BUCKETS))
+    seconds: Histogram = field(default_factory=lambda: Histogram(SECOND_BUCKETS))
+    over_budget: int = 0
+
+
+# Requests in flight by correlation id, statements outside of a request (workers) are not counted
+requests: dict[str, RequestStats] = {}
+# Stats of this worker process by 'METHOD /path' of the route
+routes: dict[str, RouteStats] = {}
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = requests.get(correlation_id.get() or '')
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+
+
+def handle_error(context):
+    # A failed statement has no after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def instrument(engine: Engine):
+    # Statements of the engine are counted for the request of the correlation id they run in
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+
+def route_key(scope: Scope) -> str | None:
+    route = scope.get('route')
+    return '{} {}'.format(scope['method'], route.path) if route is not None else None
+
+
+class QueryStatsMiddleware:
+    """_summary_
+        Records the statements, SQL time and duration of every request per route and checks the budget of
+        query_budget. Added inside CorrelationIdMiddleware, the correlation id is set before it runs.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        id = correlation_id.get()
+        if scope['type'] != 'http' or not id:
+            return await self.app(scope, receive, send)
+
+        stats = requests[id] = RequestStats()
+        started = time.perf_counter()
+        response_started = [False]
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                response_started[0] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests.pop(id, None)
+            key = route_key(scope)
+            if key is not None and response_started[0]:
+                self.record(key, stats, time.perf_counter() - started, scope['route'].endpoint)
+
+    def record(self, key: str, stats: RequestStats, seconds: float, endpoint: Any):
+        route = routes.setdefault(key, RouteStats())
+        route.queries.observe(stats.queries)
+        route.sql_seconds.observe(stats.sql_seconds)
+        route.seconds.observe(seconds)
+
+        budget = getattr(endpoint, 'query_budget', None)
+        if budget is not None and stats.queries > budget:
+            route.over_budget += 1
+            msg = '{} sent {} statements, the budget is {}'.format(key, stats.queries, budget)
+            logger.warning(msg)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(msg)
+
+
+def snapshot() -> dict:
+    return {
+        'pid': os.getpid(),
+        'routes': {key: {
+            'queries': route.queries.as_dict(),
+            'sql_seconds': route.sql_seconds.as_dict(),
+            'seconds': route.seconds.as_dict(),
+            'over_budget': route.over_budget,
+        } for key, route in sorted(routes.items())},
+    }
+
+
+@on_collect
+def collect_routes():
+    # The route histograms are the samples of the Prometheus metrics, by 'METHOD /path'
+    for key, route in routes.items():
+        DB_STATEMENTS.samples[(key,)] = route.queries
+        DB_SECONDS.samples[(key,)] = route.sql_seconds
@@ -1,31 +1,79 @@
 import logging
 import mimetypes
-import os
 import traceback
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import lru_cache
 from io import BufferedReader
+from typing import Any, AsyncIterator
 
 import aioboto3
+from aiobotocore.config import AioConfig
 from botocore.exceptions import ClientError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config.settings import settings
+from app.library.metrics import S3_SECONDS
 
 logger = logging.getLogger(__name__)
 
 
-async def upload_file(file: BufferedReader | bytes, filename: str, folder: str) -> str | None:
-    try:
-        session = aioboto3.Session(
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
+class S3ClientManager:
+    """_summary_
+        One S3 client with a connection pool of S3_MAX_POOL_CONNECTIONS, opened by the app lifespan and
+        reused by every call, so credentials and TLS connections are not set up per upload or deletion.
+    """
 
-        content_type, _ = mimetypes.guess_type(filename)
+    def __init__(self):
+        self.stack: AsyncExitStack | None = None
+        self.client: Any = None
 
-        async with session.client('s3') as s3:  # type: ignore
-            key = f"{folder}/{filename}"
+    async def start(self):
+        self.stack = AsyncExitStack()
+        self.client = await self.stack.enter_async_context(new_client())
+        logger.info('S3 client started')
+
+    async def close(self):
+        if self.stack:
+            await self.stack.aclose()
+        self.stack = self.client = None
+
+
+def new_client() -> Any:
+    session = aioboto3.Session(
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_REGION
+    )
+    return session.client('s3', endpoint_url=settings.AWS_ENDPOINT_URL,  # type: ignore
+                          config=AioConfig(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS))
+
+
+manager = S3ClientManager()
+
+
+@asynccontextmanager
+async def client() -> AsyncIterator[Any]:
+    """_summary_
+        Shared client of the app (e.g. async with s3.client() as client), a short lived one outside the
+        lifespan such as in scripts. AWS_ENDPOINT_URL points it to a local S3 stand-in such as MinIO or moto.
+    """
+    if manager.client is not None:
+        yield manager.client
+        return
+    async with new_client() as s3:
+        yield s3
+
+
+async def upload_file(file: BufferedReader | bytes, filename: str, folder: str, s3: Any = None) -> str | None:
+    if s3 is None:
+        async with client() as s3:
+            return await upload_file(file, filename, folder, s3)
+
+    try:
+        content_type, _ = mimetypes.guess_type(filename)
+        key = f"{folder}/{filename}"
+        with S3_SECONDS.time('put_object'):
             await s3.put_object(
                 Bucket=settings.BUCKET_NAME,
                 Key=key,
@@ -33,10 +81,10 @@ async def upload_file(file: BufferedReader | bytes, filename: str, folder: str)
                 ContentType=content_type,
                 ACL='public-read'  # Set ACL to public-read
             )
-            logger.info(
-                "File '{}' uploaded successfully to '{}'".format(filename, folder))
+        logger.info(
+            "File '{}' uploaded successfully to '{}'".format(filename, folder))
 
-            return key
+        return key
 
     except ClientError:
         logger.error(f"Failed to upload file: {traceback.format_exc()}")
@@ -44,33 +92,42 @@ async def upload_file(file: BufferedReader | bytes, filename: str, folder: str)
 
 async def delete_file(filename: str, folder: str) -> bool:
     try:
-        session = aioboto3.Session(
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
-        async with session.client('s3') as s3:  # type: ignore
+        async with client() as s3:
             key = f"{folder}/{filename}"
-            await s3.delete_object(Bucket=settings.BUCKET_NAME, Key=key)
+            with S3_SECONDS.time('delete_object'):
+                await s3.delete_object(Bucket=settings.BUCKET_NAME, Key=key)
         return True
     except ClientError:
         logger.error(f"Failed to delete file: {traceback.format_exc()}")
         return False
 
 
+async def delete_files(keys: list[str]) -> dict[str, str]:
+    """_summary_
+    Args:
+        keys (list[str]): Up to 1000 keys (e.g. ['book/1.jpg']), deleted with one DeleteObjects call
+    Returns:
+        dict[str, str]: Error by key of the keys that were not deleted
+    """
+    async with client() as s3:
+        with S3_SECONDS.time('delete_objects'):
+            res = await s3.delete_objects(Bucket=settings.BUCKET_NAME, Delete={
+                'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+    return {error['Key']: '{}: {}'.format(error.get('Code'), error.get('Message')) for error in res.get('Errors', [])}
+
+
+base_url = (settings.IMAGE_BASE_URL or
+            f"https://{settings.BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com").rstrip('/')
+
+
+@lru_cache(maxsize=100_000)
 def public_url(filename: str, folder: str) -> str:
-    key = os.path.join(folder, filename)
-    return f"https://{settings.BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
+    return f"{base_url}/{folder}/{filename}"
 
 
 async def signed_url(filename: str, folder: str, expires_in: int = 3600):
     try:
-        session = aioboto3.Session(
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
-        async with session.client('s3') as s3:  # type: ignore
+        async with client() as s3:
             key = f"{folder}/{filename}"
             url = await s3.generate_presigned_url(
                 'get_object',
@@ -88,12 +145,7 @@ async def attach_s3_imgs_with_books(target_page: int, db: AsyncSession):
     folder = 'book'
     not_found = []
     try:
-        session = aioboto3.Session(
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
-        async with session.client('s3') as s3:  # type: ignore
+        async with client() as s3:
             paginator = s3.get_paginator('list_objects_v2')
             page_number = 0
             async for page in paginator.paginate(Bucket=settings.BUCKET_NAME, Prefix=folder):
@@ -127,7 +179,7 @@ async def attach_s3_imgs_with_books(target_page: int, db: AsyncSession):
                                         break
                                 else:
                                     image = Image(name=filename,
-                                                  src='', public_id='', folder=folder)
+                                                  folder=folder)
                                     db.add(image)
                                     book.images = [image]
                                     await db.commit()
@@ -152,19 +204,16 @@ async def attach_s3_imgs_with_books(target_page: int, db: AsyncSession):
     logger.info('Exit from attach_s3_imgs_with_books')
 
 
-async def is_file_exists(filename: str, folder: str) -> bool:
-    session = aioboto3.Session(
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_REGION
-    )
+async def is_file_exists(filename: str, folder: str, s3: Any = None) -> bool:
+    if s3 is None:
+        async with client() as s3:
+            return await is_file_exists(filename, folder, s3)
 
     key = f"{folder}/{filename}"
 
     try:
-        async with session.client('s3') as s3:  # type: ignore
-            await s3.head_object(Bucket=settings.BUCKET_NAME, Key=key)
-            return True
+        await s3.head_object(Bucket=settings.BUCKET_NAME, Key=key)
+        return True
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
             return False
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from fastapi.utils import is_body_allowed_for_status_code
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+
+type_adapters: dict[Any, TypeAdapter] = {}
+
+# Injects the response of the dependencies into endpoints that do not declare one, to copy its headers
+SUB_RESPONSE = '_serialized_route_response'
+
+
+def type_adapter(schema: Any) -> TypeAdapter:
+    if schema not in type_adapters:
+        type_adapters[schema] = TypeAdapter(schema)
+    return type_adapters[schema]
+
+
+def dump_json(content: Any, schema: Any, **options) -> bytes:
+    """_summary_
+        Validates ORM objects into the schema once and writes JSON from pydantic-core, without the intermediate
+        python dicts of FastAPI's serialize_response. Models of the schema pass through validation as they are.
+    Args:
+        content (Any): ORM object(s) or models (e.g. list[Book])
+        schema (Any): Response model (e.g. list[BookOut])
+        **options: Options of TypeAdapter.dump_json (e.g. exclude_none=True)
+    Returns:
+        bytes: JSON body
+    """
+    adapter = type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True), **options)
+
+
+class SerializedRoute(APIRoute):
+    """_summary_
+        Route class of every router. The output of endpoints with a response_model is serialized by dump_json
+        with a TypeAdapter cached per response model, endpoints returning a Response are left as they are.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        if self.response_model is not None:
+            self.dependant.call = self.serialized(self.dependant.call)
+        return super().get_route_handler()
+
+    def serialized(self, call: Callable[..., Any]) -> Callable[..., Coroutine[Any, Any, Any]]:
+        is_coroutine = asyncio.iscoroutinefunction(call)
+        declared = self.dependant.response_param_name
+        if declared is None:
+            self.dependant.response_param_name = SUB_RESPONSE
+        schema = self.response_model
+        options = {
+            'include': self.response_model_include,
+            'exclude': self.response_model_exclude,
+            'by_alias': self.response_model_by_alias,
+            'exclude_unset': self.response_model_exclude_unset,
+            'exclude_defaults': self.response_model_exclude_defaults,
+            'exclude_none': self.response_model_exclude_none,
+        }
+
+        async def endpoint(**values: Any) -> Any:
+            sub_response: Response = values[declared] if declared else values.pop(SUB_RESPONSE)
+            content = await call(**values) if is_coroutine else await run_in_threadpool(call, **values)
+            if isinstance(content, Response):
+                return content
+
+            status_code = sub_response.status_code or self.status_code or 200
+            body = dump_json(content, schema, **options) if is_body_allowed_for_status_code(status_code) else b''
+            response = Response(content=body, status_code=status_code, media_type='application/json')
+            response.headers.raw.extend((name, value) for name, value in sub_response.headers.raw
+                                        if name != b'content-length')
+            return response
+
+        return endpoint
@@ -1,14 +1,21 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from api_analytics.fastapi import Analytics
+import asyncio
 import logging
 
-from app.config.database import create_tables, drop_tables
+from app.config.database import create_tables, drop_tables, replica, replica_engine
 from app.config.settings import settings
-from app.config.redis import get_redis, get_cache
+from app.config.redis import get_redis, get_cache, cache
 from app.config.logging_conf import configure_logging
+import app.library.s3 as s3
+from app.library.img_resize import pool as image_pool
+from app.library.metrics import MetricsMiddleware
+from app.library.query_stats import QueryStatsMiddleware
+from app.controller import image_deletion, inventory_valuation, metrics, order_rollup, stock
 
 from app.api_routes import router as api_router
 
@@ -20,6 +27,8 @@ async def lifespan(app: FastAPI):
     # startup
     configure_logging()
     app.state.redis = await get_redis()
+    await s3.manager.start()
+    image_pool.start()
 
     try:
         # await drop_tables()
@@ -29,9 +38,39 @@ async def lifespan(app: FastAPI):
             'Failed to connect database. "Check if the virtual env is activated."')
         logger.error(f'{err.__class__}: {err}')
 
+    stop_deletions = asyncio.Event()
+    deletion_worker = asyncio.create_task(image_deletion.worker(stop_deletions))
+    stop_replica = asyncio.Event()
+    replica_monitor = asyncio.create_task(replica.run(stop_replica))
+    stop_rollups = asyncio.Event()
+    rollup_worker = asyncio.create_task(order_rollup.worker(stop_rollups))
+    stop_reconcile = asyncio.Event()
+    reconcile_worker = asyncio.create_task(inventory_valuation.worker(stop_reconcile))
+    stop_holds = asyncio.Event()
+    hold_worker = asyncio.create_task(stock.hold_worker(stop_holds))
+    stop_metrics = asyncio.Event()
+    metrics_worker = asyncio.create_task(metrics.worker(stop_metrics))
+
     yield
     # shutdown
+    stop_deletions.set()
+    await deletion_worker
+    stop_replica.set()
+    await replica_monitor
+    stop_rollups.set()
+    await rollup_worker
+    stop_reconcile.set()
+    await reconcile_worker
+    stop_holds.set()
+    await hold_worker
+    stop_metrics.set()
+    await metrics_worker
+    if replica_engine is not None:
+        await replica_engine.dispose()
     await app.state.redis.close()
+    await cache.aclose()
+    await s3.manager.close()
+    image_pool.close()
 
 
 app = FastAPI(
@@ -46,6 +85,7 @@ app = FastAPI(
         'name': 'MIT'
     },
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     root_path='/api/v1'
 )
 
@@ -54,7 +94,10 @@ origins = [
     settings.BKASH_URL,
     "https://test.pathokpoint.com"
 ]
+# Inside CorrelationIdMiddleware, statements are attributed to the correlation id of the request
+app.add_middleware(QueryStatsMiddleware)
 app.add_middleware(CorrelationIdMiddleware)
+app.add_middleware(MetricsMiddleware)
 # app.add_middleware(Analytics, api_key=settings.FASTAPI_ANALYTICS_API_KEY)
 app.add_middleware(
     CORSMiddleware,
@@ -63,7 +106,7 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=['*'],
     expose_headers=['X-Total-Count', 'X-Total-Pages',
-                    'X-Current-Page', 'X-Per-Page']
+                    'X-Current-Page', 'X-Per-Page', 'X-Next-Cursor', 'X-Cache']
 )
 
 app.include_router(api_router)
@@ -4,14 +4,16 @@ from .author import Author # noqa: F401
 from .book import Book # noqa: F401
 from .category import Category # noqa: F401
 from .publisher import Publisher # noqa: F401
-from .order import Order, OrderItem, OrderStatus # noqa: F401
+from .order import Order, OrderItem, OrderRollup, OrderRollupDelta, OrderStatus # noqa: F401
 from .address import Address # noqa: F401
 from .coupon import Coupon # noqa: F401
 from .courier import Courier # noqa: F401
 from .user import User # noqa: F401
-from .image import Image # noqa: F401
+from .image import Image, ImageDeletion # noqa: F401
 from .tag import Tag, book_tag_link # noqa: F401
 from .transaction import Transaction # noqa: F401
 from .payment_gateway import PaymentGateway # noqa: F401
 from .review import Review # noqa: F401
-from .setting import Setting # noqa: F401
\ No newline at end of file
+from .setting import Setting # noqa: F401
+from .inventory import InventoryValuation, InventoryValuationDelta # noqa: F401
+from .stock_hold import StockHold # noqa: F401
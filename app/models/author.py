@@ -2,8 +2,8 @@ import uuid
 from datetime import date
 from typing import List
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Table
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, Computed, ForeignKey, Index, Integer, String, Table
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.constant import Country
@@ -21,6 +21,8 @@ class Author(TimestampMixin):
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(String, index=True, unique=True)
     slug: Mapped[str] = mapped_column(String(100), index=True, unique=True)
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, Computed(
+        "to_tsvector('simple', name || ' ' || replace(slug, '-', ' '))", persisted=True), deferred=True)
 
     description: Mapped[str | None]
     birth_date: Mapped[date | None]
@@ -57,6 +59,11 @@ class Author(TimestampMixin):
         return f'<Author (name={self.name}, slug={self.slug})>'
 
 
+Index('ix_authors_search_vector', Author.search_vector, postgresql_using='gin')
+Index('ix_authors_name_trgm', Author.name, postgresql_using='gin',
+      postgresql_ops={'name': 'gin_trgm_ops'})
+
+
 book_author_link = Table(
     "book_author_link",
     Base.metadata,
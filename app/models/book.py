@@ -4,15 +4,18 @@ from typing import TYPE_CHECKING, List
 from sqlalchemy import (
     Boolean,
     Column,
+    Computed,
     Enum,
     Float,
     ForeignKey,
     Identity,
+    Index,
     Integer,
     String,
     Table,
+    func,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.constant import Condition, Country, Cover, Language, StockLocation
@@ -39,6 +42,7 @@ class Book(TimestampMixin):
     sale_price: Mapped[float]
     manage_stock: Mapped[bool]
     quantity: Mapped[int] = mapped_column(Integer, default=0)
+    held: Mapped[int] = mapped_column(Integer, default=0, server_default='0')  # Sum of StockHold, pending payments
     in_stock: Mapped[bool] = mapped_column(Boolean, default=True)
     pre_order: Mapped[bool] = mapped_column(Boolean, default=False)
     shipping_required: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -72,6 +76,13 @@ class Book(TimestampMixin):
     weight_in_gm: Mapped[float] = mapped_column(Float, default=0)
     cost: Mapped[float] = mapped_column(Float, default=0)
 
+    # Search, search_text (name, slug, author and publisher names) is refreshed on flush by app.controller.search
+    # search_keys (normalized, transliterated and phonetic keys) is set where books are written
+    search_text: Mapped[str | None] = mapped_column(String, deferred=True)
+    search_keys: Mapped[str | None] = mapped_column(String, deferred=True)
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, Computed(
+        "to_tsvector('simple', coalesce(search_text, '') || ' ' || coalesce(search_keys, ''))", persisted=True), deferred=True)
+
     # Relationship
     authors: Mapped[List['Author']] = relationship(
         secondary='book_author_link', back_populates='books')
@@ -91,6 +102,23 @@ class Book(TimestampMixin):
         return f'<Book (name={self.name}, slug={self.slug})>'
 
 
+# Composite (sort field, id) indexes for keyset pagination of /book/all
+Index('ix_books_created_at_id', Book.created_at, Book.id)
+Index('ix_books_updated_at_id', Book.updated_at, Book.id)
+Index('ix_books_name_id', Book.name, Book.id)
+Index('ix_books_regular_price_id', Book.regular_price, Book.id)
+Index('ix_books_sale_price_id', Book.sale_price, Book.id)
+Index('ix_books_quantity_id', Book.quantity, Book.id)
+Index('ix_books_weight_in_gm_id', Book.weight_in_gm, Book.id)
+Index('ix_books_shelf_id', func.coalesce(Book.shelf, ''), Book.id)
+Index('ix_books_cost_id', Book.cost, Book.id)
+Index('ix_books_in_stock_id', Book.in_stock, Book.id)
+
+Index('ix_books_search_vector', Book.search_vector, postgresql_using='gin')
+Index('ix_books_search_text_trgm', Book.search_text, postgresql_using='gin',
+      postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
 book_image_link = Table(
     'book_image_link',
     Base.metadata,
@@ -1,8 +1,8 @@
 import uuid
 from typing import List
 
-from sqlalchemy import Boolean, Column, ForeignKey, String, Table
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, Computed, ForeignKey, Index, String, Table
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.base import Base
@@ -18,6 +18,8 @@ class Category(TimestampMixin):
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(String, index=True, unique=True)
     slug: Mapped[str] = mapped_column(String(100), index=True, unique=True)
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, Computed(
+        "to_tsvector('simple', name || ' ' || replace(slug, '-', ' '))", persisted=True), deferred=True)
 
     description: Mapped[str | None]
     is_islamic: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -52,6 +54,11 @@ class Category(TimestampMixin):
         return f'<Category (name={self.name}, slug={self.slug})>'
 
 
+Index('ix_categories_search_vector', Category.search_vector, postgresql_using='gin')
+Index('ix_categories_name_trgm', Category.name, postgresql_using='gin',
+      postgresql_ops={'name': 'gin_trgm_ops'})
+
+
 book_category_link = Table(
     "book_category_link",
     Base.metadata,
@@ -1,14 +1,13 @@
-import asyncio
 import logging
 import uuid
+from datetime import datetime
 
-from sqlalchemy import String, event
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DDL, BigInteger, DateTime, Identity, Integer, String, event, func
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy.orm.attributes import set_committed_value
 
-import app.library.s3 as s3
 from app.constant.image import ImageFolder
+from app.models.base import Base
 from app.models.mixins import TimestampMixin
 
 logger = logging.getLogger(__name__)
@@ -20,30 +19,49 @@ class Image(TimestampMixin):
     id: Mapped[uuid.UUID] = mapped_column(UUID(
         as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str]
-    src: Mapped[str] = mapped_column(String, default='')    
     folder: Mapped[ImageFolder] = mapped_column(
         String, default=ImageFolder.dummy)
+    # Other sizes and formats of an optimized upload in the same folder (e.g. ['a.avif', 'a@2x.webp'])
+    variants: Mapped[list[str]] = mapped_column(
+        ARRAY(String), default=list, server_default='{}')
 
     def __repr__(self):
         return f'<Image (filename={self.name})>'
 
 
-@event.listens_for(Image, 'after_delete')
-def after_delete(mapper, connection, target: Image):
-    loop = asyncio.get_event_loop()
-    loop.create_task(after_delete_async(target))
+class ImageDeletion(Base):
+    """_summary_
+        Outbox of S3 keys to delete, filled by a trigger on images so ORM, bulk and cascaded deletes are all
+        covered and rolled back with their transaction. Drained by app.controller.image_deletion.
+    """
+    __tablename__ = 'image_deletions'
 
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    key: Mapped[str]
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    last_error: Mapped[str | None]
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f'<ImageDeletion (key={self.key}, attempts={self.attempts})>'
 
-async def after_delete_async(target: Image):
-    try:
-        is_success = await s3.delete_file(target.name, target.folder)
-        logger.debug('Delete image event for "{}" is_success: {}'.format(
-            target.name, is_success))
-    except Exception:
-        pass
 
+enqueue_image_deletion = DDL('''
+CREATE OR REPLACE FUNCTION enqueue_image_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO image_deletions (key)
+    SELECT deleted_images.folder || '/' || file
+    FROM deleted_images, unnest(array_prepend(deleted_images.name, deleted_images.variants)) AS file;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql''')
+image_deletion_trigger = DDL('''
+CREATE TRIGGER images_enqueue_deletion AFTER DELETE ON images
+REFERENCING OLD TABLE AS deleted_images
+FOR EACH STATEMENT EXECUTE FUNCTION enqueue_image_deletion()''')
+event.listen(Image.__table__, 'after_create', enqueue_image_deletion)
+event.listen(Image.__table__, 'after_create', image_deletion_trigger)
 
-@event.listens_for(Image, 'load')
-def generate_url(target: Image, context):
-    set_committed_value(target, 'src', s3.public_url(
-        target.name, target.folder))
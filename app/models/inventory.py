@@ -0,0 +1,115 @@
+from sqlalchemy import DDL, BigInteger, Identity, Integer, Numeric, String, event
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+from app.models.tag import book_tag_link
+
+
+class InventoryValuation(Base):
+    """_summary_
+        Stock and value of the books per tag, stock location and condition. Triggers on books and book_tag_link
+        append the difference of every insert, update and delete (orders, book CRUD, CSV import) to
+        inventory_valuation_deltas in the same transaction, app.controller.inventory_valuation folds them in
+        here and reconciles the sum with a full recompute.
+    """
+    __tablename__ = 'inventory_valuations'
+
+    dimension: Mapped[str] = mapped_column(String, primary_key=True)  # tag, stock_location or condition
+    key: Mapped[str] = mapped_column(String, primary_key=True)  # Tag id or enum name
+    quantity: Mapped[int] = mapped_column(Integer, default=0)
+    unique_product: Mapped[int] = mapped_column(Integer, default=0)
+    in_stock: Mapped[int] = mapped_column(Integer, default=0)
+    out_of_stock: Mapped[int] = mapped_column(Integer, default=0)
+    cost: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    regular_price: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    sale_price: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+
+    def __repr__(self):
+        return f'<InventoryValuation (dimension={self.dimension}, key={self.key}, quantity={self.quantity})>'
+
+
+class InventoryValuationDelta(Base):
+    """_summary_
+        Difference of a book change to a group, insert only. Upserting the shared groups (one per condition and
+        stock location) from the triggers locked them until commit, in no global order, so orders could deadlock.
+    """
+    __tablename__ = 'inventory_valuation_deltas'
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    dimension: Mapped[str]
+    key: Mapped[str]
+    quantity: Mapped[int]
+    unique_product: Mapped[int]
+    in_stock: Mapped[int]
+    out_of_stock: Mapped[int]
+    cost: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    regular_price: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    sale_price: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+
+    def __repr__(self):
+        return f'<InventoryValuationDelta (dimension={self.dimension}, key={self.key}, quantity={self.quantity})>'
+
+
+# Adds (sign 1) or removes (sign -1) a book in the groups of its condition, stock location and tags,
+# or only in the group of only_tag. Takes the columns, a books row argument would keep books from being dropped
+add_inventory_valuation = DDL('''
+CREATE OR REPLACE FUNCTION add_inventory_valuation(
+    sign integer, b_id uuid, b_quantity integer, b_in_stock boolean, b_cost float8, b_regular_price float8,
+    b_sale_price float8, b_condition text, b_stock_location text, only_tag uuid DEFAULT NULL) RETURNS void AS $$
+BEGIN
+    INSERT INTO inventory_valuation_deltas (dimension, key, quantity, unique_product, in_stock, out_of_stock, cost,
+                                            regular_price, sale_price)
+    SELECT groups.dimension, groups.key, sign * b_quantity, sign, sign * b_in_stock::integer,
+           sign * (NOT b_in_stock)::integer, sign * b_cost::numeric * b_quantity,
+           sign * b_regular_price::numeric * b_quantity, sign * b_sale_price::numeric * b_quantity
+    FROM (SELECT 'condition', b_condition WHERE only_tag IS NULL
+          UNION ALL SELECT 'stock_location', b_stock_location WHERE only_tag IS NULL
+          UNION ALL SELECT 'tag', link.tag_id::text FROM book_tag_link link WHERE only_tag IS NULL AND link.book_id = b_id
+          UNION ALL SELECT 'tag', only_tag::text WHERE only_tag IS NOT NULL) AS groups (dimension, key);
+END
+$$ LANGUAGE plpgsql''')
+apply_book_valuation = DDL('''
+CREATE OR REPLACE FUNCTION apply_book_valuation() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.quantity, OLD.in_stock, OLD.cost, OLD.regular_price, OLD.sale_price, OLD.condition,
+                             OLD.stock_location)
+                        IS NOT DISTINCT FROM (NEW.quantity, NEW.in_stock, NEW.cost, NEW.regular_price,
+                                              NEW.sale_price, NEW.condition, NEW.stock_location) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM add_inventory_valuation(-1, OLD.id, OLD.quantity, OLD.in_stock, OLD.cost, OLD.regular_price,
+                                        OLD.sale_price, OLD.condition::text, OLD.stock_location::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM add_inventory_valuation(1, NEW.id, NEW.quantity, NEW.in_stock, NEW.cost, NEW.regular_price,
+                                        NEW.sale_price, NEW.condition::text, NEW.stock_location::text);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql''')
+book_valuation_trigger = DDL('''
+CREATE TRIGGER books_apply_valuation AFTER INSERT OR UPDATE OR DELETE ON books
+FOR EACH ROW EXECUTE FUNCTION apply_book_valuation()''')
+# A book is tagged after it is inserted and untagged before it is deleted (book_tag_link has no cascade)
+apply_tag_link_valuation = DDL('''
+CREATE OR REPLACE FUNCTION apply_tag_link_valuation() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM add_inventory_valuation(1, id, quantity, in_stock, cost, regular_price, sale_price, NULL, NULL,
+                                        NEW.tag_id) FROM books WHERE id = NEW.book_id;
+    ELSE
+        PERFORM add_inventory_valuation(-1, id, quantity, in_stock, cost, regular_price, sale_price, NULL, NULL,
+                                        OLD.tag_id) FROM books WHERE id = OLD.book_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql''')
+tag_link_valuation_trigger = DDL('''
+CREATE TRIGGER book_tag_link_apply_valuation AFTER INSERT OR DELETE ON book_tag_link
+FOR EACH ROW EXECUTE FUNCTION apply_tag_link_valuation()''')
+inventory_valuation_ddl = [add_inventory_valuation, apply_book_valuation, book_valuation_trigger,
+                           apply_tag_link_valuation, tag_link_valuation_trigger]
+# book_tag_link is created after books and tags
+for ddl in inventory_valuation_ddl:
+    event.listen(book_tag_link, 'after_create', ddl)
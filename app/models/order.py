@@ -1,7 +1,8 @@
 import uuid
+from datetime import datetime
 from typing import TYPE_CHECKING, List
 
-from sqlalchemy import Enum, Float, ForeignKey, Identity, Integer
+from sqlalchemy import DDL, BigInteger, DateTime, Enum, Float, ForeignKey, Identity, Integer, Numeric, event
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -107,3 +108,81 @@ class Order(TimestampMixin):
 
     def __repr__(self):
         return f'<Order (invoice={self.invoice})>'
+
+
+class OrderRollup(Base):
+    """_summary_
+        Totals of the orders created in an hour (UTC). A trigger on orders appends the change of every insert,
+        update and delete (ORM or bulk) to order_rollup_deltas in the same transaction, app.controller.order_rollup
+        folds them in here. Amounts are numeric so adding and subtracting float totals does not drift.
+    """
+    __tablename__ = 'order_rollups'
+
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    total_order: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    new_book_total: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    old_book_total: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    cost_of_good_new: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    cost_of_good_old: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    shipping_charge: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+    weight_charge: Mapped[float] = mapped_column(Numeric(asdecimal=False), default=0)
+
+    def __repr__(self):
+        return f'<OrderRollup (bucket={self.bucket}, total_order={self.total_order})>'
+
+
+class OrderRollupDelta(Base):
+    """_summary_
+        Change of an order to the totals of its hour, insert only. Upserting the row of the current hour in
+        order_rollups would make concurrent checkouts wait for each other until commit.
+    """
+    __tablename__ = 'order_rollup_deltas'
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    total_order: Mapped[int]
+    total: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    new_book_total: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    old_book_total: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    cost_of_good_new: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    cost_of_good_old: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    shipping_charge: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+    weight_charge: Mapped[float] = mapped_column(Numeric(asdecimal=False))
+
+    def __repr__(self):
+        return f'<OrderRollupDelta (bucket={self.bucket}, total_order={self.total_order})>'
+
+
+apply_order_rollup = DDL('''
+CREATE OR REPLACE FUNCTION apply_order_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.created_at, OLD.total, OLD.new_book_total, OLD.old_book_total, OLD.cost_of_good_new,
+                             OLD.cost_of_good_old, OLD.shipping_charge, OLD.weight_charge)
+                        IS NOT DISTINCT FROM (NEW.created_at, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                                              NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge,
+                                              NEW.weight_charge) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO order_rollup_deltas (bucket, total_order, total, new_book_total, old_book_total, cost_of_good_new,
+                                         cost_of_good_old, shipping_charge, weight_charge)
+        VALUES (date_trunc('hour', OLD.created_at, 'UTC'), -1, -OLD.total::numeric, -OLD.new_book_total::numeric,
+                -OLD.old_book_total::numeric, -OLD.cost_of_good_new::numeric, -OLD.cost_of_good_old::numeric,
+                -OLD.shipping_charge::numeric, -OLD.weight_charge::numeric);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO order_rollup_deltas (bucket, total_order, total, new_book_total, old_book_total, cost_of_good_new,
+                                         cost_of_good_old, shipping_charge, weight_charge)
+        VALUES (date_trunc('hour', NEW.created_at, 'UTC'), 1, NEW.total, NEW.new_book_total, NEW.old_book_total,
+                NEW.cost_of_good_new, NEW.cost_of_good_old, NEW.shipping_charge, NEW.weight_charge);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql''')
+order_rollup_trigger = DDL('''
+CREATE TRIGGER orders_apply_rollup AFTER INSERT OR UPDATE OR DELETE ON orders
+FOR EACH ROW EXECUTE FUNCTION apply_order_rollup()''')
+# The function is created with the orders table, order_rollup_deltas only has to exist when it runs
+event.listen(Order.__table__, 'after_create', apply_order_rollup)
+event.listen(Order.__table__, 'after_create', order_rollup_trigger)
@@ -1,8 +1,8 @@
 import uuid
 from typing import List
 
-from sqlalchemy import Boolean, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Computed, ForeignKey, Index, String
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.constant import Country
@@ -18,6 +18,8 @@ class Publisher(TimestampMixin):
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(String, index=True, unique=True)
     slug: Mapped[str] = mapped_column(String(100), index=True, unique=True)
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, Computed(
+        "to_tsvector('simple', name || ' ' || replace(slug, '-', ' '))", persisted=True), deferred=True)
 
     description: Mapped[str | None]
     is_islamic: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -43,3 +45,8 @@ class Publisher(TimestampMixin):
 
     def __repr__(self):
         return f'<Publisher (name={self.name}, slug={self.slug})>'
+
+
+Index('ix_publishers_search_vector', Publisher.search_vector, postgresql_using='gin')
+Index('ix_publishers_name_trgm', Publisher.name, postgresql_using='gin',
+      postgresql_ops={'name': 'gin_trgm_ops'})
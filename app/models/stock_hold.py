@@ -0,0 +1,27 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Identity, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class StockHold(Base):
+    """_summary_
+        Copies of a book held for an order while its payment is pending. books.held is the sum of the holds of a
+        book, app.controller.stock releases them on the payment callback, on failure or when they expire.
+    """
+    __tablename__ = 'stock_holds'
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    order_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), index=True)
+    book_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('books.id', ondelete='CASCADE'))
+    quantity: Mapped[int]
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f'<StockHold (order_id={self.order_id}, book_id={self.book_id}, quantity={self.quantity})>'
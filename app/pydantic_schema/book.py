@@ -1,9 +1,10 @@
 from pydantic import UUID4, ConfigDict, Field, field_validator, PositiveInt, ValidationInfo, NonNegativeFloat
 from typing import List
 
+from app.pydantic_schema.base import BaseModel
 from app.pydantic_schema.mixins import NameSlugMixin, NameSlugMixinOptional, IdTimestampMixin
 from app.pydantic_schema.common import AuthorOut, PublisherOut, CategoryOut, TagOut, ImageOut
-from app.constant import Cover, Language, Condition, StockLocation, Country
+from app.constant import Cover, Language, Condition, StockLocation, Country, BulkStatus
 
 
 example_book_base = {
@@ -188,3 +189,19 @@ class BookOutMinimal(BookBase, IdTimestampMixin):
 class BookOutAdmin(BookBaseAdmin, BookOut):
     model_config = ConfigDict(
         json_schema_extra={"example": example_book_out_admin})
+
+
+class BulkBookRow(BaseModel):
+    row: int  # 1 based line of the payload
+    sku: str | None = None
+    status: BulkStatus
+    id: UUID4 | None = None
+    detail: str | None = None
+
+
+class BulkBookResult(BaseModel):
+    total: int
+    created: int
+    elapsed: float  # in secs
+    rows_per_sec: float
+    rows: List[BulkBookRow]
@@ -1,9 +1,10 @@
-from pydantic import HttpUrl, UUID4
+from pydantic import UUID4, computed_field
 from typing import ClassVar
 
 from app.pydantic_schema.mixins import IdNameSlugMixin, IdTimestampMixin
 from app.pydantic_schema.base import BaseModel
 from app.constant import Condition, Cover
+from app.library.s3 import public_url
 
 
 class AuthorOut(IdNameSlugMixin):
@@ -54,8 +55,14 @@ class UserOut(BaseModel):
 
 class ImageOut(IdTimestampMixin):
     name: str
-    src: HttpUrl
     folder: str
+    variants: list[str] = []
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def src(self) -> str:
+        # Built when the response is serialized, cached per (name, folder)
+        return public_url(self.name, self.folder)
 
     _example: ClassVar = {
         'name': 'cover photo.jpg',
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import ConfigDict, NonNegativeFloat, NonNegativeInt
 
 from app.pydantic_schema.base import BaseModel
@@ -15,7 +17,7 @@ example_order_analysis = {
 }
 
 
-class OrderAnalysis(BaseModel):
+class OrderTotals(BaseModel):
     total_order: int
     order_value: NonNegativeFloat
     order_value_new_book: NonNegativeFloat
@@ -26,12 +28,20 @@ class OrderAnalysis(BaseModel):
     shipping_charge: NonNegativeFloat
     weight_charge: NonNegativeFloat
 
+
+class OrderPeriod(OrderTotals):
+    period: datetime
+    profit: float  # An hour or a day may sell below cost
+
+
+class OrderAnalysis(OrderTotals):
+    series: list[OrderPeriod] | None = None
+
     model_config = ConfigDict(
         json_schema_extra={"example": example_order_analysis})
 
 
-class ProductGroup(BaseModel):
-    tag: str
+class InventoryTotals(BaseModel):
     unique_product: NonNegativeInt
     in_stock: NonNegativeInt
     out_of_stock: NonNegativeInt
@@ -39,3 +49,23 @@ class ProductGroup(BaseModel):
     cost: NonNegativeInt
     regular_price: NonNegativeInt
     sale_price: NonNegativeInt
+
+
+class ProductGroup(InventoryTotals):
+    tag: str
+
+
+class InventoryGroup(InventoryTotals):
+    group: str  # Tag name, stock location or condition
+
+
+class InventoryDifference(BaseModel):
+    dimension: str
+    key: str
+    quantity: int
+    unique_product: int
+    in_stock: int
+    out_of_stock: int
+    cost: float
+    regular_price: float
+    sale_price: float
@@ -1,19 +1,17 @@
-from pydantic import ConfigDict, HttpUrl
+from pydantic import ConfigDict
 
+from app.pydantic_schema.common import ImageOut as ImageOutBase
 from app.pydantic_schema.mixins import IdTimestampMixin
 
 example_image_out = {
     **IdTimestampMixin._example,
-    'name': 'image.jpg',
-    'src': 'https://example.com/image.jpg',
-    'public_id': 'image-public-id',
-    'folder': 'book'
+    'name': 'image.webp',
+    'src': 'https://example.com/book/image.webp',
+    'folder': 'book',
+    'variants': ['image.avif', 'image@2x.webp', 'image@2x.avif']
 }
 
 
-class ImageOut(IdTimestampMixin):
-    name: str
-    src: HttpUrl
-    folder: str
+class ImageOut(ImageOutBase):
     model_config = ConfigDict(
         json_schema_extra={"example": example_image_out})  # type: ignore
@@ -1,24 +1,35 @@
 import pytest_asyncio
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from httpx import AsyncClient, ASGITransport
 from typing import AsyncGenerator
 
 
 from app.main import app
-from app.config.database import get_db, Base
+from app.config.database import get_db, get_read_db, Base, TrackedAsyncSession
+from app.config.redis import cache
 from app.config.settings import settings
+from app.library import query_stats
+
+# Routes exceeding their query_budget fail the test
+settings.QUERY_BUDGET_STRICT = True
 
 
 @pytest_asyncio.fixture(name="session")
 async def session_fixture():
     engine = create_async_engine(settings.TEST_DATABASE_URL)
+    query_stats.instrument(engine.sync_engine)
     session_factory = async_sessionmaker(
-        engine, autoflush=False, expire_on_commit=False)
+        engine, class_=TrackedAsyncSession, autoflush=False, expire_on_commit=False)
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
+    # Dropped tables are not purged from the response cache
+    async for key in cache.scan_iter('response*'):
+        await cache.delete(key)
+
     async with session_factory() as session:
         yield session
 
@@ -28,11 +39,26 @@ async def session_fixture():
     await engine.dispose()
 
 
+@pytest_asyncio.fixture(name="queries")
+async def queries_fixture(session: AsyncSession) -> AsyncGenerator[list[str], None]:
+    # Statements sent by the session, clear it before the code under test
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.bind.sync_engine  # type: ignore
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
 @pytest_asyncio.fixture(name="client")
 async def client_fixture(session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
 
     async with ASGITransport(app=app) as transport:  # type: ignore
         async with AsyncClient(transport=transport, base_url=settings.BASE_URL) as client:
             app.dependency_overrides[get_db] = lambda: session
+            app.dependency_overrides[get_read_db] = lambda: session
             yield client
             app.dependency_overrides.clear()
@@ -1,10 +1,18 @@
+import json
+import uuid
 from typing import Any, Callable
 from unittest.mock import MagicMock
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+import app.controller.stock as stock_service
+from app.config.database import Writes, commit_listeners
+from app.controller import image_deletion, response_cache
+from app.pydantic_schema.book import BookOut
+
 pytestmark = pytest.mark.asyncio
 
 simple_book = {
@@ -27,6 +35,49 @@ async def test_get_book_by_id(client: AsyncClient, book_in_db: dict):
     assert response.json().items() <= book_in_db.items()
 
 
+async def test_get_book_by_id_cached_until_update(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
+    response = await client.get(f"/book/id/{book_in_db['id']}")
+    assert response.headers['X-Cache'] == 'MISS'
+    cached = await client.get(f"/book/id/{book_in_db['id']}")
+    assert cached.headers['X-Cache'] == 'HIT'
+    assert cached.json() == response.json()
+
+    await client.patch(f"/book/{book_in_db['id']}", json={'name': 'Himu Samagra'}, headers=admin_auth_headers)
+    response = await client.get(f"/book/id/{book_in_db['id']}")
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.json()['name'] == 'Himu Samagra'
+
+
+async def test_response_read_before_write_not_cached(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
+    key = 'response:/book/id/{}:stale'.format(book_in_db['id'])
+    cached, generations = await response_cache.get(key)
+    assert cached is None and generations is not None
+
+    # The book is updated and purged between the read and the store of a request
+    await client.patch(f"/book/{book_in_db['id']}", json={'name': 'Himu Samagra'}, headers=admin_auth_headers)
+    await response_cache.store(key, [], list[BookOut], {'books:{}'.format(book_in_db['id'])}, generations)
+    assert (await response_cache.get(key))[0] is None
+
+    _, generations = await response_cache.get(key)
+    await response_cache.store(key, [], list[BookOut], {'books:{}'.format(book_in_db['id'])}, generations)
+    assert (await response_cache.get(key))[0] is not None
+
+
+async def test_cached_books_kept_by_stock_holds(client: AsyncClient, book_in_db: dict, session: AsyncSession):
+    paths = [f"/book/id/{book_in_db['id']}", "/book/all"]
+    for path in paths:
+        assert (await client.get(path)).headers['X-Cache'] == 'MISS'
+
+    # books.held is not in any response, holding and releasing stock keeps the cached entries
+    order_id = uuid.uuid4()
+    await stock_service.hold(order_id, {uuid.UUID(book_in_db['id']): 2}, session)
+    await session.commit()
+    assert await stock_service.release(order_id, session) == 2
+    await session.commit()
+    for path in paths:
+        assert (await client.get(path)).headers['X-Cache'] == 'HIT'
+
+
 async def test_get_book_by_public_id(client: AsyncClient, book_in_db: dict):
     response = await client.get(f"/book/public_id/{book_in_db['public_id']}")
     assert response.status_code == status.HTTP_200_OK
@@ -54,6 +105,64 @@ async def test_get_all_books(client: AsyncClient, book_in_db: dict[str, Any], qu
     assert response.headers.get("x-total-count") == str(expected_length)
 
 
+async def test_get_all_books_by_cursor(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
+    for i in range(2):
+        response = await client.post("/book", json={
+            **simple_book,
+            "sku": f"99-100{i}",
+            "name": f"Cursor Book {i}",
+            "slug": f"cursor-book-{i}",
+        }, headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_201_CREATED
+
+    names, cursor = [], ''
+    while cursor is not None:
+        response = await client.get("/book/all", params={"per_page": 2, "order_by": "-name", "cursor": cursor})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers.get("x-total-count") == "3"
+        names.extend(book["name"] for book in response.json())
+        cursor = response.headers.get("x-next-cursor")
+
+    assert names == sorted([book_in_db["name"], "Cursor Book 0", "Cursor Book 1"], reverse=True)
+
+
+async def test_get_all_books_projection(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict,
+                                        img_uploader: Callable, mock_upload_file: MagicMock, mock_signed_url: MagicMock):
+    await img_uploader("/image/admin?book_id={}".format(book_in_db['id']), admin_auth_headers, mock_upload_file, mock_signed_url)
+    book = (await client.get(f"/book/id/{book_in_db['id']}")).json()
+
+    # The list is built from json aggregates, the single book from ORM entities
+    response = await client.get("/book/all", params={"cursor": ""})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [book]
+
+
+async def test_get_all_books_by_invalid_cursor(client: AsyncClient, book_in_db: dict):
+    response = await client.get("/book/all", params={"order_by": "name", "cursor": "invalid"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_get_all_books_by_admin_count_after_write(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
+    written_rows = []
+
+    async def listener(writes: Writes):
+        written_rows.extend(writes.rows)
+
+    response = await client.get("/book/all/admin", headers=admin_auth_headers)
+    assert response.headers.get("x-total-count") == "1"
+
+    commit_listeners.append(listener)
+    try:
+        response = await client.delete(f"/book/{book_in_db['id']}", headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+    finally:
+        commit_listeners.remove(listener)
+    assert 'books:{}'.format(book_in_db['id']) in written_rows
+
+    response = await client.get("/book/all/admin", headers=admin_auth_headers)
+    assert response.headers.get("x-total-count") == "0"
+
+
 async def test_create_book(client: AsyncClient, author_in_db: dict, category_in_db: dict, publisher_in_db: dict, admin_auth_headers: dict):
     payload = {
         **simple_book,
@@ -72,6 +181,45 @@ async def test_create_book(client: AsyncClient, author_in_db: dict, category_in_
     assert response.json()["publisher"] == id_name_slug(publisher_in_db)
 
 
+async def test_search_books_by_author_and_publisher(client: AsyncClient, author_in_db: dict, publisher_in_db: dict, admin_auth_headers: dict):
+    response = await client.post("/book", json={
+        **simple_book,
+        "authors": [author_in_db['id']],
+        "publisher_id": publisher_in_db["id"]
+    }, headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # Romanized spellings of the Bangla author name match through the transliterated and phonetic keys
+    for q in [author_in_db['name'], publisher_in_db['name'], simple_book['name'][:6], 'humayun', 'humaiun ahmed']:
+        response = await client.get("/book/all", params={"q": q})
+        assert len(response.json()) == 1
+        assert response.headers.get("x-total-count") == "1"
+
+    response = await client.get("/book/all", params={"q": "no such book"})
+    assert response.json() == []
+
+
+async def test_search_books_after_author_rename(client: AsyncClient, author_in_db: dict, publisher_in_db: dict, admin_auth_headers: dict):
+    response = await client.post("/book", json={
+        **simple_book,
+        "authors": [author_in_db['id']],
+        "publisher_id": publisher_in_db["id"]
+    }, headers=admin_auth_headers)
+    book_id = response.json()['id']
+
+    response = await client.patch(f"/author/{author_in_db['id']}", json={"name": "মুহম্মদ জাফর ইকবাল"},
+                                  headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    for q, expected in [('jafor iqbal', 1), ('humayun', 0)]:
+        response = await client.get("/book/all", params={"q": q})
+        assert response.headers.get("x-total-count") == str(expected)
+
+    response = await client.patch(f"/book/{book_id}", json={"publisher_id": None}, headers=admin_auth_headers)
+    assert response.json()['publisher'] is None
+    response = await client.get("/book/all", params={"q": "rupa"})
+    assert response.json() == []
+
+
 async def test_create_book_bulk(client: AsyncClient, author_in_db: dict, category_in_db: dict, publisher_in_db: dict, admin_auth_headers: dict):
     payload = [
         {
@@ -86,6 +234,35 @@ async def test_create_book_bulk(client: AsyncClient, author_in_db: dict, categor
     assert response.json()[0].items() >= simple_book.items()
 
 
+async def test_copy_book_bulk(client: AsyncClient, author_in_db: dict, category_in_db: dict, publisher_in_db: dict, admin_auth_headers: dict):
+    book = {
+        **simple_book,
+        "authors": [author_in_db['id']],
+        "categories": [category_in_db['id']],
+        "publisher_id": publisher_in_db["id"]
+    }
+    lines = [
+        book,
+        book,
+        {**book, "sku": "missing-author", "authors": [str(uuid.uuid4())]},
+        {**book, "sku": "bad-price", "sale_price": book["regular_price"] + 1},
+    ]
+    payload = '\n'.join(json.dumps(line) for line in lines)
+    response = await client.post("/book/bulk/copy", content=payload,
+                                 headers={**admin_auth_headers, 'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == status.HTTP_201_CREATED
+    result = response.json()
+    assert result['total'] == 4 and result['created'] == 1
+    assert [row['status'] for row in result['rows']] == ['created', 'duplicate', 'not_found', 'invalid']
+
+    response = await client.get(f"/book/id/{result['rows'][0]['id']}")
+    assert response.json().items() >= simple_book.items()
+    assert response.json()['authors'][0]['id'] == author_in_db['id']
+
+    response = await client.get("/book/all", params={'q': 'humayun'})
+    assert len(response.json()) == 1
+
+
 async def test_update_book(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
     payload = {
         **book_in_db,
@@ -100,7 +277,8 @@ async def test_update_book(client: AsyncClient, book_in_db: dict, admin_auth_hea
 
 
 async def test_upload_book_images(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict,
-                                  img_uploader: Callable, mock_upload_file: MagicMock, mock_delete_file: MagicMock, mock_signed_url: MagicMock):
+                                  img_uploader: Callable, mock_upload_file: MagicMock, mock_delete_files: MagicMock, mock_signed_url: MagicMock,
+                                  session: AsyncSession):
     await img_uploader("/image/admin?book_id={}".format(book_in_db['id']), admin_auth_headers, mock_upload_file, mock_signed_url)
     res = await client.get(f"/book/id/{book_in_db['id']}")
     assert res.status_code == status.HTTP_200_OK
@@ -109,7 +287,8 @@ async def test_upload_book_images(client: AsyncClient, book_in_db: dict, admin_a
     # Test image deletion on book deletion
     response = await client.delete(f"/book/{book_in_db['id']}", headers=admin_auth_headers)
     assert response.status_code == status.HTTP_204_NO_CONTENT
-    mock_delete_file.assert_called_once()
+    assert await image_deletion.drain(session) == 1
+    mock_delete_files.assert_called_once()
 
 
 async def test_delete_book(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict):
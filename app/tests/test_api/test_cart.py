@@ -1,7 +1,14 @@
+from uuid import UUID, uuid4
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+import app.controller.stock as stock_service
+from app.models import Book, StockHold
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -27,6 +34,27 @@ async def test_apply_coupon(client: AsyncClient, book_in_db: dict, coupon_in_db:
         2 * coupon_in_db['discount_old'] / 100
 
 
+async def test_apply_coupon_with_rules(client: AsyncClient, book_payload: dict, author_in_db: dict,
+                                      coupon_payload: dict, admin_auth_headers: dict):
+    books = []
+    for i, authors in enumerate([[author_in_db['id']], [author_in_db['id']], []]):
+        response = await client.post("/book", json={**book_payload, "sku": f"rule-{i}", "slug": f"rule-{i}",
+                                                    "authors": authors}, headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        books.append(response.json())
+    response = await client.post("/coupon", json={**coupon_payload, "include_conditions": ["old-like-new"],
+                                                  "exclude_authors": [author_in_db['id']]}, headers=admin_auth_headers)
+    coupon = response.json()
+
+    # Both books of the excluded author are left out, not only the first one
+    response = await client.post("/cart/apply-coupon", json={
+        'coupon_code': coupon["code"],
+        'order_items': [{"book_id": book["id"], "quantity": 2} for book in books]
+    })
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['discount'] == round(books[2]['sale_price'] * 2 * coupon['discount_old'] / 100)
+
+
 async def test_verify_stock(client: AsyncClient, book_in_db: dict):
     response = await client.post("/cart/verify-stock", json={
         'order_items': [
@@ -37,4 +65,31 @@ async def test_verify_stock(client: AsyncClient, book_in_db: dict):
         ]
     })
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == {"status": "ok"}
\ No newline at end of file
+    assert response.json() == {"status": "ok"}
+
+
+async def test_verify_stock_with_holds(client: AsyncClient, book_in_db: dict, session: AsyncSession):
+    book_id = UUID(book_in_db['id'])
+    await stock_service.hold(uuid4(), {book_id: 8}, session)
+    expired = uuid4()
+    await stock_service.hold(expired, {book_id: 2}, session)
+    await session.commit()
+
+    # Copies held for pending payments are not available to other carts
+    response = await client.post("/cart/verify-stock", json={
+        'order_items': [{"book_id": book_in_db["id"], "quantity": 1}]
+    })
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "has only 0 in stock" in response.json()['detail']['message']
+
+    await session.execute(update(StockHold).where(StockHold.order_id == expired).values(
+        expires_at=StockHold.created_at))
+    assert await stock_service.release_expired(session) == 2
+    await session.commit()
+    book = await session.get(Book, book_id, populate_existing=True)
+    assert (book.quantity, book.held) == (book_in_db['quantity'], 8)
+
+    response = await client.post("/cart/verify-stock", json={
+        'order_items': [{"book_id": book_in_db["id"], "quantity": 2}]
+    })
+    assert response.status_code == status.HTTP_200_OK
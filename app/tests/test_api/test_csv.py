@@ -1,10 +1,19 @@
 import io
+from typing import Any
+
+import httpx
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 import pandas as pd
 from unittest.mock import MagicMock
 
+from app.config.settings import settings
+from app.controller import image_deletion
+from app.controller.image_import import import_images
+
 pytestmark = pytest.mark.asyncio
 
 data = [
@@ -85,9 +94,9 @@ async def test_export_books(client: AsyncClient, book_in_db: dict, admin_auth_he
     assert len(response.content.splitlines()) == 2
 
 
-async def test_import_books_by_csv(mock_upload_file: MagicMock, mock_delete_file: MagicMock, send_email: MagicMock, client: AsyncClient, admin_in_db_with_token: dict):
+async def test_import_books_by_csv(mock_upload_file: MagicMock, mock_delete_files: MagicMock, send_email: MagicMock, client: AsyncClient,
+                                   admin_in_db_with_token: dict, session: AsyncSession):
     mock_upload_file.return_value = 'key'
-    mock_delete_file.return_value = True
     send_email.return_value = None
     headers = {
         'Authorization': "Bearer {}".format(admin_in_db_with_token['token'])
@@ -126,4 +135,81 @@ async def test_import_books_by_csv(mock_upload_file: MagicMock, mock_delete_file
     # Test delete books
     response = await client.request("DELETE", "/book/bulk/csv", files=files, headers=headers)
     assert response.status_code == status.HTTP_204_NO_CONTENT
-    mock_delete_file.assert_called_once()
\ No newline at end of file
+    assert await image_deletion.drain(session) >= 1
+    mock_delete_files.assert_called_once()
+
+async def test_import_books_by_csv_upserts(mock_upload_file: MagicMock, client: AsyncClient, admin_auth_headers: dict):
+    mock_upload_file.return_value = 'key'
+    rows = [{key: val for key, val in book.items() if key != 'images'} for book in data]
+
+    async def import_csv(rows: list[dict]) -> pd.DataFrame:
+        files = [('file', ('test_books.csv', io.BytesIO(pd.DataFrame(rows).to_csv(index=False).encode("utf-8")), 'text/csv'))]
+        response = await client.post("/book/bot-import/csv", files=files, headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        return pd.read_csv(io.StringIO(response.text))
+
+    result = await import_csv(rows)
+    assert result['status'].tolist() == ['successfully inserted'] * len(rows)
+
+    rows = [{'sku': rows[1]['sku'], 'quantity': 5, 'authors': 'Motin'}]
+    result = await import_csv(rows)
+    assert result['status'].tolist() == ['successfully updated']
+
+    response = await client.get("/book/all/admin", params={'sku': rows[0]['sku']}, headers=admin_auth_headers)
+    book = response.json()[0]
+    assert book['quantity'] == 5
+    assert book['name'] == data[1]['name']
+    assert [author['name'] for author in book['authors']] == ['Motin']
+
+
+async def test_import_books_by_csv_row_rejected_by_database(client: AsyncClient, admin_auth_headers: dict, session: AsyncSession):
+    # A rule the schemas don't check, the database rejects the row only when the chunk is written
+    await session.execute(text('ALTER TABLE books ADD CONSTRAINT quantity_limit CHECK (quantity < 100)'))
+    await session.commit()
+    rows = [{key: val for key, val in book.items() if key != 'images'} for book in data]
+    rows[2]['quantity'] = 500
+
+    files = [('file', ('test_books.csv', io.BytesIO(pd.DataFrame(rows).to_csv(index=False).encode("utf-8")), 'text/csv'))]
+    response = await client.post("/book/bot-import/csv", files=files, headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    result = pd.read_csv(io.StringIO(response.text))
+    assert result['status'].tolist()[:2] + result['status'].tolist()[3:] == ['successfully inserted'] * 3
+    assert 'quantity_limit' in result['status'][2]
+
+    response = await client.get("/book/all/admin", params={'sku': rows[1]['sku']}, headers=admin_auth_headers)
+    assert {author['name'] for author in response.json()[0]['authors']} == {'আতিউর রহমান', 'Motin'}
+
+
+async def test_import_images(s3_bucket: Any):
+    s3_bucket.put_object(Bucket=settings.BUCKET_NAME, Key='new_book/old.png', Body=b'old')
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        if request.url.path == '/missing.png':
+            return httpx.Response(404)
+        return httpx.Response(200, content=b'image')
+
+    images = {
+        '1': 'https://cdn.test/a.png|https://cdn.test/b.png',
+        '2': 'https://cdn.test/a.png',
+        '3': 'https://cdn.test/c.png|https://cdn.test/missing.png',
+        '4': 'https://cdn.test/old.png',
+        '5': None,
+    }
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+        new_images, errors = await import_images(images, {'old.png'}, http)
+
+    assert sorted(requested) == ['https://cdn.test/a.png', 'https://cdn.test/b.png',
+                                 'https://cdn.test/c.png', 'https://cdn.test/missing.png']
+    assert [image['name'] for image in new_images['1']] == ['a.png', 'b.png']
+    assert new_images['2'] == [] and new_images['4'] == [] and new_images['5'] == []
+    assert list(errors) == ['3']
+
+    # c.png was uploaded for the failed row only and deleted again, old.png was not uploaded
+    versions = s3_bucket.list_object_versions(Bucket=settings.BUCKET_NAME)
+    uploaded = sorted(version['Key'] for version in versions['Versions'])
+    assert uploaded == ['new_book/a.png', 'new_book/b.png', 'new_book/c.png', 'new_book/old.png']
+    assert [marker['Key'] for marker in versions.get('DeleteMarkers', [])] == ['new_book/c.png']
+    objects = s3_bucket.list_objects_v2(Bucket=settings.BUCKET_NAME)['Contents']
+    assert sorted(obj['Key'] for obj in objects) == ['new_book/a.png', 'new_book/b.png', 'new_book/old.png']
@@ -1,7 +1,20 @@
+import asyncio
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from starlette import status
 
+import app.api.book as book_api
+from app.config import database
+from app.controller import inventory_valuation, order_rollup
+from app.library import query_stats
+from app.config.settings import settings
+from app.main import app
+from app.models import Book, InventoryValuationDelta, OrderRollupDelta
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -10,6 +23,186 @@ async def test_order_analysis(client: AsyncClient, admin_auth_headers: dict[str,
     assert response.status_code == status.HTTP_200_OK
 
 
+async def test_order_analysis_from_rollups(client: AsyncClient, order_in_db: dict, admin_auth_headers: dict[str, str],
+                                           session: AsyncSession):
+    created_at = datetime.fromisoformat(order_in_db['created_at'])
+    expected = {
+        'total_order': 1,
+        'order_value': order_in_db['total'],
+        'shipping_charge': order_in_db['shipping_charge'],
+        'weight_charge': order_in_db['weight_charge'],
+    }
+    # Whole hours of the rollups, partial hours of the orders and a range within an hour
+    for params in [{},
+                   {'from_date': (created_at - timedelta(days=2, minutes=30)).isoformat()},
+                   {'to_date': (created_at + timedelta(minutes=90)).isoformat()},
+                   {'from_date': (created_at - timedelta(seconds=1)).isoformat(),
+                    'to_date': (created_at + timedelta(seconds=1)).isoformat()}]:
+        response = await client.get("/dashboard/order", params=params, headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json().items() >= expected.items()
+        assert 'series' not in response.json()
+
+    # Folding moves the deltas of the trigger into the hour, the totals stay the same
+    assert await order_rollup.fold(session) == 1
+    assert await session.scalar(select(func.count()).select_from(OrderRollupDelta)) == 0
+    response = await client.get("/dashboard/order", headers=admin_auth_headers)
+    assert response.json().items() >= expected.items()
+
+    response = await client.get("/dashboard/order", params={'granularity': 'day'}, headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()['series']) == 1
+    assert response.json()['series'][0].items() >= expected.items()
+
+    response = await client.get("/dashboard/order", params={'to_date': (created_at - timedelta(hours=2)).isoformat()},
+                                headers=admin_auth_headers)
+    assert response.json()['total_order'] == 0
+
+    response = await client.delete(f"/order/{order_in_db['id']}", headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get("/dashboard/order", params={'granularity': 'hour'}, headers=admin_auth_headers)
+    assert response.json()['total_order'] == 0 and response.json()['series'] == []
+
+
 async def test_inventory_analysis(client: AsyncClient, admin_auth_headers: dict[str, str]):
     response = await client.get("/dashboard/inventory", headers=admin_auth_headers)
     assert response.status_code == status.HTTP_200_OK
+
+
+async def test_inventory_valuation(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict[str, str],
+                                   session: AsyncSession):
+    response = await client.post("/tag", json={"name": "tag1", "slug": "tag1"}, headers=admin_auth_headers)
+    tag = response.json()
+    response = await client.patch(f"/book/{book_in_db['id']}", json={"tags": [tag['id']], "quantity": 4, "cost": 100},
+                                  headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    expected = {'unique_product': 1, 'quantity': 4, 'in_stock': 1, 'cost': 400,
+                'regular_price': 4 * book_in_db['regular_price'], 'sale_price': 4 * book_in_db['sale_price']}
+    response = await client.get("/dashboard/inventory", headers=admin_auth_headers)
+    assert response.json() == [{**expected, 'tag': 'tag1', 'out_of_stock': 0}]
+    for dimension, group in [('condition', 'old-like-new'), ('stock_location', 'mirpur-11'), ('tag', 'tag1')]:
+        response = await client.get(f"/dashboard/inventory/{dimension}", headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0].items() >= {**expected, 'group': group}.items()
+
+    response = await client.post("/dashboard/inventory/reconcile", headers=admin_auth_headers)
+    assert response.json() == []
+
+    # A change the triggers did not see is found and repaired
+    await session.execute(text("ALTER TABLE books DISABLE TRIGGER books_apply_valuation"))
+    await session.execute(update(Book).values(quantity=10))
+    await session.execute(text("ALTER TABLE books ENABLE TRIGGER books_apply_valuation"))
+    await session.commit()
+    response = await client.post("/dashboard/inventory/reconcile", headers=admin_auth_headers)
+    assert len(response.json()) == 3 and all(group['quantity'] == 6 for group in response.json())
+    response = await client.get("/dashboard/inventory", headers=admin_auth_headers)
+    assert response.json()[0]['quantity'] == 10
+
+    response = await client.delete(f"/book/{book_in_db['id']}", headers=admin_auth_headers)
+    response = await client.get("/dashboard/inventory/condition", headers=admin_auth_headers)
+    assert response.json() == []
+    response = await client.post("/dashboard/inventory/reconcile", headers=admin_auth_headers)
+    assert response.json() == []
+
+
+async def test_concurrent_stock_changes_of_one_location(client: AsyncClient, book_payload: dict,
+                                                        admin_auth_headers: dict[str, str], session: AsyncSession):
+    books = []
+    for i, condition in enumerate(['new', 'old-like-new', 'old-good-enough', 'old-readable']):
+        response = await client.post("/book", json={**book_payload, 'sku': f'99-543{i}', 'slug': f'the-alchemist-{i}',
+                                                    'condition': condition, 'is_used': condition != 'new'},
+                                     headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        books.append(response.json()['id'])
+
+    # Every change runs in its own session and transaction like concurrent orders, each takes two books of
+    # different conditions in the same stock location, half of them in the opposite order
+    session_factory = async_sessionmaker(session.bind, class_=database.TrackedAsyncSession,
+                                         autoflush=False, expire_on_commit=False)
+
+    async def change_stock(i: int):
+        pair = [books[i % 4], books[(i + 1) % 4]]
+        async with session_factory() as db:
+            for book_id in (pair if i % 2 else reversed(pair)):
+                await db.execute(update(Book).where(Book.id == book_id).values(quantity=Book.quantity + 1))
+                await asyncio.sleep(0)
+            await db.commit()
+
+    await asyncio.gather(*[change_stock(i) for i in range(40)])
+
+    expected = {'unique_product': 4, 'quantity': 4 * book_payload['quantity'] + 80, 'in_stock': 4, 'out_of_stock': 0}
+    response = await client.get("/dashboard/inventory/stock_location", headers=admin_auth_headers)
+    assert response.json()[0].items() >= {**expected, 'group': 'mirpur-11'}.items()
+
+    # Folding moves the deltas into the groups, the totals stay the same
+    assert await inventory_valuation.fold(session) == 5
+    assert await session.scalar(select(func.count()).select_from(InventoryValuationDelta)) == 0
+    response = await client.get("/dashboard/inventory/stock_location", headers=admin_auth_headers)
+    assert response.json()[0].items() >= {**expected, 'group': 'mirpur-11'}.items()
+    response = await client.get("/dashboard/inventory/condition", headers=admin_auth_headers)
+    assert sorted(group['quantity'] for group in response.json()) == [book_payload['quantity'] + 20] * 4
+    assert await inventory_valuation.reconcile(session) == []
+
+
+async def test_db_pool_stats(client: AsyncClient, admin_auth_headers: dict[str, str]):
+    response = await client.get("/dashboard/db-pool", headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert {'pool_size', 'checked_out', 'overflow', 'checkouts'} <= response.json().keys()
+
+
+async def test_query_stats(client: AsyncClient, book_in_db: dict, admin_auth_headers: dict[str, str],
+                           monkeypatch: pytest.MonkeyPatch):
+    response = await client.get("/book/all")
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.get("/dashboard/query-stats", headers=admin_auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    stats = response.json()['routes']['GET /book/all']
+    assert stats['queries']['count'] >= 1
+    assert stats['queries']['sum'] >= 2  # Books and the count
+    assert stats['seconds']['sum'] >= stats['sql_seconds']['sum'] > 0
+
+    # A route over its budget fails the test
+    monkeypatch.setattr(book_api.get_all_books, 'query_budget', 0)
+    with pytest.raises(query_stats.QueryBudgetExceeded):
+        await client.get("/book/all", params={'page': 2})
+
+
+async def test_reads_routed_to_replica(client: AsyncClient, admin_auth_headers: dict[str, str], session: AsyncSession,
+                                       monkeypatch: pytest.MonkeyPatch):
+    # A second engine on the test database stands in for the replica
+    replica_engine = create_async_engine(settings.TEST_DATABASE_URL)
+    replica_statements = []
+    event.listen(replica_engine.sync_engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: replica_statements.append(statement))
+    monkeypatch.setattr(database, 'replica_engine', replica_engine)
+    monkeypatch.setattr(database.replica, 'lag', 0.0)
+    read_session_factory = async_sessionmaker(session.bind, class_=database.TrackedAsyncSession,
+                                              expire_on_commit=False, info={'replica': True})
+
+    async def get_read_db():
+        async with read_session_factory() as read_session:
+            yield read_session
+
+    app.dependency_overrides[database.get_read_db] = get_read_db
+    try:
+        response = await client.get("/dashboard/inventory", headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert replica_statements
+
+        # Lagging replica, reads fall back to the primary
+        replica_statements.clear()
+        monkeypatch.setattr(database.replica, 'lag', settings.REPLICA_MAX_LAG + 1)
+        response = await client.get("/dashboard/inventory", headers=admin_auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert not replica_statements
+
+        # A write keeps the rest of the session on the primary
+        monkeypatch.setattr(database.replica, 'lag', 0.0)
+        async with read_session_factory() as read_session:
+            assert read_session.sync_session.get_bind() is replica_engine.sync_engine
+            await read_session.execute(update(Book).values(quantity=0))
+            assert read_session.sync_session.get_bind() is session.bind.sync_engine  # type: ignore
+            await read_session.rollback()
+    finally:
+        await replica_engine.dispose()
@@ -1,8 +1,15 @@
+import io
+import os
+import re
+
 import pytest
 from httpx import AsyncClient
+from PIL import Image as PILImage
 from starlette import status
 from unittest.mock import MagicMock
 
+from app.library.img_resize import FORMATS, MAX_QUALITY, MIN_QUALITY, encode, fit_quality, optimize
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -32,3 +39,68 @@ async def test_create_image(mock_upload_file: MagicMock, client: AsyncClient, au
     assert response.json()[0].items() >= {'name': 'image.jpg'}.items()
     assert response.json()[0]['src'] is not None
     mock_upload_file.assert_called_once()
+
+
+async def test_create_image_failed_upload_deletes_variants(mock_upload_file: MagicMock, mock_delete_files: MagicMock,
+                                                          client: AsyncClient, author_in_db: dict,
+                                                          admin_auth_headers: dict):
+    # The main file fails, its other sizes and formats are uploaded
+    uploads = []
+
+    async def upload_file(content, filename: str, folder: str, client):
+        uploads.append('{}/{}'.format(folder, filename))
+        return uploads[-1] if len(uploads) > 1 else None
+    mock_upload_file.side_effect = upload_file
+
+    with open("dummy/test.jpg", "rb") as f:
+        response = await client.post("/image/admin", params={'author_id': author_in_db['id'], 'optimizer': True},
+                                     files=[("files", ("image.jpg", f, "image/jpeg"))], headers=admin_auth_headers)
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert len(uploads) > 1
+    mock_delete_files.assert_called_once_with(uploads[1:])
+
+
+def noise(size: tuple[int, int]) -> PILImage.Image:
+    # Random pixels, the encoded size goes down with the quality
+    return PILImage.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+
+
+async def test_fit_quality():
+    image = noise((200, 200))
+    blob, count = fit_quality(image, 'WEBP', 10 ** 9)
+    assert blob == encode(image, 'WEBP', MAX_QUALITY) and count <= 7
+
+    # Nothing fits, the lowest quality is returned
+    blob, count = fit_quality(image, 'WEBP', 0)
+    assert blob == encode(image, 'WEBP', MIN_QUALITY) and count <= 7
+
+    max_bytes = len(encode(image, 'WEBP', 60))
+    blob, _ = fit_quality(image, 'WEBP', max_bytes)
+    assert len(encode(image, 'WEBP', MIN_QUALITY)) < len(blob) <= max_bytes
+
+
+async def test_optimize():
+    buffer = io.BytesIO()
+    # A photo like image fits in max_kb, noise would not even at the lowest quality
+    PILImage.merge('RGB', [PILImage.radial_gradient('L'), PILImage.linear_gradient('L'), noise((256, 256)).getchannel(0)]
+                   ).resize((800, 1000)).save(buffer, format='PNG')
+
+    files = optimize(buffer.getvalue(), 'cover.png', (260, 372), 20)
+    stem = files[0][0].rsplit('.', 1)[0]
+    assert re.fullmatch(r'cover-[0-9a-f]{8}', stem)
+    assert [name for name, _ in files] == ['{}{}.{}'.format(stem, suffix, fmt.lower())
+                                           for suffix in ('', '@2x') for fmt in FORMATS]
+    for name, content in files:
+        scale = 2 if '@2x' in name else 1
+        with PILImage.open(io.BytesIO(content)) as image:
+            assert image.format == name.rsplit('.', 1)[1].upper()
+            assert image.width <= 260 * scale and image.height <= 372 * scale
+        assert len(content) <= 20 * 1024 * scale ** 2
+
+    # Same stem in another format gets other names, a small source has no @2x size
+    buffer = io.BytesIO()
+    noise((100, 100)).save(buffer, format='JPEG')
+    small = optimize(buffer.getvalue(), 'cover.jpg', (260, 372), 20)
+    assert len(small) == len(FORMATS)
+    assert not {name for name, _ in small} & {name for name, _ in files}
@@ -3,6 +3,9 @@ from httpx import AsyncClient
 from starlette import status
 from unittest.mock import MagicMock
 
+import app.controller.metrics as metrics_service
+from app.config.settings import settings
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -16,3 +19,38 @@ async def test_contact_us(client: AsyncClient, send_email: MagicMock):
     response = await client.post("/misc/contact-us", json=payload)
     assert response.status_code == status.HTTP_200_OK
     send_email.assert_called_once()
+
+
+async def test_metrics(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    response = await client.get("/")
+    assert response.status_code == status.HTTP_200_OK
+
+    # Closed without a token in the settings
+    response = await client.get("/metrics")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    monkeypatch.setattr(settings, 'METRICS_TOKEN', 'scrape-token')
+    response = await client.get("/metrics", headers={'Authorization': 'Bearer wrong-token'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = await client.get("/metrics", headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain')
+    body = response.text
+    worker = metrics_service.worker_key().split(':', 1)[1]
+    assert ('http_request_duration_seconds_bucket{{worker="{}",method="GET",route="/",status="200",le="+Inf"}}'
+            .format(worker)) in body
+    assert '# TYPE db_pool_connections gauge' in body
+    assert 'background_queue_depth{worker="",queue="image_deletions"} 0' in body
+
+
+async def test_metrics_merge_keeps_workers_apart():
+    counter = {'help': 'Events', 'type': 'counter', 'labels': ['event'], 'bounds': [], 'samples': [[['checkout'], 5]]}
+    merged = metrics_service.merge({'a:1': {'events_total': counter},
+                                    'a:2': {'events_total': {**counter, 'samples': [[['checkout'], 3]]}}})
+    body = metrics_service.render(merged)
+    assert 'events_total{worker="a:1",event="checkout"} 5' in body
+    assert 'events_total{worker="a:2",event="checkout"} 3' in body
+
+    # A recycled worker ends its series, the one of the other worker keeps counting up
+    merged = metrics_service.merge({'a:2': {'events_total': {**counter, 'samples': [[['checkout'], 4]]}}})
+    assert metrics_service.render(merged).splitlines()[2:] == ['events_total{worker="a:2",event="checkout"} 4']
@@ -1,8 +1,19 @@
+import asyncio
+import json
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from starlette import status
 from typing import Any
 from unittest.mock import MagicMock
+from uuid import UUID
+
+import app.controller.order as order_service
+from app.config.database import TrackedAsyncSession
+from app.controller.exception import BadRequestException
+from app.models import Book, Order, StockHold
+from app.pydantic_schema.order import CreateOrderAdmin
 
 pytestmark = pytest.mark.asyncio
 
@@ -107,6 +118,44 @@ async def test_place_order_by_customer(
     set_redis.assert_called_once()
 
 
+@pytest.mark.parametrize('initiated', [True, False])
+async def test_place_order_holds_stock(
+        bkash_grant_token: MagicMock,
+        bkash_init_payment: MagicMock,
+        set_redis: MagicMock,
+        client: AsyncClient,
+        book_in_db: dict,
+        payment_gateway_in_db: dict,
+        address_payload: dict[str, Any],
+        courier_in_db: dict,
+        session: AsyncSession,
+        initiated: bool):
+    bkash_grant_token.return_value = "token"
+    # bKash answers nothing when the payment can't be initiated
+    bkash_init_payment.return_value = {"bkashURL": "some_url", "paymentID": "TESTPAYMENTID"} if initiated else None
+
+    response = await client.post("/order/new", json={
+        "address": address_payload,
+        "courier_id": courier_in_db["id"],
+        "payment_method": "bkash",
+        "order_items": [{"book_id": book_in_db["id"], "quantity": 2}],
+        "is_full_paid": True
+    })
+    holds = (await session.scalars(select(StockHold))).all()
+    book = await session.get(Book, UUID(book_in_db['id']), populate_existing=True)
+    assert book.quantity == book_in_db['quantity']
+
+    if initiated:
+        assert response.status_code == status.HTTP_200_OK
+        order_id = json.loads(set_redis.call_args.args[2])['order_id']
+        assert [(str(hold.order_id), hold.quantity) for hold in holds] == [(order_id, 2)]
+        assert book.held == 2
+    else:
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+        assert holds == [] and book.held == 0
+        set_redis.assert_not_called()
+
+
 @pytest.mark.parametrize('quantity', [1, 2])
 async def test_create_order_by_admin(
         client: AsyncClient,
@@ -263,6 +312,52 @@ async def test_update_order_item_by_admin(client: AsyncClient, order_in_db: dict
     assert response.json()['total'] == book_in_db['sale_price'] * 2
 
 
+async def test_update_order_queries(order_in_db: dict, book_in_db: dict, session: AsyncSession, queries: list[str]):
+    # Loaded like a new request, not from the identity map of the fixtures
+    session.expunge_all()
+    queries.clear()
+    order = await order_service.update_order(UUID(order_in_db['id']), {
+        'order_status': {'status': 'processing', 'note': 'payment received'}}, session)
+    # Order with its status, status insert, then the order, items, authors, images and transactions of the response
+    assert len(queries) <= 8, queries
+    assert len(order.order_status) == 2
+
+    session.expunge_all()
+    queries.clear()
+    order = await order_service.update_order(UUID(order_in_db['id']), {
+        'order_items': [{'book_id': UUID(book_in_db['id']), 'quantity': 2}]}, session)
+    # Order with its items, stock, books with authors and images, item and order updates, then the rest
+    assert len(queries) <= 11, queries
+    assert order.order_items[0].quantity == 2
+
+    session.expunge_all()
+    queries.clear()
+    await order_service.update_order(UUID(order_in_db['id']), {'tracking_id': 'TRK-1'}, session)
+    assert len(queries) <= 8, queries
+
+
 async def test_delete_order(client: AsyncClient, order_in_db: dict, admin_auth_headers: dict):
     response = await client.delete("/order/{}".format(order_in_db['id']), headers=admin_auth_headers)
     assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+async def test_concurrent_orders_of_one_book(book_in_db: dict, session: AsyncSession):
+    # Every order runs in its own session and transaction like concurrent requests
+    session_factory = async_sessionmaker(session.bind, class_=TrackedAsyncSession,
+                                         autoflush=False, expire_on_commit=False)
+    payload = CreateOrderAdmin(order_items=[{'book_id': book_in_db['id'], 'quantity': 1}]).model_dump()  # type: ignore
+
+    async def place_order() -> bool:
+        async with session_factory() as db:
+            try:
+                await order_service.create_order(payload, db)
+                return True
+            except BadRequestException:
+                return False
+
+    placed = await asyncio.gather(*[place_order() for _ in range(200)])
+    assert sum(placed) == book_in_db['quantity']
+
+    book = await session.get(Book, book_in_db['id'], populate_existing=True)
+    assert book and book.quantity == 0 and not book.in_stock
+    assert await session.scalar(select(func.count(Order.id))) == book_in_db['quantity']
@@ -1,10 +1,15 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 from unittest.mock import MagicMock
 import json
 import uuid
 
+import app.controller.stock as stock_service
+from app.models import Book, StockHold
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -168,3 +173,53 @@ async def test_pay_with_bkash_callback_failed_to_execute_payment(
     assert res.status_code == status.HTTP_307_TEMPORARY_REDIRECT
     assert '/checkout/failed' in res.headers['location']
     send_email.assert_called()
+
+
+@pytest.mark.parametrize('callback_status, status_message', [('failed', 'Successful'), ('success', 'Failed')])
+async def test_pay_with_bkash_failure_releases_hold(
+    delete_redis: MagicMock,
+    get_redis: MagicMock,
+    bkash_grant_token: MagicMock,
+    bkash_exec_payment: MagicMock,
+    send_email: MagicMock,
+    client: AsyncClient,
+    payment_gateway_in_db: dict,
+    address_payload: dict,
+    courier_in_db: dict,
+    book_in_db: dict,
+    session: AsyncSession,
+    callback_status: str,
+    status_message: str
+):
+    # The hold POST /order/new made before redirecting to bKash
+    order_id = uuid.uuid4()
+    await stock_service.hold(order_id, {uuid.UUID(book_in_db["id"]): 3}, session)
+    await session.commit()
+
+    get_redis.return_value = json.dumps({
+        "order_id": str(order_id),
+        "address": address_payload,
+        "courier_id": courier_in_db["id"],
+        "payment_method": "bkash",
+        "order_items": [{"book_id": book_in_db["id"], "quantity": 3}],
+        "is_full_paid": True
+    })
+    bkash_grant_token.return_value = {'id_token': 'fake-token'}
+    bkash_exec_payment.return_value = {
+        "customerMsisdn": "01770618575",
+        "trxID": "6H7801QFYM",
+        "amount": "15",
+        "merchantInvoiceNumber": str(order_id),
+        "statusMessage": status_message,
+    }
+    res = await client.get("/payment/bkash/callback", params={
+        'paymentID': "TESTPAYMENTID",
+        'status': callback_status,
+        'signature': "some_signature"
+    })
+    assert '/checkout/failed' in res.headers['location']
+
+    # The copies are available again without waiting for the hold to expire
+    assert (await session.scalars(select(StockHold))).all() == []
+    book = await session.get(Book, uuid.UUID(book_in_db["id"]), populate_existing=True)
+    assert (book.quantity, book.held) == (book_in_db["quantity"], 0)
@@ -1,9 +1,12 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 from unittest.mock import MagicMock
 from typing import Any
 
+from app.controller import image_deletion
+
 pytestmark = pytest.mark.asyncio
 
 simple_review = {
@@ -81,17 +84,18 @@ async def test_approve_review(client: AsyncClient, review_in_db: dict, admin_acc
     assert response.json()['is_approved'] is True
 
 
-async def test_delete_review(mock_delete_file: MagicMock, client: AsyncClient, review_in_db: dict[str, Any]):
-    mock_delete_file.return_value = True
+async def test_delete_review(mock_delete_files: MagicMock, client: AsyncClient, review_in_db: dict[str, Any], session: AsyncSession):
     response = await client.delete(f"/review/{review_in_db['id']}",
                                    headers=review_in_db['headers'])
     assert response.status_code == status.HTTP_204_NO_CONTENT
-    mock_delete_file.assert_called_once()
+    assert await image_deletion.drain(session) >= 1  # Every size and format of the image
+    mock_delete_files.assert_called_once()
 
 
-async def test_delete_review_by_admin(mock_delete_file, client: AsyncClient, review_in_db: dict, admin_access_token: str):
-    mock_delete_file.return_value = True
+async def test_delete_review_by_admin(mock_delete_files: MagicMock, client: AsyncClient, review_in_db: dict, admin_access_token: str,
+                                      session: AsyncSession):
     response = await client.delete(f"/review/{review_in_db['id']}",
                                    headers={"Authorization": f"Bearer {admin_access_token}"})
     assert response.status_code == status.HTTP_204_NO_CONTENT
-    mock_delete_file.assert_called_once()
+    assert await image_deletion.drain(session) >= 1  # Every size and format of the image
+    mock_delete_files.assert_called_once()